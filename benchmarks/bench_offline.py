@@ -0,0 +1,173 @@
+"""
+End-to-end throughput without touching Spotify or YouTube.
+
+  python benchmarks/bench_offline.py [--sizes 10 1000 10000] [--jobs 8] [--via-csv]
+                                     [--spotify-latency 0.02] [--search-latency 0.05]
+                                     [--download-latency 0.1] [--bandwidth 10e6] [--audio-seconds 5]
+                                     [--max-rate 5M] [--adaptive] [--throttle-rate 0.05] [--throttle-above 4]
+
+A local fake Spotify Web API (benchmarks/fake_services.py) serves synthetic playlists and a
+fake yt-dlp serves generated MP3 / WAV files with the given latency and bandwidth (bytes/s),
+failing a --throttle-rate share of downloads, and any download beyond --throttle-above running at
+once, with HTTP 429 to exercise the download scheduler.
+Each size runs in its own process, so peak RSS is per run. Reported per size: tracks/sec,
+per-stage latency percentiles (time spent inside each pipeline stage) and peak RSS.
+
+The default path is what the CLI does: fetch_tracklists(stream=True) -> convert_tracklists_to_media.
+--via-csv instead goes convert_from_spotify_url -> write_tracklist_csv -> convert_csv_to_media.
+Tagging and cover embedding are real, so the tag writer and cover cache are part of the numbers.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from fake_services import FakeSpotify, fake_ydl_factory
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None  # windows
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def percentile(samples, q):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(round(q / 100 * (len(samples) - 1))))]
+
+
+def run_once(args):
+    # one size, in this process; prints a single json line
+    import contextlib
+
+    from spotify2media.config import SpotifyApiSettings
+    from spotify2media.csv_io import write_tracklist_csv
+    from spotify2media.scheduler import parse_rate
+    from spotify2media.spotify_client import convert_from_spotify_url, fetch_tracklists
+    from spotify2media.youtube_handler import convert_csv_to_media, convert_tracklists_to_media
+
+    server = FakeSpotify(latency=args.spotify_latency).start()
+    api = SpotifyApiSettings(api_url=f"{server.url}/v1", token_url=f"{server.url}/token",
+                             requests_per_second=0, page_workers=4)
+    url = f"https://open.spotify.com/playlist/bench{args.run}"
+    out_dir = tempfile.mkdtemp(prefix="bench-offline-")
+
+    stage_times = {}
+    lock = threading.Lock()
+
+    def on_stage(stage, job, seconds):
+        with lock:
+            stage_times.setdefault(stage, []).append(seconds)
+
+    options = dict(
+        jobs=args.jobs, search_jobs=args.search_jobs, transcode_jobs=args.transcode_jobs,
+        audio_format=args.format, on_stage=on_stage, max_rate=parse_rate(args.max_rate), adaptive=args.adaptive,
+        ydl_factory=fake_ydl_factory(args.search_latency, args.download_latency, args.bandwidth,
+                                     args.audio_seconds, ext=args.format, throttle_rate=args.throttle_rate,
+                                     throttle_above=args.throttle_above),
+    )
+
+    start = time.perf_counter()
+    # the pipeline prints a few lines per track, keep them out of the report
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        if args.via_csv:
+            tracklist = convert_from_spotify_url("bench", "bench", url, "keep", api_settings=api)
+            csv_path = os.path.join(out_dir, "tracklist.csv")
+            write_tracklist_csv(csv_path, tracklist.name, tracklist.tracks, tracklist.artists,
+                                tracklist.release_date, "keep")
+            downloaded, not_found = convert_csv_to_media(csv_path, out_dir, tracklist.name, **options)
+        else:
+            tracklists = fetch_tracklists("bench", "bench", [url], "keep", stream=True, api_settings=api)
+            downloaded, not_found = convert_tracklists_to_media(tracklists, out_dir, **options)[0]
+    elapsed = time.perf_counter() - start
+
+    server.stop()
+    shutil.rmtree(out_dir, ignore_errors=True)
+    print(json.dumps({
+        "tracks": args.run,
+        "downloaded": len(downloaded),
+        "failed": len(not_found),
+        "seconds": elapsed,
+        "tracks_per_sec": len(downloaded) / elapsed if elapsed else 0.0,
+        "spotify_requests": server.requests,
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": {
+            name: {"n": len(s), "p50_ms": percentile(s, 50) * 1000, "p90_ms": percentile(s, 90) * 1000,
+                   "p99_ms": percentile(s, 99) * 1000}
+            for name, s in stage_times.items()
+        },
+    }))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 10000])
+    ap.add_argument("--jobs", type=int, default=8)
+    ap.add_argument("--search-jobs", type=int, default=None)
+    ap.add_argument("--transcode-jobs", type=int, default=None)
+    ap.add_argument("--format", choices=["mp3", "wav"], default="mp3")
+    ap.add_argument("--via-csv", action="store_true")
+    ap.add_argument("--spotify-latency", type=float, default=0.02)
+    ap.add_argument("--search-latency", type=float, default=0.05)
+    ap.add_argument("--download-latency", type=float, default=0.1)
+    ap.add_argument("--bandwidth", type=float, default=10e6)
+    ap.add_argument("--audio-seconds", type=float, default=5)
+    ap.add_argument("--max-rate", default="0", help="global download cap, e.g. 5M (bytes/s)")
+    ap.add_argument("--adaptive", action="store_true")
+    ap.add_argument("--throttle-rate", type=float, default=0.0, help="share of downloads failing with HTTP 429")
+    ap.add_argument("--throttle-above", type=int, default=0, help="429 for downloads beyond this many at once")
+    ap.add_argument("--json", action="store_true", help="print the raw result of every size as a json line")
+    ap.add_argument("--run", type=int, default=None, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.run is not None:
+        return run_once(args)
+
+    passthrough = [a for a in sys.argv[1:] if a not in ("--json",)]
+    if "--sizes" in passthrough:
+        i = passthrough.index("--sizes")
+        j = i + 1
+        while j < len(passthrough) and not passthrough[j].startswith("--"):
+            j += 1
+        del passthrough[i:j]
+
+    path = "via csv" if args.via_csv else "streamed"
+    print(f"{path}, jobs {args.jobs}, search {args.search_latency * 1000:.0f} ms, "
+          f"download {args.download_latency * 1000:.0f} ms @ {args.bandwidth / 1e6:.1f} MB/s, "
+          f"{args.audio_seconds:g}s {args.format} files")
+    for size in args.sizes:
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--run", str(size), *passthrough],
+                              capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(f"{size} tracks: failed\n{proc.stderr.strip()[-2000:]}")
+            continue
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        if args.json:
+            print(json.dumps(result))
+            continue
+        rss = result["peak_rss_mb"]
+        print(f"\n{size} tracks: {result['downloaded']} downloaded, {result['failed']} failed in "
+              f"{result['seconds']:.1f}s = {result['tracks_per_sec']:.1f} tracks/s, "
+              f"{result['spotify_requests']} spotify requests, peak RSS "
+              f"{f'{rss:.0f} MB' if rss is not None else 'n/a'}")
+        for name, s in result["stages"].items():
+            print(f"  {name:<8} n={s['n']:<6} p50 {s['p50_ms']:8.1f} ms  p90 {s['p90_ms']:8.1f} ms  p99 {s['p99_ms']:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Files per second for `playlist-maker retag` on a synthetic library, against the local fake
+Spotify API (fake_services.FakeSpotify), so no network traffic at all.
+
+  python benchmarks/bench_retag.py [--files 2000] [--folders 4] [--jobs 1 4 0] [--no-covers]
+
+The library is --files silent MP3s spread over --folders folders, tagged with their Spotify
+track ID; the first folder also has a sync manifest, the others are mapped through the tags.
+Each --jobs value (0 = number of CPU cores) retags a fresh copy of the library.
+"""
+import argparse
+import contextlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_services import FakeSpotify, silent_mp3, synthetic_track
+
+from spotify2media.config import SpotifyApiSettings
+from spotify2media.retag import retag_library
+from spotify2media.sync import save_manifest
+from spotify2media.tagging import write_tags
+from spotify2media.tracks import Track
+
+
+def build_library(root, files, folders, seconds):
+    audio = silent_mp3(seconds)
+    manifest = {"tracks": {}}
+    for i in range(files):
+        folder = os.path.join(root, f"Playlist {i % folders}")
+        os.makedirs(folder, exist_ok=True)
+        t = synthetic_track(i)
+        name = f"{i // folders + 1:03d} - {t['title']}.mp3"
+        path = os.path.join(folder, name)
+        with open(path, "wb") as f:
+            f.write(audio)
+        spotify_id = f"track{i:018d}"
+        # stale metadata: the retag has to replace title, artist and genre
+        write_tags(path, Track(title=t["title"].lower(), artists=["Unknown"], album="Playlist",
+                               track_number=i // folders + 1, genre="Old", spotify_id=spotify_id))
+        if i % folders == 0:
+            manifest["tracks"][spotify_id] = {"file": name}
+    save_manifest(os.path.join(root, "Playlist 0"), manifest)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--files", type=int, default=2000)
+    ap.add_argument("--folders", type=int, default=4)
+    ap.add_argument("--jobs", type=int, nargs="+", default=[1, 4, 0])
+    ap.add_argument("--seconds", type=float, default=5, help="length of each silent mp3")
+    ap.add_argument("--spotify-latency", type=float, default=0.02)
+    ap.add_argument("--no-covers", action="store_true")
+    args = ap.parse_args()
+
+    server = FakeSpotify(latency=args.spotify_latency).start()
+    api = SpotifyApiSettings(api_url=f"{server.url}/v1", token_url=f"{server.url}/token",
+                             requests_per_second=0, page_workers=4)
+    template = tempfile.mkdtemp(prefix="bench-retag-")
+    build_library(template, args.files, args.folders, args.seconds)
+
+    print(f"{args.files} files in {args.folders} folders, covers {'off' if args.no_covers else 'on'}")
+    for jobs in args.jobs:
+        root = template + f"-{jobs}"
+        shutil.copytree(template, root)
+        requests_before = server.requests
+        start = time.perf_counter()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            counts = retag_library("bench", "bench", root, api_settings=api, jobs=jobs or None,
+                                   covers=not args.no_covers)
+        elapsed = time.perf_counter() - start
+        shutil.rmtree(root, ignore_errors=True)
+        print(f"jobs {jobs or os.cpu_count()}: {counts['retagged']} retagged, {counts['failed']} failed in "
+              f"{elapsed:.1f}s = {counts['retagged'] / elapsed:.0f} files/s, "
+              f"{server.requests - requests_before} spotify requests")
+
+    server.stop()
+    shutil.rmtree(template, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Per-track overhead removed by spotify2media.sessions.
+
+  python benchmarks/bench_sessions.py [--tracks 200] [--cover-url URL]
+
+1. YoutubeDL construction: a fresh instance per track (the old make_ydl) vs one long-lived
+   instance per worker from YdlPool.
+2. Cover downloads: bare requests.get per cover vs the pooled keep-alive session.
+   Without --cover-url a local HTTP server is used, which only shows the TCP setup cost;
+   against a real https cover host the saved TLS handshakes make the gap much larger.
+"""
+import argparse
+import http.server
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from yt_dlp import YoutubeDL
+
+from spotify2media.sessions import YdlPool, get_http_session
+
+YDL_OPTS = {
+    "quiet": True,
+    "noplaylist": True,
+    "format": "bestaudio[ext=m4a]/bestaudio/best",
+    "outtmpl": "%(id)s.%(ext)s",
+    "no_warnings": True,
+}
+
+
+def timed(fn, n):
+    samples = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+def report(name, samples):
+    ms = [s * 1000 for s in samples]
+    print(f"  {name:<28} mean {statistics.mean(ms):8.3f} ms   median {statistics.median(ms):8.3f} ms   total {sum(ms):9.1f} ms")
+
+
+def local_cover_server():
+    payload = os.urandom(64 * 1024)
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/cover.jpg"
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--tracks", type=int, default=200)
+    ap.add_argument("--cover-url", default=None)
+    args = ap.parse_args()
+
+    print(f"YoutubeDL setup, {args.tracks} tracks")
+    fresh = timed(lambda: YoutubeDL(dict(YDL_OPTS)), args.tracks)
+    pool = YdlPool({"download": YDL_OPTS})
+    pooled = timed(lambda: pool.get("download"), args.tracks)
+    pool.close()
+    report("new YoutubeDL per track", fresh)
+    report("YdlPool (per worker)", pooled)
+
+    server = None
+    url = args.cover_url
+    if not url:
+        server, url = local_cover_server()
+    print(f"Cover download, {args.tracks} requests to {url}")
+    bare = timed(lambda: requests.get(url, timeout=20).content, args.tracks)
+    session = get_http_session()
+    pooled_http = timed(lambda: session.get(url, timeout=20).content, args.tracks)
+    report("requests.get per cover", bare)
+    report("shared session", pooled_http)
+
+    saved = (statistics.mean(fresh) - statistics.mean(pooled)) + (statistics.mean(bare) - statistics.mean(pooled_http))
+    print(f"Per-track overhead removed: {saved * 1000:.2f} ms")
+    if server:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
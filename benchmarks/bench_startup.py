@@ -0,0 +1,90 @@
+"""
+CLI startup time per command.
+
+  python benchmarks/bench_startup.py [--runs 15] [--importtime]
+
+Every command is started --runs times in a fresh interpreter (like a shell invocation) and the
+median / min wall-clock time is reported next to a bare `python -c pass`. The heavy third-party
+packages (yt_dlp, requests, PIL, mutagen) each command ended up importing are listed too; with
+--importtime the slowest imports of every command are shown (python -X importtime).
+Only commands that exit without network access are timed (--help of each subcommand).
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ("yt_dlp", "requests", "PIL", "mutagen")
+
+COMMANDS = {
+    "python -c pass": None,
+    "import spotify2media": [],
+    "playlist-maker --help": ["--help"],
+    "playlist-maker sync --help": ["sync", "--help"],
+    "playlist-maker export --help": ["export", "--help"],
+    "playlist-maker retag --help": ["retag", "--help"],
+    "playlist-maker resolve --help": ["resolve", "--help"],
+    "playlist-maker execute --help": ["execute", "--help"],
+    "playlist-maker merge --help": ["merge", "--help"],
+    "playlist-maker daemon --help": ["daemon", "--help"],
+}
+
+# runs the cli (or only imports the package), then reports which heavy packages got loaded
+SCRIPT = """
+import atexit, sys
+atexit.register(lambda: sys.stderr.write("loaded: " + ",".join(
+    m for m in {heavy!r} if m in sys.modules) + "\\n"))
+import spotify2media
+if {argv!r}:
+    from spotify2media.cli import run
+    run({argv!r})
+"""
+
+def command_line(argv, importtime: bool = False) -> list:
+    flags = ["-X", "importtime"] if importtime else []
+    if argv is None:
+        return [sys.executable, *flags, "-c", "pass"]
+    return [sys.executable, *flags, "-c", SCRIPT.format(heavy=HEAVY, argv=argv)]
+
+def run_once(cmd: list, env: dict):
+    started = time.perf_counter()
+    proc = subprocess.run(cmd, capture_output=True, text=True, env=env, cwd=ROOT)
+    return time.perf_counter() - started, proc.stderr
+
+def slowest_imports(stderr: str, n: int = 8) -> list:
+    # "import time: self [us] | cumulative | imported package" lines
+    rows = []
+    for line in stderr.splitlines():
+        m = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|\s+(.*)", line)
+        if m:
+            rows.append((int(m.group(2)), m.group(3).rstrip()))
+    return sorted(rows, reverse=True)[:n]
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=15)
+    ap.add_argument("--importtime", action="store_true", help="also show the slowest imports of each command")
+    args = ap.parse_args()
+
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    print(f"{'command':<32} {'median':>9} {'min':>9}  heavy imports")
+    for name, argv in COMMANDS.items():
+        cmd = command_line(argv)
+        times = []
+        stderr = ""
+        for _ in range(max(1, args.runs)):
+            seconds, stderr = run_once(cmd, env)
+            times.append(seconds)
+        loaded = next((line[len("loaded: "):] for line in stderr.splitlines() if line.startswith("loaded: ")), "")
+        print(f"{name:<32} {statistics.median(times) * 1000:7.0f}ms {min(times) * 1000:7.0f}ms  {loaded or '-'}")
+        if args.importtime and argv is not None:
+            _, stderr = run_once(command_line(argv, importtime=True), env)
+            for cumulative, module in slowest_imports(stderr):
+                print(f"    {cumulative / 1000:7.1f}ms  {module}")
+
+if __name__ == "__main__":
+    main()
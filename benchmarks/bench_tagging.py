@@ -0,0 +1,137 @@
+"""
+Bytes written to disk per tagged track: the old two-pass MP3 tagging (tag_audio_file's save
+followed by embed_cover_mp3's save) against tagging.write_tags, which saves once.
+
+  python benchmarks/bench_tagging.py [--tracks 20] [--seconds 240]
+
+MP3 and WAV files are synthesized; M4A and FLAC are generated with ffmpeg when it is on PATH.
+Bytes are read from /proc/self/io (Linux), falling back to the growth in file size elsewhere.
+"""
+import argparse
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import wave
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mutagen.id3 import APIC, ID3, TALB, TIT2, TPE1
+from mutagen.mp3 import MP3
+from PIL import Image
+
+from spotify2media.tagging import write_tags
+
+ROW = {
+    "Track Name": "Benchmark Song",
+    "Artist Name(s)": "Artist One; Artist Two",
+    "Album Name": "Benchmark Album",
+    "Album Artist(s)": "Artist One",
+    "Release Date": "2024-01-01",
+    "Track Number": "1",
+    "Disc Number": "1",
+    "Genre": "Pop",
+    "Spotify Track ID": "0123456789abcdefghijkl",
+}
+
+
+def written_bytes():
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def make_cover():
+    buf = io.BytesIO()
+    Image.effect_noise((500, 500), 64).convert("RGB").save(buf, format="JPEG", quality=85)
+    return buf.getvalue()
+
+
+def make_mp3(path, seconds):
+    # silent MPEG-1 layer III frames, 128 kbps / 44.1 kHz (417 bytes, ~26 ms each)
+    frames = int(seconds / 0.026122)
+    with open(path, "wb") as f:
+        f.write((b"\xff\xfb\x90\x00" + b"\x00" * 413) * frames)
+
+
+def make_wav(path, seconds):
+    with wave.open(path, "wb") as w:
+        w.setnchannels(2)
+        w.setsampwidth(2)
+        w.setframerate(44100)
+        w.writeframes(b"\x00" * (44100 * 4 * int(seconds)))
+
+
+def make_with_ffmpeg(path, seconds, codec_args):
+    subprocess.run(
+        ["ffmpeg", "-y", "-loglevel", "error", "-f", "lavfi", "-i", "anullsrc=r=44100:cl=stereo",
+         "-t", str(seconds), *codec_args, path],
+        check=True,
+    )
+
+
+def legacy_mp3(path, row, cover):
+    # the pre-tagging-engine behaviour: one save for the text tags, a second for the cover
+    audio = MP3(path, ID3=ID3)
+    if audio.tags is None:
+        audio.add_tags()
+    audio.tags.add(TIT2(encoding=3, text=row["Track Name"]))
+    audio.tags.add(TPE1(encoding=3, text=row["Artist Name(s)"].split("; ")))
+    audio.tags.add(TALB(encoding=3, text=row["Album Name"]))
+    audio.save(v2_version=3)
+    tags = ID3(path)
+    tags.delall("APIC")
+    tags.add(APIC(encoding=3, mime="image/jpeg", type=3, desc="Cover", data=cover))
+    tags.save(path, v2_version=3)
+
+
+def measure(name, make, tag, tracks, seconds, tmp):
+    total_written = 0
+    file_size = 0
+    for n in range(tracks):
+        path = os.path.join(tmp, f"{name}-{n}{os.path.splitext(name)[1] or ''}")
+        make(path, seconds)
+        before_size = os.path.getsize(path)
+        before = written_bytes()
+        tag(path)
+        after = written_bytes()
+        file_size = os.path.getsize(path)
+        total_written += (after - before) if before is not None else file_size - before_size
+        os.remove(path)
+    per_track = total_written / tracks
+    print(f"  {name:<22} {per_track / 1024:10.1f} KiB written per track   (file {file_size / 1024:.0f} KiB)")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--tracks", type=int, default=20)
+    ap.add_argument("--seconds", type=int, default=240)
+    args = ap.parse_args()
+
+    cover = make_cover()
+    tmp = tempfile.mkdtemp()
+    print(f"{args.tracks} tracks of {args.seconds}s, cover {len(cover) / 1024:.0f} KiB")
+    try:
+        measure("legacy.mp3", lambda p, s: make_mp3(p, s), lambda p: legacy_mp3(p, ROW, cover), args.tracks, args.seconds, tmp)
+        measure("write_tags.mp3", lambda p, s: make_mp3(p, s), lambda p: write_tags(p, ROW, cover), args.tracks, args.seconds, tmp)
+        measure("write_tags.wav", lambda p, s: make_wav(p, s), lambda p: write_tags(p, ROW, cover), args.tracks, args.seconds, tmp)
+        if shutil.which("ffmpeg"):
+            measure("write_tags.m4a", lambda p, s: make_with_ffmpeg(p, s, ["-c:a", "aac"]),
+                    lambda p: write_tags(p, ROW, cover), args.tracks, args.seconds, tmp)
+            measure("write_tags.flac", lambda p, s: make_with_ffmpeg(p, s, ["-c:a", "flac"]),
+                    lambda p: write_tags(p, ROW, cover), args.tracks, args.seconds, tmp)
+        else:
+            print("  (ffmpeg not found, skipping m4a / flac)")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
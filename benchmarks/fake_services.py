@@ -0,0 +1,247 @@
+"""
+Local stand-ins for the Spotify Web API and yt-dlp, used by bench_offline.py.
+
+FakeSpotify serves synthetic playlists ("bench<N>" has N tracks) over HTTP with the
+token / playlist / playlist items / tracks / artists endpoints spotify_api.SpotifyAPI calls, plus
+cover images. fake_ydl_factory() builds YoutubeDL look-alikes whose searches and downloads
+take a configurable latency and bandwidth, and whose downloads are generated audio files.
+Both sides derive titles, artists and durations from the track index, so searches match.
+"""
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import threading
+import time
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+from PIL import Image
+
+TRACKS_PER_ALBUM = 12
+
+
+def synthetic_track(i: int) -> dict:
+    return {
+        "title": f"Track {i:05d}",
+        "artist": f"Artist {i % 97}",
+        "artist_id": f"artist{i % 97:03d}",
+        "album": f"Album {i // TRACKS_PER_ALBUM}",
+        "album_index": i // TRACKS_PER_ALBUM,
+        "duration_s": 150 + (i * 37) % 120,
+    }
+
+
+def video_id(key: str) -> str:
+    return hashlib.md5(key.encode()).hexdigest()[:11]
+
+
+class FakeSpotify:
+    """Threaded HTTP server on 127.0.0.1; latency is added to every API request."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.requests = 0
+        self._lock = threading.Lock()
+        buf = io.BytesIO()
+        Image.effect_noise((640, 640), 64).convert("RGB").save(buf, format="JPEG", quality=85)
+        self.cover = buf.getvalue()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def item(self, i: int) -> dict:
+        t = synthetic_track(i)
+        return {
+            "added_at": "2024-01-01T00:00:00Z",
+            "track": {
+                "id": f"track{i:018d}",
+                "name": t["title"],
+                "duration_ms": t["duration_s"] * 1000,
+                "track_number": i % TRACKS_PER_ALBUM + 1,
+                "disc_number": 1,
+                "external_urls": {"spotify": f"https://open.spotify.com/track/track{i:018d}"},
+                "artists": [{"id": t["artist_id"], "name": t["artist"]}],
+                "album": {
+                    "name": t["album"],
+                    "release_date": "2024-01-01",
+                    "artists": [{"name": t["artist"]}],
+                    "images": [{"url": f"{self.url}/covers/{t['album_index']}.jpg", "width": 640, "height": 640}],
+                },
+            },
+        }
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, body, code=200, content_type="application/json"):
+                data = body if isinstance(body, bytes) else json.dumps(body).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                self._send({"access_token": "bench", "token_type": "Bearer", "expires_in": 3600})
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                if url.path.startswith("/covers/"):
+                    return self._send(fake.cover, content_type="image/jpeg")
+
+                with fake._lock:
+                    fake.requests += 1
+                if fake.latency:
+                    time.sleep(fake.latency)
+
+                m = re.fullmatch(r"/v1/playlists/bench(\d+)(/tracks)?", url.path)
+                if m:
+                    size = int(m.group(1))
+                    if not m.group(2):
+                        return self._send({
+                            "name": f"Bench {size}",
+                            "owner": {"display_name": "bench", "id": "bench"},
+                            "snapshot_id": f"bench{size}",
+                            "tracks": {"total": size},
+                        })
+                    offset = int(query.get("offset", ["0"])[0])
+                    limit = int(query.get("limit", ["100"])[0])
+                    end = min(size, offset + limit)
+                    return self._send({
+                        "items": [fake.item(i) for i in range(offset, end)],
+                        "total": size,
+                        "next": f"{fake.url}{url.path}?offset={end}&limit={limit}" if end < size else None,
+                    })
+                if url.path == "/v1/tracks":
+                    ids = query.get("ids", [""])[0].split(",")
+                    found = [re.fullmatch(r"track(\d{18})", i) for i in ids]
+                    return self._send({"tracks": [fake.item(int(m.group(1)))["track"] if m else None for m in found]})
+                if url.path == "/v1/artists":
+                    ids = query.get("ids", [""])[0].split(",")
+                    return self._send({"artists": [{"id": a, "genres": ["synthpop"]} for a in ids]})
+                self._send({"error": {"status": 404, "message": "not found"}}, code=404)
+
+        return Handler
+
+
+def silent_mp3(seconds: float) -> bytes:
+    # silent MPEG-1 layer III frames, 128 kbps / 44.1 kHz (417 bytes, ~26 ms each)
+    return (b"\xff\xfb\x90\x00" + b"\x00" * 413) * int(seconds / 0.026122)
+
+
+def silent_wav(seconds: float) -> bytes:
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(2)
+        w.setsampwidth(2)
+        w.setframerate(44100)
+        w.writeframes(b"\x00" * (44100 * 4 * int(seconds)))
+    return buf.getvalue()
+
+
+def fake_ydl_factory(search_latency: float = 0.05, download_latency: float = 0.1,
+                     bandwidth: float = 10e6, audio_seconds: float = 5, ext: str = "mp3",
+                     throttle_rate: float = 0.0, throttle_above: int = 0, seed: int = 0):
+    """
+    Returns a callable taking YoutubeDL options, like the YoutubeDL class itself.
+    Searches answer after search_latency with one matching result plus decoys; downloads take
+    download_latency plus size / bandwidth (bytes per second), report progress to the
+    progress_hooks option in 64 KiB steps and write audio_seconds of silence.
+    A throttle_rate share of downloads fails with an HTTP 429 after download_latency, and so does
+    every download started while more than throttle_above (if set) are already running.
+    """
+    audio = silent_wav(audio_seconds) if ext == "wav" else silent_mp3(audio_seconds)
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+    in_flight = [0]
+    chunk = 64 * 1024
+
+    class FakeYoutubeDL:
+        def __init__(self, opts: dict):
+            self.opts = opts
+
+        def extract_info(self, url: str, download: bool = False, extra_info: Optional[dict] = None):
+            m = re.match(r"ytsearch(\d*):(.*)", url)
+            if m:
+                time.sleep(search_latency)
+                return {"entries": self._search(int(m.group(1) or 1), m.group(2))}
+
+            with rng_lock:
+                in_flight[0] += 1
+                throttled = rng.random() < throttle_rate or (throttle_above and in_flight[0] > throttle_above)
+            try:
+                time.sleep(download_latency)
+                if throttled:
+                    raise RuntimeError("ERROR: unable to download video data: HTTP Error 429: Too Many Requests")
+                return self._download(url, extra_info or {})
+            finally:
+                with rng_lock:
+                    in_flight[0] -= 1
+
+        def _download(self, url: str, extra_info: dict) -> dict:
+            vid = url.rsplit("=", 1)[-1]
+            path = self.opts["outtmpl"]
+            for key, value in dict(extra_info, id=vid, ext=ext).items():
+                path = path.replace(f"%({key})s", str(value))
+            hooks = self.opts.get("progress_hooks") or []
+            with open(path + ".part", "wb") as f:
+                for offset in range(0, len(audio), chunk):
+                    data = audio[offset:offset + chunk]
+                    time.sleep(len(data) / bandwidth)
+                    f.write(data)
+                    for hook in hooks:
+                        hook({"status": "downloading", "downloaded_bytes": offset + len(data),
+                              "total_bytes": len(audio), "tmpfilename": path + ".part", "filename": path})
+            os.replace(path + ".part", path)
+            for hook in hooks:
+                hook({"status": "finished", "downloaded_bytes": len(audio), "total_bytes": len(audio),
+                      "filename": path})
+            return {"id": vid, "title": vid, "extractor_key": "Youtube", "requested_downloads": [{"filepath": path}]}
+
+        def _search(self, n: int, q: str) -> list:
+            m = re.search(r"Track (\d+)", q)
+            t = synthetic_track(int(m.group(1))) if m else {"title": q, "artist": "", "duration_s": 200}
+            entries = []
+            for k in range(n):
+                vid = video_id(f"{q}:{k}")
+                # the first result is the real one, the rest are versions scoring below it
+                title, duration = (f"{t['artist']} - {t['title']}", t["duration_s"]) if k == 0 else \
+                    (f"{t['title']} (live {k})", t["duration_s"] + 40 * k)
+                entries.append({
+                    "id": vid,
+                    "url": f"https://www.youtube.com/watch?v={vid}",
+                    "title": title,
+                    "duration": duration,
+                    "channel": f"{t['artist']} - Topic" if k == 0 else f"Fan {k}",
+                })
+            return entries
+
+        def close(self):
+            pass
+
+    return FakeYoutubeDL
@@ -0,0 +1,35 @@
+from importlib import import_module
+
+# public names and the module each lives in; a module is imported on first access to one of its
+# names, so "import spotify2media" (and every CLI start) stays cheap until the download stack is needed
+_EXPORTS = {
+    "Track": "tracks",
+    "Tracklist": "tracks",
+    "sort_tracks": "tracks",
+    "read_tracklist": "csv_io",
+    "write_tracks_csv": "csv_io",
+    "write_tracklist_json": "csv_io",
+    "fetch_tracklist": "spotify_client",
+    "fetch_tracklists": "spotify_client",
+    "convert_tracks_to_media": "youtube_handler",
+    "convert_tracklists_to_media": "youtube_handler",
+    "sync_tracks_to_media": "sync",
+    "sync_tracklists_to_media": "sync",
+    "retag_library": "retag",
+    "resolve_tracklists": "plan",
+    "execute_plan": "plan",
+    "merge_shards": "plan",
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
@@ -0,0 +1,121 @@
+import re
+import subprocess
+from typing import Optional
+
+from .matching import normalize_text
+
+# albums with fewer tracks are cheaper to search track by track
+MIN_ALBUM_TRACKS = 3
+
+# a search result is a full-album candidate when its length is this close to the album's
+# (seconds, or the fraction of the album length when that is larger)
+CANDIDATE_WINDOW = 10.0
+CANDIDATE_WINDOW_SHARE = 0.02
+
+# cutting by spotify durations only when the video is this close to the album length
+DURATION_TOLERANCE = 3.0
+DURATION_TOLERANCE_SHARE = 0.005
+
+# how far each chapter may be from its track's spotify duration
+CHAPTER_TOLERANCE = 3.0
+CHAPTER_TOLERANCE_SHARE = 0.05
+
+def album_duration_s(tracks) -> Optional[float]:
+    # None when a track has no duration: nothing to line a video up with
+    if not tracks or any(not t.duration_ms for t in tracks):
+        return None
+    return sum(t.duration_ms for t in tracks) / 1000
+
+def album_query(album_name: str, artist: str) -> str:
+    return " ".join(p for p in (re.sub(r"[^\w\s]", '', artist or ''), re.sub(r"[^\w\s]", '', album_name or ''),
+                                "full album") if p.strip())
+
+def rank_album_videos(entries, album_name: str, artist: str, total_s: float) -> list:
+    """
+    Flat search results that can be the whole album in one video, best first: the length has to be
+    within the candidate window of total_s and the title has to name at least half of the album's words.
+    """
+    window = max(CANDIDATE_WINDOW, CANDIDATE_WINDOW_SHARE * total_s)
+    album_tokens = set(normalize_text(album_name).split())
+    artist_tokens = set(normalize_text(artist).split())
+    ranked = []
+    for entry in entries or []:
+        if not entry or not entry.get("duration"):
+            continue
+        delta = abs(float(entry["duration"]) - total_s)
+        if delta > window:
+            continue
+        norm_title = normalize_text(entry.get("title"))
+        title_tokens = set(norm_title.split())
+        album_share = len(album_tokens & title_tokens) / len(album_tokens) if album_tokens else 0.0
+        if album_share < 0.5:
+            continue
+        seen = title_tokens | set(normalize_text(entry.get("channel") or entry.get("uploader")).split())
+        artist_share = len(artist_tokens & seen) / len(artist_tokens) if artist_tokens else 0.0
+        score = 50 * album_share + 20 * artist_share + 20 * (1 - delta / window) + 10 * ("full album" in norm_title)
+        ranked.append((score, entry))
+    ranked.sort(key=lambda r: r[0], reverse=True)
+    return [entry for _, entry in ranked]
+
+def chapter_segments(chapters, durations: list) -> Optional[list]:
+    # one chapter per track, each about as long as the track; the video's own cut points are used
+    if not chapters or len(chapters) != len(durations):
+        return None
+    segments = []
+    for chapter, duration in zip(chapters, durations):
+        start, end = chapter.get("start_time"), chapter.get("end_time")
+        if start is None or end is None:
+            return None
+        if abs((end - start) - duration) > max(CHAPTER_TOLERANCE, CHAPTER_TOLERANCE_SHARE * duration):
+            return None
+        segments.append((float(start), float(end)))
+    return segments
+
+def duration_segments(durations: list, video_duration: float) -> Optional[list]:
+    # cut points from the spotify durations, stretched evenly over the video; only when the lengths agree
+    total = sum(durations)
+    if not video_duration or abs(video_duration - total) > max(DURATION_TOLERANCE, DURATION_TOLERANCE_SHARE * total):
+        return None
+    scale = video_duration / total
+    segments = []
+    start = 0.0
+    for duration in durations:
+        end = start + duration * scale
+        segments.append((start, end))
+        start = end
+    return segments
+
+def align_tracks(info: dict, durations: list) -> tuple:
+    """
+    Cut points for a downloaded full-album video: its chapters (YouTube chapters, or timestamps
+    yt-dlp found in the description) when they line up with the tracks, otherwise the spotify
+    durations when the video is as long as the album. Returns (segments, "chapters" / "durations"),
+    or (None, reason) when neither fits.
+    """
+    chapters = info.get("chapters") or []
+    segments = chapter_segments(chapters, durations)
+    if segments:
+        return segments, "chapters"
+    segments = duration_segments(durations, info.get("duration"))
+    if segments:
+        return segments, "durations"
+    if chapters:
+        return None, f"{len(chapters)} chapters for {len(durations)} tracks don't line up"
+    if not info.get("duration"):
+        return None, "video length unknown"
+    return None, f"video is {info.get('duration')}s, the album {sum(durations):.0f}s"
+
+def split_audio(src_path: str, segments: list, dst_paths: list, ffmpeg_exe: str = "ffmpeg") -> list:
+    """
+    Cuts src_path into one file per (start, end) segment without re-encoding, each in the source's
+    container; the last one runs to the end of the file. Top level so it can run in a process pool.
+    """
+    for n, ((start, end), dst_path) in enumerate(zip(segments, dst_paths)):
+        cmd = [ffmpeg_exe, "-y", "-loglevel", "error", "-ss", f"{start:.3f}", "-i", src_path]
+        if n < len(segments) - 1:
+            cmd += ["-t", f"{end - start:.3f}"]
+        cmd += ["-map", "0:a:0", "-vn", "-codec:a", "copy", dst_path]
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed: {proc.stderr.strip()[-300:]}")
+    return dst_paths
@@ -0,0 +1,189 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from .covers import CoverCache
+
+
+class CacheStore:
+    # one sqlite file shared by every on-disk cache, safe to use from worker threads
+    def __init__(self, path: str):
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+
+    def execute(self, sql: str, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class MetadataCache:
+    """
+    Spotify API responses keyed by (kind, key), e.g. ("album", album_id).
+    Entries older than ttl_seconds are treated as missing; once the cache grows past
+    max_bytes the least recently used entries are dropped. clock gives the current time
+    (time.time, or a fake one in tests).
+    """
+
+    def __init__(self, store: CacheStore, ttl_seconds: float, max_bytes: int, clock=time.time):
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.clock = clock
+        store.execute(
+            "CREATE TABLE IF NOT EXISTS spotify_cache ("
+            " kind TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, size INTEGER NOT NULL,"
+            " stored_at REAL NOT NULL, accessed_at REAL NOT NULL, PRIMARY KEY (kind, key))"
+        )
+        store.execute("CREATE INDEX IF NOT EXISTS spotify_cache_accessed ON spotify_cache (accessed_at)")
+        self._size = store.execute("SELECT COALESCE(SUM(size), 0) FROM spotify_cache")[0][0]
+
+    def get(self, kind: str, key: str):
+        rows = self.store.execute(
+            "SELECT value, stored_at FROM spotify_cache WHERE kind = ? AND key = ?", (kind, key)
+        )
+        if not rows:
+            return None
+        value, stored_at = rows[0]
+        now = self.clock()
+        if self.ttl_seconds and now - stored_at > self.ttl_seconds:
+            self.delete(kind, key)
+            return None
+        self.store.execute(
+            "UPDATE spotify_cache SET accessed_at = ? WHERE kind = ? AND key = ?", (now, kind, key)
+        )
+        return json.loads(value)
+
+    def get_many(self, kind: str, keys) -> dict:
+        found = {}
+        for key in keys:
+            value = self.get(kind, key)
+            if value is not None:
+                found[key] = value
+        return found
+
+    def set(self, kind: str, key: str, value):
+        data = json.dumps(value, separators=(",", ":"))
+        now = self.clock()
+        with self.store.lock:
+            old = self.store.execute(
+                "SELECT size FROM spotify_cache WHERE kind = ? AND key = ?", (kind, key)
+            )
+            self.store.execute(
+                "INSERT OR REPLACE INTO spotify_cache (kind, key, value, size, stored_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, key, data, len(data), now, now),
+            )
+            self._size += len(data) - (old[0][0] if old else 0)
+            self._evict()
+
+    def set_many(self, kind: str, values: dict):
+        for key, value in values.items():
+            self.set(kind, key, value)
+
+    def delete(self, kind: str, key: str):
+        with self.store.lock:
+            old = self.store.execute(
+                "SELECT size FROM spotify_cache WHERE kind = ? AND key = ?", (kind, key)
+            )
+            if old:
+                self.store.execute("DELETE FROM spotify_cache WHERE kind = ? AND key = ?", (kind, key))
+                self._size -= old[0][0]
+
+    def _evict(self):
+        if not self.max_bytes or self._size <= self.max_bytes:
+            return
+        # drop least recently used entries until we are back under 90% of the limit
+        target = self.max_bytes * 0.9
+        for kind, key, size in self.store.execute(
+            "SELECT kind, key, size FROM spotify_cache ORDER BY accessed_at"
+        ):
+            if self._size <= target:
+                break
+            self.store.execute("DELETE FROM spotify_cache WHERE kind = ? AND key = ?", (kind, key))
+            self._size -= size
+
+
+class MatchIndex:
+    """
+    Spotify track id -> the YouTube video chosen for it, shared by every tracklist.
+    Matches never expire on their own; they are forgotten when the video stops downloading.
+    """
+
+    def __init__(self, store: CacheStore):
+        self.store = store
+        store.execute(
+            "CREATE TABLE IF NOT EXISTS youtube_matches ("
+            " spotify_id TEXT PRIMARY KEY, video_url TEXT NOT NULL, title TEXT, duration REAL,"
+            " score TEXT, matched_at REAL NOT NULL)"
+        )
+        # tables from before score was stored get the column (an old, unused variant column can stay)
+        columns = {row[1] for row in store.execute("PRAGMA table_info(youtube_matches)")}
+        if "score" not in columns:
+            store.execute("ALTER TABLE youtube_matches ADD COLUMN score TEXT")
+
+    def get(self, spotify_id: str) -> Optional[dict]:
+        if not spotify_id:
+            return None
+        rows = self.store.execute(
+            "SELECT video_url, title, duration, score FROM youtube_matches WHERE spotify_id = ?",
+            (spotify_id,),
+        )
+        if not rows:
+            return None
+        video_url, title, duration, score = rows[0]
+        return {
+            "video_url": video_url,
+            "title": title,
+            "duration": duration,
+            "score": json.loads(score) if score else None,
+        }
+
+    def set(self, spotify_id: str, video_url: str, title: str = "", duration=None, score=None):
+        # score is the match breakdown from matching.score_candidate
+        if not spotify_id or not video_url:
+            return
+        self.store.execute(
+            "INSERT OR REPLACE INTO youtube_matches (spotify_id, video_url, title, duration, score, matched_at)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (spotify_id, video_url, title, duration, json.dumps(score) if score else None, time.time()),
+        )
+
+    def forget(self, spotify_id: str):
+        self.store.execute("DELETE FROM youtube_matches WHERE spotify_id = ?", (spotify_id,))
+
+
+@dataclass
+class Caches:
+    store: CacheStore
+    metadata: MetadataCache
+    matches: MatchIndex
+    covers: CoverCache
+
+    def close(self):
+        self.store.close()
+
+
+def open_caches(settings) -> Optional[Caches]:
+    # settings is a config.CacheSettings; returns None when caching is switched off
+    if not settings or not settings.enabled:
+        return None
+    store = CacheStore(settings.path)
+    return Caches(
+        store=store,
+        metadata=MetadataCache(store, settings.ttl_hours * 3600, int(settings.max_mb * 1024 * 1024)),
+        matches=MatchIndex(store),
+        covers=CoverCache(os.path.join(os.path.dirname(os.path.abspath(settings.path)), "covers"), store),
+    )
@@ -1,20 +1,245 @@
 import argparse
 import os
-import tempfile
+import sys
 
 from .config import load_config
-from .spotify_client import convert_from_spotify_url
-from .csv_io import write_tracklist_csv
-from .youtube_handler import convert_csv_to_media
+from .cache import open_caches
+from .csv_io import read_tracklist, write_tracklist_json, write_tracks_csv
+from .youtube_handler import convert_tracklists_to_media, safe_filename
+from .scheduler import parse_rate
+from .sync import PRUNE_MODES, sync_tracklists_to_media
+from .telemetry import RunReport
 
 
+URL_HELP = ("Spotify URL(s) (track / album / playlist) or tracklist CSVs saved with --save-csv "
+            "(or 'export'); several are downloaded in one run and tracks they share are downloaded once")
+
+# spotify_client (and with it requests) is imported inside the commands that talk to Spotify,
+# so --help and argument errors return without loading it
+
+def _rate(text: str) -> float:
+    try:
+        return parse_rate(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def _add_download_arguments(p: argparse.ArgumentParser):
+    _add_from_file_argument(p)
+    _add_job_arguments(p)
+
+    p.add_argument(
+        "--save-csv",
+        default=None,
+        metavar="PATH",
+        help="Also write the fetched tracklist to a CSV file (a folder of CSVs when there are several tracklists)"
+    )
+
+    _add_report_arguments(p)
+    _add_cache_arguments(p)
+
+def _add_report_arguments(p: argparse.ArgumentParser):
+    p.add_argument(
+        "--report",
+        default=None,
+        metavar="PATH",
+        help="Write per-track timings (search, download, transcode, tagging, cover) and Spotify request "
+             "times to a JSON file, or JSON lines as tracks finish when PATH ends in .jsonl"
+    )
+
+    p.add_argument(
+        "--metrics",
+        default=None,
+        metavar="PATH",
+        help="Write the run's counters in Prometheus text format (e.g. for the node_exporter textfile collector)"
+    )
+
+def _add_from_file_argument(p: argparse.ArgumentParser):
+    p.add_argument(
+        "--from-file",
+        default=None,
+        metavar="PATH",
+        help="Read more URLs from a text file, one per line (blank lines and # comments are skipped)"
+    )
+
+def _add_job_arguments(p: argparse.ArgumentParser):
+    sort_group = p.add_mutually_exclusive_group()
+    sort_group.add_argument("-keep", action="store_true", help="Keep order of playlist")
+    sort_group.add_argument("-album", action="store_true", help="Keep each track's original album ordering #")
+
+    p.add_argument(
+        "-o", "--output",
+        default=None,
+        help="Override output path from config"
+    )
+
+    p.add_argument(
+        "--format",
+        default="mp3",
+        choices=["mp3", "wav", "flac", "m4a"],
+        help="Output audio format (default: mp3)"
+    )
+
+    p.add_argument(
+        "-n", "--no-numbering",
+        action="store_true",
+        default=False,
+        help="Do not prefix filenames with track numbers"
+    )
+
+    p.add_argument(
+        "--split-albums",
+        action="store_true",
+        default=False,
+        help="For album URLs, download one full-album video and cut it into the tracks by its chapters or "
+             "the Spotify durations; falls back to searching each track when none lines up"
+    )
+
+    _add_worker_arguments(p)
+
+def _add_worker_arguments(p: argparse.ArgumentParser):
+    p.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=1,
+        help="Number of tracks to download in parallel (default: 1)"
+    )
+
+    p.add_argument(
+        "--search-jobs",
+        type=int,
+        default=None,
+        help="Number of parallel YouTube searches (default: same as --jobs)"
+    )
+
+    p.add_argument(
+        "--transcode-jobs",
+        type=int,
+        default=None,
+        help="Number of parallel transcode processes (default: number of CPU cores)"
+    )
+
+    p.add_argument(
+        "--search-results",
+        type=int,
+        default=8,
+        help="Number of YouTube results fetched per track and scored locally (default: 8)"
+    )
+
+    p.add_argument(
+        "--adaptive",
+        action="store_true",
+        default=False,
+        help="Adjust the number of parallel downloads (up to --jobs) to the observed throughput and "
+             "YouTube 403 / 429 responses"
+    )
+
+    p.add_argument(
+        "--max-rate",
+        type=_rate,
+        default=0,
+        metavar="RATE",
+        help="Cap on the combined download speed in bytes per second, e.g. 800K or 2.5M (default: no cap)"
+    )
+
+def _add_cache_arguments(p: argparse.ArgumentParser):
+    p.add_argument(
+        "--no-cache",
+        action="store_true",
+        default=False,
+        help="Do not read or write the on-disk Spotify metadata and YouTube match caches"
+    )
+
+    p.add_argument(
+        "--refresh-matches",
+        action="store_true",
+        default=False,
+        help="Search YouTube again even for tracks with a remembered match"
+    )
+
 def build_parser() -> argparse.ArgumentParser:
     p = argparse.ArgumentParser(
         prog="playlist-maker",
-        description="Download Spotify media via YouTube and tag metadata."
+        description="Download Spotify media via YouTube and tag metadata.",
+        epilog="Other commands: 'playlist-maker sync <url>', 'playlist-maker export <url>', "
+               "'playlist-maker retag <folder>', 'playlist-maker resolve <url>', 'playlist-maker execute <plan>', "
+               "'playlist-maker merge <folder>', 'playlist-maker daemon' (see '<command> --help')"
     )
 
-    p.add_argument("url", help="Spotify URL (track / album / playlist)")
+    p.add_argument("url", nargs="*", help=URL_HELP)
+    _add_download_arguments(p)
+    return p
+
+def build_sync_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(
+        prog="playlist-maker sync",
+        description="Mirror a Spotify tracklist into its output folder: download only new tracks, "
+                    "renumber moved ones and handle removed ones."
+    )
+
+    p.add_argument("url", nargs="*", help=URL_HELP)
+    _add_download_arguments(p)
+    _add_prune_argument(p)
+    return p
+
+def _add_prune_argument(p: argparse.ArgumentParser):
+    p.add_argument(
+        "--prune",
+        default="keep",
+        choices=PRUNE_MODES,
+        help="What to do with files of tracks no longer in the tracklist: keep them, delete them "
+             "or move them to _removed/ (default: keep)"
+    )
+
+def build_daemon_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(
+        prog="playlist-maker daemon",
+        description="Stay running with warm caches: sync the watched URLs every interval and run jobs\n"
+                    "posted to a local HTTP endpoint from a queue that survives restarts.",
+        # raw, so the curl example stays copyable
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="submit a job (the token file is token_path in config.ini):\n"
+               "  curl -H \"Authorization: Bearer $(cat ~/.playlist-maker/daemon.token)\" \\\n"
+               "       -H \"Content-Type: application/json\" \\\n"
+               "       -d '{\"urls\": [\"<spotify-url>\"], \"mode\": \"sync\"}' http://127.0.0.1:8765/jobs"
+    )
+
+    p.add_argument("watch", nargs="*", help="Spotify URL(s) to keep in sync (default: watch list in config.ini)")
+    _add_from_file_argument(p)
+    _add_job_arguments(p)
+    _add_cache_arguments(p)
+    _add_prune_argument(p)
+
+    p.add_argument(
+        "--host",
+        default=None,
+        help="Address the job endpoint listens on (default: from config, 127.0.0.1)"
+    )
+
+    p.add_argument(
+        "--port",
+        type=int,
+        default=None,
+        help="Port of the job endpoint (default: from config, 8765)"
+    )
+
+    p.add_argument(
+        "--interval",
+        type=float,
+        default=None,
+        metavar="MINUTES",
+        help="Minutes between syncs of the watched URLs (default: from config, 60)"
+    )
+    return p
+
+def build_export_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(
+        prog="playlist-maker export",
+        description="Write the Spotify metadata of tracklists to CSV or JSON files, without downloading anything. "
+                    "The files can be passed back to playlist-maker in place of the URLs."
+    )
+
+    p.add_argument("url", nargs="*", help="Spotify URL(s) (track / album / playlist)")
+    _add_from_file_argument(p)
 
     sort_group = p.add_mutually_exclusive_group()
     sort_group.add_argument("-keep", action="store_true", help="Keep order of playlist")
@@ -23,14 +248,91 @@ def build_parser() -> argparse.ArgumentParser:
     p.add_argument(
         "-o", "--output",
         default=None,
-        help="Override output path from config"
+        metavar="PATH",
+        help="File to write (a folder when there are several tracklists); default: <tracklist name>.<format> "
+             "in the current folder"
+    )
+
+    p.add_argument(
+        "--format",
+        default=None,
+        choices=["csv", "json"],
+        help="File format (default: from the --output extension, otherwise csv)"
+    )
+
+    p.add_argument(
+        "--no-cache",
+        action="store_true",
+        default=False,
+        help="Do not read or write the on-disk Spotify metadata cache"
+    )
+    return p
+
+def build_retag_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(
+        prog="playlist-maker retag",
+        description="Refresh the tags and covers of already downloaded files from current Spotify metadata, "
+                    "without downloading them again. Files are matched to Spotify tracks through the sync "
+                    "manifest or their embedded Spotify track ID."
+    )
+
+    p.add_argument("folder", nargs="*", help="Folder(s) to retag, searched recursively (default: output path from config)")
+
+    p.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=None,
+        help="Number of parallel tag-writing processes (default: number of CPU cores)"
+    )
+
+    p.add_argument(
+        "--no-covers",
+        action="store_true",
+        default=False,
+        help="Keep the embedded covers and only rewrite the text tags"
+    )
+
+    p.add_argument(
+        "--no-cache",
+        action="store_true",
+        default=False,
+        help="Do not read or write the on-disk artist genre and cover caches"
+    )
+    return p
+
+def _shard(text: str) -> tuple:
+    from .plan import parse_shard
+    try:
+        return parse_shard(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def build_resolve_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(
+        prog="playlist-maker resolve",
+        description="Search YouTube for every track without downloading, and write the chosen videos, "
+                    "file names and tags to a JSON lines plan for 'playlist-maker execute'."
+    )
+
+    p.add_argument("url", nargs="*", help=URL_HELP)
+    _add_from_file_argument(p)
+
+    sort_group = p.add_mutually_exclusive_group()
+    sort_group.add_argument("-keep", action="store_true", help="Keep order of playlist")
+    sort_group.add_argument("-album", action="store_true", help="Keep each track's original album ordering #")
+
+    p.add_argument(
+        "-o", "--output",
+        default="plan.jsonl",
+        metavar="PATH",
+        help="Plan file to write (default: plan.jsonl)"
     )
 
     p.add_argument(
         "--format",
         default="mp3",
         choices=["mp3", "wav", "flac", "m4a"],
-        help="Output audio format (default: mp3)"
+        help="Output audio format the plan is executed with (default: mp3)"
     )
 
     p.add_argument(
@@ -40,16 +342,273 @@ def build_parser() -> argparse.ArgumentParser:
         help="Do not prefix filenames with track numbers"
     )
 
+    p.add_argument(
+        "--search-jobs",
+        type=int,
+        default=4,
+        help="Number of parallel YouTube searches (default: 4)"
+    )
+
+    p.add_argument(
+        "--search-results",
+        type=int,
+        default=8,
+        help="Number of YouTube results fetched per track and scored locally (default: 8)"
+    )
+
+    _add_cache_arguments(p)
     return p
 
-def run(argv=None) -> int:
-    parser = build_parser()
+def build_execute_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(
+        prog="playlist-maker execute",
+        description="Download the tracks of a plan written by 'playlist-maker resolve', or one shard of them. "
+                    "Every node that runs a different --shard of the same plan downloads a different slice."
+    )
+
+    p.add_argument("plan", help="Plan file written by 'playlist-maker resolve'")
+
+    p.add_argument(
+        "--shard",
+        type=_shard,
+        default=(1, 1),
+        metavar="I/N",
+        help="Download only shard I of N, e.g. 2/4 (default: 1/1, the whole plan)"
+    )
+
+    p.add_argument(
+        "-o", "--output",
+        default=None,
+        help="Override output path from config"
+    )
+
+    _add_worker_arguments(p)
+    _add_report_arguments(p)
+
+    p.add_argument(
+        "--no-cache",
+        action="store_true",
+        default=False,
+        help="Do not read or write the on-disk YouTube match and cover caches"
+    )
+    return p
+
+def build_merge_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(
+        prog="playlist-maker merge",
+        description="Collect the output folders of executed shards into one tree: files, download archives, "
+                    "_not_found reports and sync manifests."
+    )
+
+    p.add_argument("folder", nargs="+", help="Output folder(s) of 'playlist-maker execute' runs")
+
+    p.add_argument(
+        "-o", "--output",
+        default=None,
+        help="Folder to merge into (default: output path from config)"
+    )
+
+    p.add_argument(
+        "--plan",
+        default=None,
+        metavar="PATH",
+        help="The plan the shards were executed from, to report tracks no merged shard accounts for"
+    )
+    return p
+
+def read_url_file(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        lines = [line.strip() for line in f]
+    return [line for line in lines if line and not line.startswith("#")]
+
+def _collect_urls(parser: argparse.ArgumentParser, args) -> list:
+    urls = [u.strip() for u in args.url if u.strip()]
+    if args.from_file:
+        urls += read_url_file(args.from_file)
+    if not urls:
+        parser.error("at least one URL (or --from-file) is required")
+    return urls
+
+def run_export(argv) -> int:
+    parser = build_export_parser()
     args = parser.parse_args(argv)
+    urls = _collect_urls(parser, args)
+
+    from .spotify_client import fetch_tracklists
+    file_format = args.format or ("json" if (args.output or "").lower().endswith(".json") else "csv")
+
+    creds, _, cache_settings, api_settings, _ = load_config()
+    caches = None if args.no_cache else open_caches(cache_settings)
+    try:
+        # streamed: each tracklist is written page by page as spotify returns it
+        tracklists = fetch_tracklists(
+            creds.client_id, creds.client_secret, urls, "keep" if args.keep else "album",
+            cache=caches and caches.metadata, api_settings=api_settings, stream=True
+        )
+        for tracklist in tracklists:
+            path = args.output
+            if not path or len(tracklists) > 1:
+                folder = args.output or "."
+                os.makedirs(folder, exist_ok=True)
+                path = os.path.join(folder, f"{safe_filename(tracklist.name) or 'tracklist'}.{file_format}")
+            if file_format == "json":
+                write_tracklist_json(path, tracklist)
+            else:
+                write_tracks_csv(path, tracklist.tracks)
+            print(f"Exported {tracklist.name} to {path}")
+    finally:
+        if caches:
+            caches.close()
+    return 0
+
+def run_retag(argv) -> int:
+    args = build_retag_parser().parse_args(argv)
 
-    creds, download_settings = load_config()
+    from .retag import retag_library
+    creds, download_settings, cache_settings, api_settings, _ = load_config()
+    folders = [f for f in args.folder if f.strip()] or [download_settings.output_path]
+    for folder in folders:
+        if not os.path.isdir(folder):
+            raise SystemExit(f"Not a folder: {folder}")
+
+    caches = None if args.no_cache else open_caches(cache_settings)
+    try:
+        for folder in folders:
+            retag_library(creds.client_id, creds.client_secret, folder, cache=caches and caches.metadata,
+                          cover_cache=caches and caches.covers, api_settings=api_settings, jobs=args.jobs,
+                          covers=not args.no_covers)
+    finally:
+        if caches:
+            caches.close()
+    return 0
+
+def _load_tracklists(urls, sort_mode, creds, caches, api_settings, on_request=None, stream=False) -> list:
+    from .spotify_client import fetch_tracklists
+
+    # previously saved tracklists need no spotify lookups
+    is_csv = [u.lower().endswith((".csv", ".json")) and os.path.isfile(u) for u in urls]
+    fetched = iter(fetch_tracklists(
+        creds.client_id,
+        creds.client_secret,
+        [u for u, csv_file in zip(urls, is_csv) if not csv_file],
+        sort_mode,
+        cache=caches and caches.metadata,
+        api_settings=api_settings,
+        on_request=on_request,
+        stream=stream
+    ) if not all(is_csv) else [])
+    return [read_tracklist(u) if csv_file else next(fetched) for u, csv_file in zip(urls, is_csv)]
+
+def run_resolve(argv) -> int:
+    parser = build_resolve_parser()
+    args = parser.parse_args(argv)
+    urls = _collect_urls(parser, args)
+
+    from .plan import resolve_tracklists
+    creds, _, cache_settings, api_settings, _ = load_config()
+    caches = None if args.no_cache else open_caches(cache_settings)
+    try:
+        tracklists = _load_tracklists(urls, "keep" if args.keep else "album", creds, caches, api_settings, stream=True)
+        resolve_tracklists(tracklists, args.output, numbered_tracks=not args.no_numbering, audio_format=args.format,
+                           search_jobs=args.search_jobs, search_results=args.search_results,
+                           match_index=caches and caches.matches, refresh_matches=args.refresh_matches)
+    finally:
+        if caches:
+            caches.close()
+    return 0
+
+def run_execute(argv) -> int:
+    args = build_execute_parser().parse_args(argv)
+
+    from .plan import execute_plan
+    _, download_settings, cache_settings, _, _ = load_config()
+    caches = None if args.no_cache else open_caches(cache_settings)
+    run_report = RunReport(args.report, args.metrics) if args.report or args.metrics else None
+    try:
+        execute_plan(
+            args.plan, args.output or download_settings.output_path, shard=args.shard,
+            match_index=caches and caches.matches, jobs=args.jobs, search_jobs=args.search_jobs,
+            transcode_jobs=args.transcode_jobs, search_results=args.search_results,
+            cover_cache=caches and caches.covers, run_report=run_report, max_rate=args.max_rate, adaptive=args.adaptive
+        )
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        return 1
+    finally:
+        if caches:
+            caches.close()
+        if run_report:
+            run_report.close()
+    return 0
+
+def run_merge(argv) -> int:
+    args = build_merge_parser().parse_args(argv)
+
+    from .plan import merge_shards
+    output_path = args.output
+    if not output_path:
+        _, download_settings, _, _, _ = load_config()
+        output_path = download_settings.output_path
+    merge_shards(args.folder, output_path, plan_path=args.plan)
+    return 0
+
+def run_daemon(argv) -> int:
+    args = build_daemon_parser().parse_args(argv)
+
+    from .daemon import Daemon, JobQueue
+    creds, download_settings, cache_settings, api_settings, daemon_settings = load_config()
+    daemon_settings.host = args.host or daemon_settings.host
+    daemon_settings.port = args.port if args.port is not None else daemon_settings.port
+    daemon_settings.interval_minutes = args.interval or daemon_settings.interval_minutes
+
+    watch = [u.strip() for u in args.watch if u.strip()]
+    if args.from_file:
+        watch += read_url_file(args.from_file)
+
+    defaults = dict(
+        output=args.output or download_settings.output_path, format=args.format,
+        sort="keep" if args.keep else "album", numbered=not args.no_numbering, prune=args.prune
+    )
+    download_kwargs = dict(
+        jobs=args.jobs, search_jobs=args.search_jobs, transcode_jobs=args.transcode_jobs,
+        refresh_matches=args.refresh_matches, search_results=args.search_results,
+        max_rate=args.max_rate, adaptive=args.adaptive, split_albums=args.split_albums
+    )
+
+    caches = None if args.no_cache else open_caches(cache_settings)
+    queue = JobQueue(daemon_settings.queue_path)
+    try:
+        Daemon(creds, api_settings, daemon_settings, queue, defaults, caches=caches,
+               download_kwargs=download_kwargs, watch=watch or None).serve()
+    finally:
+        queue.close()
+        if caches:
+            caches.close()
+    return 0
+
+def run(argv=None) -> int:
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv and argv[0] == "daemon":
+        return run_daemon(argv[1:])
+    if argv and argv[0] == "export":
+        return run_export(argv[1:])
+    if argv and argv[0] == "retag":
+        return run_retag(argv[1:])
+    if argv and argv[0] == "resolve":
+        return run_resolve(argv[1:])
+    if argv and argv[0] == "execute":
+        return run_execute(argv[1:])
+    if argv and argv[0] == "merge":
+        return run_merge(argv[1:])
+    sync = bool(argv) and argv[0] == "sync"
+    parser = build_sync_parser() if sync else build_parser()
+    args = parser.parse_args(argv[1:] if sync else argv)
+
+    urls = _collect_urls(parser, args)
+
+    creds, download_settings, cache_settings, api_settings, _ = load_config()
 
     output_path = args.output or download_settings.output_path
-    url = args.url.strip()
 
     # sort_mode
     if args.keep:
@@ -59,25 +618,47 @@ def run(argv=None) -> int:
 
     numbered_tracks = not args.no_numbering
 
-    tracklist_title, tracklist_artists, release_date, tracks = convert_from_spotify_url(
-        creds.client_id,
-        creds.client_secret,
-        url,
-        sort_mode
-    )
-
-    fd, csv_path = tempfile.mkstemp(suffix=".csv")
-    os.close(fd)
+    caches = None if args.no_cache else open_caches(cache_settings)
+    run_report = RunReport(args.report, args.metrics) if args.report or args.metrics else None
 
     try:
-        write_tracklist_csv(csv_path, tracklist_title, tracks, tracklist_artists, release_date, sort_mode)
-        convert_csv_to_media(csv_path, output_path, tracklist_title, numbered_tracks)
+        tracklists = _load_tracklists(
+            urls, sort_mode, creds, caches, api_settings,
+            on_request=run_report and run_report.on_spotify_request,
+            # a plain download starts on the first page while the rest is still being fetched
+            stream=not sync and not args.save_csv
+        )
+
+        if args.save_csv:
+            for tracklist in tracklists:
+                csv_path = args.save_csv
+                if len(tracklists) > 1:
+                    os.makedirs(args.save_csv, exist_ok=True)
+                    csv_path = os.path.join(args.save_csv, safe_filename(tracklist.name) + ".csv")
+                write_tracks_csv(csv_path, tracklist.tracks)
+                print(f"Tracklist saved to {csv_path}")
+
+        download_kwargs = dict(
+            jobs=args.jobs, search_jobs=args.search_jobs, transcode_jobs=args.transcode_jobs,
+            match_index=caches and caches.matches, refresh_matches=args.refresh_matches,
+            search_results=args.search_results, cover_cache=caches and caches.covers,
+            audio_format=args.format, run_report=run_report, max_rate=args.max_rate, adaptive=args.adaptive,
+            split_albums=args.split_albums
+        )
+        if sync:
+            sync_tracklists_to_media(tracklists, output_path, numbered_tracks, prune=args.prune, **download_kwargs)
+        else:
+            convert_tracklists_to_media(tracklists, output_path, numbered_tracks, **download_kwargs)
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        return 1
     finally:
-        try:
-            if os.path.exists(csv_path):
-                os.remove(csv_path)
-        except Exception as e:
-            print(f"Warning: could not delete temporary file {csv_path}: {e}")
+        if caches:
+            caches.close()
+        if run_report:
+            summary = run_report.close()
+            print(f"Run report: {summary['elapsed_s']:.0f}s, {summary['tracks_per_s']:.2f} tracks/s"
+                  + "".join(f", {p} {d['total_s']:.0f}s" for p, d in summary["phases"].items()))
 
 if __name__ == "__main__":
-    raise SystemExit(run())
\ No newline at end of file
+    raise SystemExit(run())
@@ -9,10 +9,37 @@ class SpotifyCreds:
     client_secret: str
     username: str
 
+@dataclass
+class SpotifyApiSettings:
+    api_url: str
+    token_url: str
+    requests_per_second: float
+    page_workers: int
+    # a request still answered with 429 after this many seconds of waiting fails
+    max_rate_limit_wait: float = 600
+
 @dataclass
 class Download:
     output_path: str
 
+@dataclass
+class CacheSettings:
+    enabled: bool
+    path: str
+    ttl_hours: float
+    max_mb: float
+
+@dataclass
+class DaemonSettings:
+    host: str
+    port: int
+    interval_minutes: float
+    watch: list
+    queue_path: str
+    # shared secret the HTTP endpoint requires; read from (or created in) token_path when not set
+    token: str
+    token_path: str
+
 def _default_config_path() -> Path:
     # based on windows-standard config location : %APPDATA%/playlist-maker/config.ini
     appdata = os.environ.get("APPDATA")
@@ -22,6 +49,16 @@ def _default_config_path() -> Path:
     # fallback (rare)
     return Path.home() / ".playlist-maker" / "config.ini"
 
+def _default_cache_path() -> Path:
+    # kept next to the user config so it survives across runs / working directories
+    return _default_config_path().parent / "cache.sqlite"
+
+def _default_queue_path() -> Path:
+    return _default_config_path().parent / "jobs.sqlite"
+
+def _default_token_path() -> Path:
+    return _default_config_path().parent / "daemon.token"
+
 def load_config():
     candidates: list[Path] = []
     
@@ -52,8 +89,34 @@ def load_config():
         username=config.get("SpotifyCreds", "username")
     )
 
+    api_settings = SpotifyApiSettings(
+        api_url=config.get("SpotifyApi", "api_url", fallback="") or "https://api.spotify.com/v1",
+        token_url=config.get("SpotifyApi", "token_url", fallback="") or "https://accounts.spotify.com/api/token",
+        requests_per_second=config.getfloat("SpotifyApi", "requests_per_second", fallback=10),
+        page_workers=config.getint("SpotifyApi", "page_workers", fallback=4),
+        max_rate_limit_wait=config.getfloat("SpotifyApi", "max_rate_limit_wait", fallback=600),
+    )
+
     download_settings = Download(
         output_path=config.get("Download", "output_path")
     )
 
-    return spotify_creds, download_settings
\ No newline at end of file
+    cache_settings = CacheSettings(
+        enabled=config.getboolean("Cache", "enabled", fallback=True),
+        path=config.get("Cache", "path", fallback="") or str(_default_cache_path()),
+        ttl_hours=config.getfloat("Cache", "ttl_hours", fallback=168),
+        max_mb=config.getfloat("Cache", "max_mb", fallback=256),
+    )
+
+    daemon_settings = DaemonSettings(
+        host=config.get("Daemon", "host", fallback="") or "127.0.0.1",
+        port=config.getint("Daemon", "port", fallback=8765),
+        interval_minutes=config.getfloat("Daemon", "interval_minutes", fallback=60),
+        # one url per line (or separated by spaces)
+        watch=config.get("Daemon", "watch", fallback="").split(),
+        queue_path=config.get("Daemon", "queue_path", fallback="") or str(_default_queue_path()),
+        token=config.get("Daemon", "token", fallback=""),
+        token_path=config.get("Daemon", "token_path", fallback="") or str(_default_token_path()),
+    )
+
+    return spotify_creds, download_settings, cache_settings, api_settings, daemon_settings
\ No newline at end of file
@@ -0,0 +1,123 @@
+import hashlib
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from .sessions import get_http_session
+
+# URLs share this many locks, so a long run doesn't keep one lock per cover it ever fetched
+URL_LOCK_STRIPES = 64
+
+def download_image_bytes(url: str, timeout=20) -> bytes:
+    r = get_http_session().get(url, timeout=timeout)
+    r.raise_for_status()
+    return r.content
+
+def normalize_cover_to_jpeg(img_bytes: bytes, max_size=(600, 600), quality=85) -> bytes:
+    """
+    Converts any image to a reasonably-sized JPEG for iPod friendliness.
+    """
+    from PIL import Image
+
+    im = Image.open(io.BytesIO(img_bytes)).convert("RGB")
+    im.thumbnail(max_size)  # keeps aspect ratio
+    out = io.BytesIO()
+    im.save(out, format="JPEG", quality=quality, optimize=False)
+    return out.getvalue()
+
+
+class CoverCache:
+    """
+    Cover URL -> normalized JPEG bytes.
+    Every unique URL is fetched and resized once, even when several workers ask for it at
+    the same time. With a cover_dir (and a cache.CacheStore for the URL index) the JPEGs
+    are kept on disk under their sha256, so identical images share one file across runs.
+    """
+
+    def __init__(self, cover_dir: Optional[str] = None, store=None, max_size=(500, 500), quality=85,
+                 memory_items: int = 64):
+        self.cover_dir = cover_dir
+        self.store = store if cover_dir else None
+        self.max_size = max_size
+        self.quality = quality
+        # small LRU in front of the disk; album tracks hit it back to back
+        self._memory = OrderedDict()
+        self._memory_items = memory_items
+        self._url_locks = [threading.Lock() for _ in range(URL_LOCK_STRIPES)]
+        self._guard = threading.Lock()
+        if self.cover_dir:
+            os.makedirs(self.cover_dir, exist_ok=True)
+        if self.store:
+            self.store.execute(
+                "CREATE TABLE IF NOT EXISTS cover_urls ("
+                " url TEXT PRIMARY KEY, sha256 TEXT NOT NULL, fetched_at REAL NOT NULL)"
+            )
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.cover_dir, digest + ".jpg")
+
+    def _lock_for(self, url: str) -> threading.Lock:
+        # two URLs on one stripe just wait for each other
+        return self._url_locks[hash(url) % len(self._url_locks)]
+
+    def _load(self, url: str) -> Optional[bytes]:
+        if not self.store:
+            return None
+        rows = self.store.execute("SELECT sha256 FROM cover_urls WHERE url = ?", (url,))
+        if not rows:
+            return None
+        try:
+            with open(self._path(rows[0][0]), "rb") as f:
+                return f.read()
+        except OSError:
+            # file was cleaned up behind our back, fetch it again
+            return None
+
+    def _save(self, url: str, jpeg: bytes):
+        digest = hashlib.sha256(jpeg).hexdigest()
+        path = self._path(digest)
+        if not os.path.exists(path):
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(jpeg)
+            os.replace(tmp, path)
+        if self.store:
+            self.store.execute(
+                "INSERT OR REPLACE INTO cover_urls (url, sha256, fetched_at) VALUES (?, ?, ?)",
+                (url, digest, time.time()),
+            )
+
+    def _remember(self, url: str, jpeg: bytes):
+        with self._guard:
+            self._memory[url] = jpeg
+            self._memory.move_to_end(url)
+            while len(self._memory) > self._memory_items:
+                self._memory.popitem(last=False)
+
+    def _recall(self, url: str) -> Optional[bytes]:
+        with self._guard:
+            jpeg = self._memory.get(url)
+            if jpeg is not None:
+                self._memory.move_to_end(url)
+            return jpeg
+
+    def get(self, url: str) -> bytes:
+        jpeg = self._recall(url)
+        if jpeg is not None:
+            return jpeg
+        with self._lock_for(url):
+            # another worker may have fetched it while we waited for the lock
+            jpeg = self._recall(url)
+            if jpeg is not None:
+                return jpeg
+            jpeg = self._load(url)
+            if jpeg is None:
+                raw = download_image_bytes(url)
+                jpeg = normalize_cover_to_jpeg(raw, max_size=self.max_size, quality=self.quality)
+                if self.cover_dir:
+                    self._save(url, jpeg)
+            self._remember(url, jpeg)
+            return jpeg
@@ -1,65 +1,61 @@
 import csv
+import json
+from dataclasses import asdict
 
-def write_tracklist_csv(csv_path, list_title, list_tracks, tracklist_artists, release_date, sort_mode: str = "keep"):
-    # sort_mode: "keep" for playlist order, "album" for album order (ie by disc and track number)
-    fieldnames = [
-        "Track Name",
-        "Artist Name(s)",
-        "Genre",
-        "Album Name",
-        "Album Artist(s)",
-        "Tracklist Name",
-        "Tracklist Artist(s)",
-        "Release Date",
-        "Duration (ms)",
-        "Disc Number",
-        "Track Number",
-        "Spotify Track ID",
-        "Spotify Track URL",
-        "Cover URL",
-    ]
-
-    tracklist_artists_str = "; ".join(tracklist_artists or [])
-
-    if sort_mode == "album":
-        #  safe sort even if None
-        def k(x):
-            d = x.get("disc_number") or 0
-            n = x.get("track_number") or 0
-            return (d, n)
-        tracks_sorted = sorted(list_tracks, key=k)
-    else:
-        # keep incoming order (playlist order)
-        tracks_sorted = list_tracks
+from .tracks import CSV_FIELDS, Track, Tracklist, finalize_tracks
 
+def write_tracks_csv(csv_path, tracks):
+    # one row per Track, tracklist fields are expected to be filled in already (see finalize_tracks)
     with open(csv_path, "w", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=fieldnames)
+        w = csv.DictWriter(f, fieldnames=CSV_FIELDS)
         w.writeheader()
+        for t in tracks:
+            w.writerow(t.to_row())
 
-        for t in tracks_sorted:
-            album_obj = t.get("album") or {}
-            album_name = album_obj.get("name") or "Unknown"
-            album_artists = album_obj.get("artists") or (tracklist_artists or [])
-            album_artists_str = "; ".join(album_artists)
-            genre = (t.get("genre") or "").strip()
-
-            w.writerow({
-                "Track Name": t["title"] or "",
-                "Artist Name(s)": "; ".join(t["artists"] or []),
-                "Genre": genre,
-                "Album Name": album_name,
-                "Album Artist(s)": album_artists_str,
-                "Tracklist Name": list_title,
-                "Tracklist Artist(s)": tracklist_artists_str,
-                "Release Date": album_obj.get("release_date") or release_date or "",
-                "Duration (ms)": t["duration_ms"] or 0,
-                "Disc Number": t["disc_number"] or "",
-                "Track Number": t["track_number"] or "",
-                "Spotify Track ID": t["spotify_id"] or "",
-                "Spotify Track URL": t["spotify_url"] or "",
-                "Cover URL": t.get("cover_url") or "",
-            })
+def write_tracklist_csv(csv_path, list_title, list_tracks, tracklist_artists, release_date, sort_mode: str = "keep"):
+    # sort_mode: "keep" for playlist order, "album" for album order (ie by disc and track number)
+    write_tracks_csv(csv_path, finalize_tracks(list_tracks, list_title, tracklist_artists, release_date, sort_mode))
 
 def read_tracklist_csv(csv_path: str) -> list[dict]:
     with open(csv_path, newline="", encoding="utf-8") as f:
-        return list(csv.DictReader(f))
\ No newline at end of file
+        return list(csv.DictReader(f))
+
+def read_tracks_csv(csv_path: str) -> list[Track]:
+    return [Track.from_row(row) for row in read_tracklist_csv(csv_path)]
+
+def write_tracklist_json(json_path, tracklist: Tracklist):
+    # {"name", "artists", "release_date", "kind", "tracks": [Track fields...]}; tracks are written as they
+    # are iterated, so a streamed tracklist is never held in memory
+    with open(json_path, "w", encoding="utf-8") as f:
+        header = {"name": tracklist.name, "artists": list(tracklist.artists), "release_date": tracklist.release_date,
+                  "kind": tracklist.kind}
+        f.write("{" + "".join(f"{json.dumps(key)}: {json.dumps(value, ensure_ascii=False)}, "
+                              for key, value in header.items()) + '"tracks": [')
+        for n, t in enumerate(tracklist.tracks):
+            f.write(("," if n else "") + "\n  " + json.dumps(asdict(t), ensure_ascii=False))
+        f.write("\n]}\n")
+
+def read_tracklist_json(json_path: str) -> Tracklist:
+    with open(json_path, encoding="utf-8") as f:
+        data = json.load(f)
+    return Tracklist(
+        name=data.get("name") or "",
+        artists=list(data.get("artists") or []),
+        release_date=data.get("release_date") or "",
+        tracks=[Track(**t) for t in data.get("tracks") or []],
+        kind=data.get("kind") or "",
+    )
+
+def read_tracklist(csv_path: str) -> Tracklist:
+    # a previously exported tracklist (CSV, or JSON from write_tracklist_json);
+    # for CSV, name / artists / date come from the first row
+    if csv_path.lower().endswith(".json"):
+        return read_tracklist_json(csv_path)
+    tracks = read_tracks_csv(csv_path)
+    first = tracks[0] if tracks else Track(title="")
+    return Tracklist(
+        name=first.tracklist_name,
+        artists=list(first.tracklist_artists),
+        release_date=first.release_date,
+        tracks=tracks,
+    )
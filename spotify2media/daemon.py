@@ -0,0 +1,351 @@
+import hmac
+import json
+import os
+import re
+import secrets
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+from .cache import CacheStore
+from .spotify_api import SpotifyAPI
+from .spotify_client import fetch_tracklists, parse_spotify_url
+from .sync import PRUNE_MODES, sync_tracklists_to_media
+from .youtube_handler import convert_tracklists_to_media
+
+JOB_MODES = ("download", "sync")
+JOB_STATUSES = ("queued", "running", "done", "failed", "cancelled")
+FORMATS = ("mp3", "wav", "flac", "m4a")
+
+class JobQueue:
+    """
+    Download / sync jobs in a sqlite file, served oldest first. The queue outlives the daemon:
+    jobs still queued are picked up after a restart, and a job that was running when the daemon
+    stopped goes back to the queue.
+    """
+
+    def __init__(self, path: str):
+        self.store = CacheStore(path)
+        self.store.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, mode TEXT NOT NULL, urls TEXT NOT NULL,"
+            " options TEXT NOT NULL, source TEXT NOT NULL, status TEXT NOT NULL, created REAL NOT NULL,"
+            " started REAL, finished REAL, error TEXT, result TEXT)"
+        )
+        self.store.execute("UPDATE jobs SET status = 'queued', started = NULL WHERE status = 'running'")
+        # set whenever a job is added, so the worker doesn't have to poll
+        self.wakeup = threading.Event()
+
+    @staticmethod
+    def _job(row) -> dict:
+        id_, mode, urls, options, source, status, created, started, finished, error, result = row
+        return {
+            "id": id_, "mode": mode, "urls": json.loads(urls), "options": json.loads(options),
+            "source": source, "status": status, "created": created, "started": started,
+            "finished": finished, "error": error, "result": json.loads(result) if result else None,
+        }
+
+    def add(self, mode: str, urls: list, options: Optional[dict] = None, source: str = "http") -> int:
+        with self.store.lock:
+            self.store.execute(
+                "INSERT INTO jobs (mode, urls, options, source, status, created) VALUES (?, ?, ?, ?, 'queued', ?)",
+                (mode, json.dumps(urls), json.dumps(options or {}), source, time.time()),
+            )
+            job_id = self.store.execute("SELECT last_insert_rowid()")[0][0]
+        self.wakeup.set()
+        return job_id
+
+    def get(self, job_id: int) -> Optional[dict]:
+        rows = self.store.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return self._job(rows[0]) if rows else None
+
+    def list(self, limit: int = 50, status: Optional[str] = None) -> list:
+        if status:
+            rows = self.store.execute("SELECT * FROM jobs WHERE status = ? ORDER BY id DESC LIMIT ?", (status, limit))
+        else:
+            rows = self.store.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,))
+        return [self._job(r) for r in rows]
+
+    def counts(self) -> dict:
+        return dict(self.store.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"))
+
+    def has_pending(self, source: str) -> bool:
+        rows = self.store.execute(
+            "SELECT 1 FROM jobs WHERE source = ? AND status IN ('queued', 'running') LIMIT 1", (source,)
+        )
+        return bool(rows)
+
+    def claim(self) -> Optional[dict]:
+        # oldest queued job, marked running in the same locked step
+        with self.store.lock:
+            rows = self.store.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1")
+            if not rows:
+                return None
+            job = self._job(rows[0])
+            self.store.execute("UPDATE jobs SET status = 'running', started = ? WHERE id = ?", (time.time(), job["id"]))
+        return job
+
+    def finish(self, job_id: int, result=None, error: str = ""):
+        self.store.execute(
+            "UPDATE jobs SET status = ?, finished = ?, error = ?, result = ? WHERE id = ?",
+            ("failed" if error else "done", time.time(), error, json.dumps(result), job_id),
+        )
+
+    def cancel(self, job_id: int) -> bool:
+        # only jobs that haven't started can be cancelled
+        with self.store.lock:
+            rows = self.store.execute("SELECT status FROM jobs WHERE id = ?", (job_id,))
+            if not rows or rows[0][0] != "queued":
+                return False
+            self.store.execute("UPDATE jobs SET status = 'cancelled', finished = ? WHERE id = ?", (time.time(), job_id))
+        return True
+
+    def close(self):
+        self.store.close()
+
+def load_token(settings) -> str:
+    # the configured token, or the one in token_path, created (readable by the owner only) on first start
+    if settings.token:
+        return settings.token
+    try:
+        with open(settings.token_path, encoding="utf-8") as f:
+            token = f.read().strip()
+        if token:
+            return token
+    except FileNotFoundError:
+        pass
+    token = secrets.token_urlsafe(32)
+    os.makedirs(os.path.dirname(os.path.abspath(settings.token_path)), exist_ok=True)
+    fd = os.open(settings.token_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(token + "\n")
+    return token
+
+def validate_job(body: dict, output_root: str) -> tuple:
+    # (mode, urls, options) from a POST /jobs body, ValueError on anything that can't be run.
+    # output is taken relative to output_root and has to stay inside it; options get the resolved path
+    if not isinstance(body, dict):
+        raise ValueError("expected a JSON object")
+    mode = body.get("mode", "download")
+    if mode not in JOB_MODES:
+        raise ValueError(f"mode must be one of {', '.join(JOB_MODES)}")
+    urls = body.get("urls")
+    if isinstance(urls, str):
+        urls = [urls]
+    if not isinstance(urls, list) or not urls or not all(isinstance(u, str) for u in urls):
+        raise ValueError("urls must be a non-empty list of Spotify URLs")
+    for url in urls:
+        parse_spotify_url(url)
+    options = body.get("options")
+    if options is None:
+        options = {}
+    if not isinstance(options, dict):
+        raise ValueError("options must be a JSON object")
+    unknown = set(options) - {"output", "format", "sort", "numbered", "prune"}
+    if unknown:
+        raise ValueError(f"unknown options: {', '.join(sorted(unknown))}")
+    if options.get("format", "mp3") not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    if options.get("sort", "album") not in ("keep", "album"):
+        raise ValueError("sort must be keep or album")
+    if not isinstance(options.get("numbered", True), bool):
+        raise ValueError("numbered must be true or false")
+    if options.get("prune", "keep") not in PRUNE_MODES:
+        raise ValueError(f"prune must be one of {', '.join(PRUNE_MODES)}")
+    if "output" in options:
+        if not isinstance(options["output"], str) or not options["output"].strip():
+            raise ValueError("output must be a folder name")
+        root = os.path.realpath(output_root)
+        output = os.path.realpath(os.path.join(root, options["output"]))
+        if os.path.commonpath([root, output]) != root:
+            raise ValueError(f"output must be inside {root}")
+        options = dict(options, output=output)
+    return mode, urls, options
+
+class Daemon:
+    """
+    Long-running downloader: one Spotify client (one access token), open caches and a warm
+    transcode process pool shared by every job. Jobs come from the persistent JobQueue, fed by
+    the local HTTP endpoint and by a watcher that queues a sync of the watched URLs every interval.
+
+    defaults: output / format / sort / numbered / prune used when a job doesn't set them.
+    download_kwargs: passed to every convert_tracklists_to_media / sync_tracklists_to_media call.
+    """
+
+    def __init__(self, creds, api_settings, daemon_settings, queue: JobQueue, defaults: dict,
+                 caches=None, download_kwargs: Optional[dict] = None, watch: Optional[list] = None):
+        self.creds = creds
+        self.settings = daemon_settings
+        self.queue = queue
+        self.defaults = defaults
+        self.caches = caches
+        self.watch = watch if watch is not None else daemon_settings.watch
+        self.spotify = SpotifyAPI(creds.client_id, creds.client_secret, **(vars(api_settings) if api_settings else {}))
+        self.download_kwargs = dict(download_kwargs or {})
+        if caches:
+            self.download_kwargs.update(match_index=caches.matches, cover_cache=caches.covers)
+        self.transcode_pool = ProcessPoolExecutor(max_workers=self.download_kwargs.get("transcode_jobs") or None)
+        self.download_kwargs["transcode_pool"] = self.transcode_pool
+        self.stop = threading.Event()
+        self.current = None
+        self.server = None
+        self.token = load_token(daemon_settings)
+
+    def run_job(self, job: dict) -> list:
+        # checked again here too: the job may have been queued by an older version
+        _, _, options = validate_job({"mode": job["mode"], "urls": job["urls"], "options": job["options"]},
+                                     self.defaults["output"])
+        opts = {**self.defaults, **options}
+        tracklists = fetch_tracklists(
+            self.creds.client_id, self.creds.client_secret, job["urls"], opts["sort"],
+            cache=self.caches and self.caches.metadata, stream=job["mode"] == "download", spotify=self.spotify,
+        )
+        kwargs = dict(self.download_kwargs, audio_format=opts["format"])
+        if job["mode"] == "sync":
+            manifests = sync_tracklists_to_media(tracklists, opts["output"], opts["numbered"],
+                                                 prune=opts["prune"], **kwargs)
+            return [{"name": t.name, "tracks": len(m["tracks"])} for t, m in zip(tracklists, manifests)]
+        results = convert_tracklists_to_media(tracklists, opts["output"], opts["numbered"], **kwargs)
+        return [{"name": t.name, "downloaded": len(d), "not_found": len(n)} for t, (d, n) in zip(tracklists, results)]
+
+    def watcher(self):
+        interval = max(1.0, self.settings.interval_minutes * 60)
+        while not self.stop.is_set():
+            # a slow sync never piles up a backlog of identical watch jobs
+            if not self.queue.has_pending("watch"):
+                job_id = self.queue.add("sync", self.watch, source="watch")
+                print(f"[daemon] queued job #{job_id}: sync of {len(self.watch)} watched URL(s)")
+            self.stop.wait(interval)
+
+    def work(self):
+        while not self.stop.is_set():
+            job = self.queue.claim()
+            if job is None:
+                self.queue.wakeup.wait(5)
+                self.queue.wakeup.clear()
+                continue
+            self.current = job["id"]
+            print(f"[daemon] job #{job['id']} started: {job['mode']} of {len(job['urls'])} URL(s)")
+            started = time.time()
+            try:
+                result = self.run_job(job)
+            except Exception as e:
+                self.queue.finish(job["id"], error=f"{type(e).__name__}: {e}")
+                print(f"[daemon] job #{job['id']} failed: {e}")
+            else:
+                self.queue.finish(job["id"], result=result)
+                print(f"[daemon] job #{job['id']} done in {time.time() - started:.0f}s")
+            finally:
+                self.current = None
+
+    def serve(self):
+        self.server = ThreadingHTTPServer((self.settings.host, self.settings.port), _handler(self))
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="daemon-http", daemon=True).start()
+        print(f"[daemon] accepting jobs on http://{self.settings.host}:{self.server.server_port}/jobs")
+        if not self.settings.token:
+            print(f"[daemon] requests need 'Authorization: Bearer <token>', token in {self.settings.token_path}")
+        if self.watch:
+            threading.Thread(target=self.watcher, name="daemon-watch", daemon=True).start()
+            print(f"[daemon] watching {len(self.watch)} URL(s) every {self.settings.interval_minutes:g} min")
+
+        def on_signal(signum, frame):
+            raise KeyboardInterrupt
+
+        signal.signal(signal.SIGTERM, on_signal)
+        try:
+            self.work()
+        except KeyboardInterrupt:
+            # the interrupted job is still marked running and is picked up again on the next start
+            print("[daemon] stopping")
+        finally:
+            self.close()
+
+    def close(self):
+        self.stop.set()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+        self.transcode_pool.shutdown(cancel_futures=True)
+
+def _handler(daemon: Daemon):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send(self, body, code: int = 200):
+            data = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _authorized(self) -> bool:
+            # meant for local scripts, not browsers: a request a web page sends carries an Origin,
+            # and a page can't add the token header to a cross-site request without a preflight
+            if self.headers.get("Origin"):
+                self._send({"error": "cross-origin requests are not accepted"}, 403)
+                return False
+            sent = (self.headers.get("Authorization") or "").encode()
+            if not hmac.compare_digest(sent, f"Bearer {daemon.token}".encode()):
+                self._send({"error": "missing or wrong token"}, 401)
+                return False
+            return True
+
+        def _job_id(self, path: str) -> Optional[int]:
+            m = re.fullmatch(r"/jobs/(\d+)", path)
+            return int(m.group(1)) if m else None
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/health":
+                return self._send({"status": "ok", "running": daemon.current, "jobs": daemon.queue.counts()})
+            if not self._authorized():
+                return
+            if url.path == "/jobs":
+                query = parse_qs(url.query)
+                status = query.get("status", [None])[0]
+                if status and status not in JOB_STATUSES:
+                    return self._send({"error": f"status must be one of {', '.join(JOB_STATUSES)}"}, 400)
+                try:
+                    limit = int(query.get("limit", ["50"])[0])
+                except ValueError:
+                    return self._send({"error": "limit must be a number"}, 400)
+                return self._send(daemon.queue.list(limit, status))
+            job_id = self._job_id(url.path)
+            job = daemon.queue.get(job_id) if job_id is not None else None
+            if job is None:
+                return self._send({"error": "not found"}, 404)
+            self._send(job)
+
+        def do_POST(self):
+            if not self._authorized():
+                return
+            if urlparse(self.path).path != "/jobs":
+                return self._send({"error": "not found"}, 404)
+            if (self.headers.get("Content-Type") or "").split(";")[0].strip().lower() != "application/json":
+                return self._send({"error": "Content-Type must be application/json"}, 415)
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                mode, urls, options = validate_job(body, daemon.defaults["output"])
+            except ValueError as e:
+                return self._send({"error": str(e)}, 400)
+            job_id = daemon.queue.add(mode, urls, options)
+            self._send({"id": job_id, "status": "queued"}, 202)
+
+        def do_DELETE(self):
+            if not self._authorized():
+                return
+            job_id = self._job_id(urlparse(self.path).path)
+            if job_id is None or daemon.queue.get(job_id) is None:
+                return self._send({"error": "not found"}, 404)
+            if not daemon.queue.cancel(job_id):
+                return self._send({"error": "only queued jobs can be cancelled"}, 409)
+            self._send({"id": job_id, "status": "cancelled"})
+
+    return Handler
@@ -0,0 +1,114 @@
+import errno
+import random
+import re
+import socket
+import time
+from typing import NamedTuple
+
+from .scheduler import is_throttled
+
+# failure classes, in the order they appear in _not_found.csv
+TRANSIENT = "transient"        # network blip, timeout, 5xx, 403 / 429: try the same thing again
+UNAVAILABLE = "unavailable"    # removed / private / blocked video: move on to the next match
+POSTPROCESS = "postprocess"    # ffmpeg or tag write failed on a good download: redoing the search won't help
+LOCAL_IO = "local_io"          # disk full, permissions, read-only output folder
+
+ERROR_CLASSES = (TRANSIENT, UNAVAILABLE, POSTPROCESS, LOCAL_IO)
+
+# _not_found.csv column with each class's count for the track
+ERROR_COLUMNS = {
+    TRANSIENT: "Network Errors",
+    UNAVAILABLE: "Unavailable Errors",
+    POSTPROCESS: "Post-process Errors",
+    LOCAL_IO: "Local I/O Errors",
+}
+
+# what a track that failed with each class gets as its Error
+ERROR_MESSAGES = {
+    TRANSIENT: "Network error",
+    UNAVAILABLE: "No valid download",
+    POSTPROCESS: "Post-process failed",
+    LOCAL_IO: "Local I/O error",
+}
+
+class RetryPolicy(NamedTuple):
+    retries: int        # extra attempts at the stage that failed
+    base_delay: float   # seconds before the first retry, doubled for every further one
+    max_delay: float
+
+RETRY_POLICIES = {
+    TRANSIENT: RetryPolicy(retries=3, base_delay=1.0, max_delay=15.0),
+    UNAVAILABLE: RetryPolicy(retries=0, base_delay=0.0, max_delay=0.0),
+    POSTPROCESS: RetryPolicy(retries=1, base_delay=0.5, max_delay=0.5),
+    LOCAL_IO: RetryPolicy(retries=2, base_delay=2.0, max_delay=10.0),
+}
+
+# yt-dlp folds the cause into the DownloadError text, so most of the classifying is on the message
+_TRANSIENT_RE = re.compile(
+    r"timed? ?out|connection (reset|refused|aborted)|remote end closed|temporary failure in name resolution|"
+    r"name or service not known|network is unreachable|incompleteread|\bssl\b|HTTP Error 5\d\d|"
+    r"unable to download (webpage|api page)|giving up after",
+    re.IGNORECASE,
+)
+_UNAVAILABLE_RE = re.compile(
+    r"video unavailable|private video|not available|has been removed|copyright|"
+    r"sign in to confirm|members.only|blocked|terminated|HTTP Error (404|410)",
+    re.IGNORECASE,
+)
+_LOCAL_IO_RE = re.compile(r"no space left|disk quota|permission denied|read-only file system", re.IGNORECASE)
+_LOCAL_ERRNOS = {errno.ENOSPC, errno.EACCES, errno.EPERM, errno.EROFS, errno.EMFILE,
+                 errno.ENAMETOOLONG, errno.ENOENT, errno.EISDIR,
+                 getattr(errno, "EDQUOT", errno.ENOSPC)}
+
+class ClassifiedError(Exception):
+    """An error that used up its class's retries. kind is one of ERROR_CLASSES, the cause is chained."""
+
+    def __init__(self, kind: str, error: BaseException):
+        super().__init__(str(error))
+        self.kind = kind
+        self.error = error
+
+def classify(error: BaseException, default: str = UNAVAILABLE) -> str:
+    # default: what an unrecognised error means at the stage that raised it
+    if isinstance(error, ClassifiedError):
+        return error.kind
+    if isinstance(error, (ConnectionError, TimeoutError, socket.timeout, socket.gaierror)):
+        return TRANSIENT
+    message = str(error)
+    if is_throttled(error) or _TRANSIENT_RE.search(message):
+        return TRANSIENT
+    if _LOCAL_IO_RE.search(message):
+        return LOCAL_IO
+    if isinstance(error, OSError) and error.errno in _LOCAL_ERRNOS:
+        return LOCAL_IO
+    if _UNAVAILABLE_RE.search(message):
+        return UNAVAILABLE
+    return default
+
+def backoff_delay(policy: RetryPolicy, attempt: int) -> float:
+    # exponential with jitter (half fixed, half random), so workers that failed together don't retry together
+    delay = min(policy.max_delay, policy.base_delay * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+def call_with_retries(fn, default: str, counts: dict, on_retry=None, policies: dict = RETRY_POLICIES):
+    """
+    Calls fn() until it succeeds or an error's class has no retries left, then raises
+    ClassifiedError. Every error is counted in counts[kind]; on_retry(kind, error, delay) runs
+    before each jittered backoff sleep (e.g. to log or to notify the download scheduler).
+    """
+    attempts = {}
+    while True:
+        try:
+            return fn()
+        except Exception as e:
+            kind = classify(e, default)
+            counts[kind] = counts.get(kind, 0) + 1
+            attempt = attempts.get(kind, 0)
+            policy = policies[kind]
+            if attempt >= policy.retries:
+                raise ClassifiedError(kind, e) from e
+            attempts[kind] = attempt + 1
+            delay = backoff_delay(policy, attempt)
+            if on_retry:
+                on_retry(kind, e, delay)
+            time.sleep(delay)
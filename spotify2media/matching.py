@@ -0,0 +1,115 @@
+import re
+import unicodedata
+
+# candidates further than this from the spotify duration are never picked
+MAX_DURATION_DELTA = 30
+
+# minimum total score for a candidate to be downloaded at all
+MIN_SCORE = 25.0
+
+WEIGHTS = {
+    "duration": 40.0,
+    "title": 30.0,
+    "artist": 15.0,
+    "topic_channel": 10.0,
+    "official": 5.0,
+}
+
+# words that mark a different version of the song, and what finding one costs
+VERSION_PENALTIES = {
+    "live": 25.0,
+    "cover": 25.0,
+    "remix": 20.0,
+    "karaoke": 30.0,
+    "instrumental": 20.0,
+    "acoustic": 10.0,
+    "sped up": 20.0,
+    "slowed": 20.0,
+    "nightcore": 25.0,
+    "8d": 15.0,
+    "reverb": 10.0,
+}
+
+def normalize_text(text: str) -> str:
+    # lowercase ascii-ish text with punctuation collapsed to single spaces
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"[^\w\s]", " ", text.lower())
+    return re.sub(r"\s+", " ", text).strip()
+
+def _tokens(text: str) -> set:
+    return set(normalize_text(text).split())
+
+def _has_phrase(normalized: str, phrase: str) -> bool:
+    return re.search(rf"\b{re.escape(phrase)}\b", normalized) is not None
+
+def score_candidate(entry: dict, track_name: str, artist: str, duration_s=None):
+    """
+    Scores one YouTube search result against the spotify track.
+    Returns (total, breakdown) where breakdown holds each component and the total;
+    total is None when the candidate is rejected outright (duration too far off).
+    """
+    title = entry.get("title") or ""
+    channel = entry.get("channel") or entry.get("uploader") or ""
+    norm_title = normalize_text(title)
+    norm_track = normalize_text(track_name)
+    breakdown = {}
+
+    video_duration = entry.get("duration")
+    if duration_s and video_duration:
+        delta = abs(float(video_duration) - duration_s)
+        breakdown["duration_delta"] = round(delta, 1)
+        if delta > MAX_DURATION_DELTA:
+            breakdown["total"] = None
+            return None, breakdown
+        breakdown["duration"] = WEIGHTS["duration"] * (1 - delta / MAX_DURATION_DELTA)
+    else:
+        # unknown duration: neutral rather than a reason to reject
+        breakdown["duration"] = WEIGHTS["duration"] / 2
+
+    track_tokens = _tokens(track_name)
+    title_tokens = _tokens(title)
+    if track_tokens:
+        breakdown["title"] = WEIGHTS["title"] * len(track_tokens & title_tokens) / len(track_tokens)
+    else:
+        breakdown["title"] = 0.0
+
+    artist_tokens = _tokens(artist)
+    if artist_tokens:
+        seen = title_tokens | _tokens(channel)
+        breakdown["artist"] = WEIGHTS["artist"] * len(artist_tokens & seen) / len(artist_tokens)
+    else:
+        breakdown["artist"] = 0.0
+
+    channel_bonus = 0.0
+    if channel.endswith(" - Topic"):
+        # auto-generated "Artist - Topic" channels carry the studio release
+        channel_bonus += WEIGHTS["topic_channel"]
+    if "official" in norm_title or "official" in channel.lower() or channel.lower().endswith("vevo"):
+        channel_bonus += WEIGHTS["official"]
+    breakdown["channel"] = channel_bonus
+
+    penalty = 0.0
+    for phrase, cost in VERSION_PENALTIES.items():
+        # only a penalty when the spotify track isn't itself that version
+        if _has_phrase(norm_title, phrase) and not _has_phrase(norm_track, phrase):
+            penalty += cost
+    breakdown["penalty"] = -penalty if penalty else 0.0
+
+    total = breakdown["duration"] + breakdown["title"] + breakdown["artist"] + channel_bonus - penalty
+    breakdown = {k: (round(v, 1) if isinstance(v, float) else v) for k, v in breakdown.items()}
+    breakdown["total"] = round(total, 1)
+    return total, breakdown
+
+def rank_candidates(entries, track_name: str, artist: str, duration_s=None, min_score: float = MIN_SCORE):
+    # returns [(entry, breakdown)] best first, dropping rejected and low scoring candidates
+    ranked = []
+    for entry in entries or []:
+        if not entry:
+            continue
+        total, breakdown = score_candidate(entry, track_name, artist, duration_s)
+        if total is None or total < min_score:
+            continue
+        ranked.append((total, entry, breakdown))
+    ranked.sort(key=lambda r: r[0], reverse=True)
+    return [(entry, breakdown) for _, entry, breakdown in ranked]
@@ -0,0 +1,135 @@
+import itertools
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Iterable, Optional
+
+
+@dataclass
+class Stage:
+    name: str
+    # func(job) -> name of the stage the job goes to next, or None once the job is finished
+    func: Callable
+    workers: int = 1
+    # size of the queue in front of the stage, 0 means unbounded
+    maxsize: int = 0
+
+
+def run_pipeline(jobs: Iterable, stages: list, on_done: Optional[Callable] = None, max_pending: int = 0,
+                 on_stage: Optional[Callable] = None):
+    """
+    Pushes jobs through a chain of stages, each with its own worker threads and queue.
+
+    Only the first stage's queue is unbounded: any stage may hand a job back to it
+    (e.g. to retry with the next search) without deadlocking against the backpressure
+    of the bounded queues further down. Jobs waiting in the first queue are served in
+    the order they were fed.
+
+    jobs may be a lazy iterator; it is consumed as the pipeline runs, and with
+    max_pending > 0 no more than that many jobs are in flight at once, so feeding
+    from a paged source keeps memory flat. An exception raised by the iterator is
+    re-raised once the jobs fed before it have finished.
+
+    on_stage(stage_name, job, seconds) is called from the worker after every stage
+    call, with the time the stage function took. An exception from on_done or
+    on_stage doesn't hold the job up; the first one is re-raised once the pipeline
+    has shut down.
+    """
+    if not stages:
+        raise ValueError("Pipeline needs at least one stage")
+
+    first = stages[0].name
+    queues = {}
+    for stage in stages:
+        if stage.name == first:
+            queues[stage.name] = queue.PriorityQueue()
+        else:
+            queues[stage.name] = queue.Queue(maxsize=stage.maxsize)
+
+    order = {}
+    counter = itertools.count()
+    lock = threading.Lock()
+    all_done = threading.Condition(lock)
+    state = {"fed": 0, "finished": 0}
+    callback_errors = []
+
+    def put(stage_name, job):
+        if stage_name == first:
+            queues[first].put((order[id(job)], next(counter), job))
+        else:
+            queues[stage_name].put(job)
+
+    def finish(job):
+        with lock:
+            try:
+                if on_done:
+                    on_done(job)
+            except Exception as e:
+                # counted as finished all the same, or the join below would wait for it forever
+                callback_errors.append(e)
+            order.pop(id(job), None)
+            state["finished"] += 1
+            all_done.notify_all()
+
+    def worker(stage):
+        q = queues[stage.name]
+        while True:
+            item = q.get()
+            job = item[2] if stage.name == first else item
+            if job is None:
+                return
+            started = time.perf_counter()
+            try:
+                next_stage = stage.func(job)
+            except Exception as e:
+                # stage functions handle their own errors, this only keeps the pipeline alive
+                job.error = f"{type(e).__name__}: {e}"
+                next_stage = None
+            if on_stage:
+                try:
+                    on_stage(stage.name, job, time.perf_counter() - started)
+                except Exception as e:
+                    # the job carries on, a dead worker would leave it unfinished
+                    with lock:
+                        callback_errors.append(e)
+            if next_stage is None:
+                finish(job)
+            else:
+                put(next_stage, job)
+
+    threads = []
+    for stage in stages:
+        for _ in range(max(1, stage.workers)):
+            t = threading.Thread(target=worker, args=(stage,), name=f"{stage.name}-worker", daemon=True)
+            t.start()
+            threads.append((stage.name, t))
+
+    feed_error = None
+    try:
+        for n, job in enumerate(jobs):
+            with all_done:
+                while max_pending and state["fed"] - state["finished"] >= max_pending:
+                    all_done.wait()
+                state["fed"] += 1
+            order[id(job)] = n
+            put(first, job)
+    except Exception as e:
+        feed_error = e
+
+    with all_done:
+        while state["finished"] < state["fed"]:
+            all_done.wait()
+
+    # wake every worker with a sentinel, sorting before any real entry in the first queue
+    for name, _ in threads:
+        if name == first:
+            queues[name].put((-1, -1, None))
+        else:
+            queues[name].put(None)
+    for _, t in threads:
+        t.join()
+    if feed_error:
+        raise feed_error
+    if callback_errors:
+        raise callback_errors[0]
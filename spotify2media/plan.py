@@ -0,0 +1,340 @@
+import glob
+import json
+import os
+import shutil
+import time
+import zlib
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+from .errors import ERROR_MESSAGES, UNAVAILABLE, ClassifiedError, call_with_retries
+from .matching import rank_candidates
+from .pipeline import Stage, run_pipeline
+from .sync import load_manifest, save_manifest
+from .tracks import Track, Tracklist
+from .transcode import format_ext
+from .youtube_handler import (SEARCH_OPTIONS, convert_tracklists_to_media, not_found_csv_path, safe_filename,
+                              search_query, track_basename, write_not_found_csv)
+
+# a plan is a JSON lines file: a header line ({"plan": PLAN_VERSION, "format", "numbered", "tracklists"})
+# followed by one line per track, in tracklist order; a track refers to its tracklist by the header's "id"
+PLAN_VERSION = 1
+# each shard's results, written into the root of the folder it downloaded to
+SHARD_RESULT_GLOB = ".plan-shard-*.json"
+
+def parse_shard(text: str) -> tuple:
+    # "2/4" -> (2, 4), shards are numbered from 1
+    try:
+        i, n = (int(part) for part in str(text).split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard: {text!r} (use i/N, e.g. 2/4)")
+    if not 1 <= i <= n:
+        raise ValueError(f"Invalid shard: {text!r} (i must be between 1 and N)")
+    return i, n
+
+def shard_of(spotify_id: str, shards: int) -> int:
+    # by spotify id rather than position, so every copy of a track lands on the same shard and is
+    # downloaded once there; crc32 because hash() changes between interpreter runs
+    return zlib.crc32(spotify_id.encode("utf-8")) % shards + 1
+
+def read_plan(plan_path: str) -> tuple:
+    # returns (header, records)
+    with open(plan_path, encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f if line.strip()]
+    if not lines or lines[0].get("plan") != PLAN_VERSION:
+        raise ValueError(f"{plan_path} is not a playlist-maker plan (version {PLAN_VERSION})")
+    return lines[0], lines[1:]
+
+def _plan_tracklists(tracklists) -> list:
+    # header entries: the spotify URI as key (the position for tracklists from a csv) and a name for the
+    # folder, both unique in the plan, since two playlists can share a name and a URL can be given twice
+    metas = []
+    keys, folders = set(), set()
+    for n, tracklist in enumerate(tracklists, start=1):
+        key = tracklist.spotify_uri or f"tracklist:{n}"
+        if key in keys:
+            key = f"{key}#{n}"
+        name, copy = tracklist.name, 1
+        while safe_filename(name).lower() in folders:
+            copy += 1
+            name = f"{tracklist.name} ({copy})"
+        keys.add(key)
+        folders.add(safe_filename(name).lower())
+        metas.append({"id": key, "name": name})
+    return metas
+
+@dataclass
+class PlanJob:
+    track: Track
+    # the chosen video: video_url, video_id, video_title, video_duration, score
+    match: Optional[dict] = None
+    error: str = ""
+    metrics: dict = field(default_factory=dict)
+
+def resolve_tracklists(tracklists, plan_path: str, numbered_tracks: bool = True, audio_format: str = "mp3",
+                       search_jobs: int = 4, search_results: int = 8, match_index=None, refresh_matches: bool = False,
+                       ydl_factory=None) -> dict:
+    """
+    Searches YouTube for every track of the tracklists without downloading anything, and writes the
+    chosen video, the expected duration, the target file name and the tags of each track to a
+    JSON lines plan for execute_plan. A track listed several times is searched once; remembered
+    matches (match_index) are used as they are unless refresh_matches is set.
+    Returns counts: tracks, matched, failed.
+    """
+    from .sessions import YdlPool
+
+    ext = format_ext(audio_format)
+    ydl_pool = YdlPool({"search": SEARCH_OPTIONS}, factory=ydl_factory)
+    tracklists = list(tracklists)
+    metas = _plan_tracklists(tracklists)
+    # (tracklist key, position, track, job); the job is shared by every copy of a track
+    entries = []
+    first_seen = {}
+    done = [0]
+
+    def feed():
+        for tracklist, meta in zip(tracklists, metas):
+            for i, track in enumerate(tracklist.tracks, start=1):
+                job = first_seen.get(track.spotify_id) if track.spotify_id else None
+                new = track.spotify_id and job is None
+                if new:
+                    job = first_seen[track.spotify_id] = PlanJob(track)
+                entries.append((meta["id"], i, track, job))
+                if new:
+                    yield job
+
+    def resolve(job: PlanJob):
+        track = job.track
+        match = match_index.get(track.spotify_id) if match_index and not refresh_matches else None
+        if match:
+            job.match = {"video_url": match["video_url"], "video_id": None, "video_title": match.get("title"),
+                         "video_duration": match.get("duration"), "score": match.get("score")}
+            return None
+        q = search_query(track)
+        try:
+            results = call_with_retries(
+                lambda: ydl_pool.get("search").extract_info(f"ytsearch{search_results}:{q}", download=False),
+                UNAVAILABLE, job.metrics.setdefault("errors", {}),
+            )
+        except ClassifiedError as e:
+            job.error = 'Search failed' if e.kind == UNAVAILABLE else ERROR_MESSAGES[e.kind]
+            return None
+        candidates = rank_candidates(results.get('entries') or [], track.title or 'Unknown',
+                                     track.primary_artist or 'Unknown', track.duration_s)
+        if not candidates:
+            job.error = 'No valid download'
+            return None
+        entry, breakdown = candidates[0]
+        job.match = {"video_url": entry.get('webpage_url') or entry.get('url'), "video_id": entry.get('id'),
+                     "video_title": entry.get('title'), "video_duration": entry.get('duration'), "score": breakdown}
+        return None
+
+    def on_done(job: PlanJob):
+        done[0] += 1
+        result = job.match["video_title"] if job.match else job.error
+        print(f"[{done[0]}] {job.track.title} -> {result}")
+
+    started = time.time()
+    run_pipeline(feed(), [Stage("resolve", resolve, workers=max(1, int(search_jobs or 1)))],
+                 on_done=on_done, max_pending=4 * max(1, int(search_jobs or 1)))
+    ydl_pool.close()
+
+    counts = {"tracks": len(entries), "matched": 0, "failed": 0}
+    sizes = {}
+    for key, _, _, _ in entries:
+        sizes[key] = sizes.get(key, 0) + 1
+    names = {meta["id"]: meta["name"] for meta in metas}
+    header = {
+        "plan": PLAN_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "format": audio_format,
+        "numbered": numbered_tracks,
+        "tracklists": [dict(meta, tracks=sizes.get(meta["id"], 0)) for meta in metas],
+    }
+    tmp = plan_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(json.dumps(header, ensure_ascii=False) + "\n")
+        for key, i, track, job in entries:
+            match = job.match if job else None
+            counts["matched" if match else "failed"] += 1
+            record = {
+                "tracklist_id": key,
+                "tracklist": names[key],
+                "index": i,
+                "file": track_basename(i, track.title or 'Unknown', numbered_tracks) + ext,
+                "spotify_id": track.spotify_id,
+                "duration": track.duration_s,
+                **(match or {"video_url": None}),
+                "error": "" if match else (job.error if job else "No Spotify track ID"),
+                "track": asdict(track),
+            }
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    os.replace(tmp, plan_path)
+    print(f"Plan written to {plan_path} in {time.time() - started:.0f}s: {counts['matched']} of "
+          f"{counts['tracks']} tracks matched, {counts['failed']} without a match.")
+    return counts
+
+class PlanMatches:
+    """
+    Match index (see cache.MatchIndex) that answers with the videos chosen in a plan, so execute_plan
+    downloads them without searching again. A planned video that fails to download is forgotten and
+    the track is searched for on the spot; set / forget also go to fallback (e.g. the on-disk index).
+    """
+
+    def __init__(self, records: list, fallback=None):
+        self.fallback = fallback
+        self.matches = {
+            r["spotify_id"]: {"video_url": r["video_url"], "title": r.get("video_title") or "",
+                              "duration": r.get("video_duration"), "score": r.get("score")}
+            for r in records if r.get("spotify_id") and r.get("video_url")
+        }
+
+    def get(self, spotify_id: str) -> Optional[dict]:
+        return self.matches.get(spotify_id) or (self.fallback.get(spotify_id) if self.fallback else None)
+
+    def set(self, spotify_id: str, video_url: str, **kwargs):
+        if self.fallback:
+            self.fallback.set(spotify_id, video_url, **kwargs)
+
+    def forget(self, spotify_id: str):
+        self.matches.pop(spotify_id, None)
+        if self.fallback:
+            self.fallback.forget(spotify_id)
+
+def execute_plan(plan_path: str, output_path: str, shard: tuple = (1, 1), match_index=None, **download_kwargs) -> list:
+    """
+    Downloads shard i of N of a plan (see shard_of) into output_path, with the plan's format, numbering
+    and tags, and writes the shard's results next to the tracklist folders for merge_shards.
+    Any node can run any shard; the result depends only on the plan. download_kwargs go to
+    convert_tracklists_to_media. Returns one (downloaded, not_found) pair per tracklist of the shard.
+    """
+    header, records = read_plan(plan_path)
+    i, n = shard
+    by_tracklist = {}
+    for r in records:
+        by_tracklist.setdefault(r["tracklist_id"], []).append(r)
+    tracklists = []
+    keys = []
+    only_ids = []
+    for meta in header["tracklists"]:
+        own = by_tracklist.get(meta["id"], [])
+        ids = {r["spotify_id"] for r in own if r["spotify_id"] and shard_of(r["spotify_id"], n) == i}
+        if ids:
+            # the whole tracklist, so file numbering matches the plan; only ids are downloaded
+            tracks = [Track(**r["track"]) for r in sorted(own, key=lambda r: r["index"])]
+            tracklists.append(Tracklist(name=meta["name"], artists=[], release_date="", tracks=tracks))
+            keys.append(meta["id"])
+            only_ids.append(ids)
+    print(f"Shard {i}/{n}: {sum(len(ids) for ids in only_ids)} tracks in {len(tracklists)} tracklists")
+
+    results = convert_tracklists_to_media(
+        tracklists, output_path, header["numbered"], only_ids=only_ids, audio_format=header["format"],
+        match_index=PlanMatches(records, fallback=match_index), refresh_matches=False, **download_kwargs
+    ) if tracklists else []
+
+    result_path = os.path.join(output_path, f".plan-shard-{i}-of-{n}.json")
+    os.makedirs(output_path, exist_ok=True)
+    with open(result_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "plan": header["created"],
+            "shard": [i, n],
+            "tracklists": [{"id": key, "name": t.name, "downloaded": d, "not_found": nf}
+                           for key, t, (d, nf) in zip(keys, tracklists, results)],
+        }, f, indent=2, ensure_ascii=False)
+    return results
+
+def _not_found_row(record: dict, error: str) -> dict:
+    track = Track(**record["track"])
+    return {"Track Name": track.title or 'Unknown', "Artist Name(s)": track.primary_artist or 'Unknown',
+            "Album Name": track.album or 'Unknown', "Track Number": record["index"], "Error": error}
+
+def merge_shards(shard_dirs: list, output_path: str, plan_path: Optional[str] = None) -> dict:
+    """
+    Collects the output folders of executed shards into one tree under output_path: moves the
+    files, joins the download archives and _not_found reports and records every file in the
+    folder's sync manifest, so `sync` can take over from there. With the plan, tracks that no
+    merged shard accounts for (shards not run or not copied over yet) are reported.
+    Returns {tracklist name: (downloaded, not_found)}.
+    """
+    # by tracklist key (see _plan_tracklists)
+    merged = {}
+    names = {}
+    shards_seen = set()
+    for shard_dir in shard_dirs:
+        result_files = sorted(glob.glob(os.path.join(shard_dir, SHARD_RESULT_GLOB)))
+        if not result_files:
+            print(f"Warning: no shard results in {shard_dir}")
+        for result_file in result_files:
+            with open(result_file, encoding="utf-8") as f:
+                result = json.load(f)
+            shards_seen.add(tuple(result["shard"]))
+            for tl in result["tracklists"]:
+                name = names[tl["id"]] = tl["name"]
+                src_dir = os.path.join(shard_dir, safe_filename(name))
+                dst_dir = os.path.join(output_path, safe_filename(name))
+                os.makedirs(dst_dir, exist_ok=True)
+                downloaded, not_found, archive = merged.setdefault(tl["id"], ([], [], set()))
+                for entry in tl["downloaded"]:
+                    src = os.path.join(src_dir, entry["File"])
+                    dst = os.path.join(dst_dir, entry["File"])
+                    if os.path.abspath(src) != os.path.abspath(dst):
+                        if os.path.exists(src):
+                            shutil.move(src, dst)
+                        elif not os.path.exists(dst):
+                            print(f"Warning: {src} is missing")
+                            continue
+                    downloaded.append(entry)
+                not_found.extend(tl["not_found"])
+                for folder in (src_dir, dst_dir):
+                    try:
+                        with open(os.path.join(folder, "downloaded.txt"), encoding="utf-8") as f:
+                            archive.update(line.strip() for line in f if line.strip())
+                    except FileNotFoundError:
+                        pass
+
+    if plan_path:
+        _, records = read_plan(plan_path)
+        splits = {n for _, n in shards_seen}
+        # when every merged shard comes from the same split, a planned track is missing if its shard is
+        shards = splits.pop() if len(splits) == 1 else None
+        accounted = {key: {e["Track Number"] for e in d + nf} for key, (d, nf, _) in merged.items()}
+        for r in records:
+            if r["index"] in accounted.get(r["tracklist_id"], ()):
+                continue
+            if not r["spotify_id"]:
+                error = r["error"]  # never part of a shard
+            elif shards is None or (shard_of(r["spotify_id"], shards), shards) not in shards_seen:
+                error = "Shard not merged"
+            else:
+                continue
+            names.setdefault(r["tracklist_id"], r["tracklist"])
+            merged.setdefault(r["tracklist_id"], ([], [], set()))[1].append(_not_found_row(r, error))
+        if shards:
+            missing = sorted(set(range(1, shards + 1)) - {i for i, _ in shards_seen})
+            if missing:
+                print(f"Warning: shards {', '.join(f'{i}/{shards}' for i in missing)} not merged")
+
+    for key, (downloaded, not_found, archive) in merged.items():
+        name = names[key]
+        dst_dir = os.path.join(output_path, safe_filename(name))
+        os.makedirs(dst_dir, exist_ok=True)
+        downloaded.sort(key=lambda r: r["Track Number"])
+        not_found.sort(key=lambda r: r["Track Number"])
+        with open(os.path.join(dst_dir, "downloaded.txt"), "w", encoding="utf-8") as f:
+            f.writelines(line + "\n" for line in sorted(archive))
+        nf_path = not_found_csv_path(dst_dir, name)
+        if not_found:
+            write_not_found_csv(nf_path, not_found)
+        elif os.path.exists(nf_path):
+            os.remove(nf_path)
+        # a track listed twice keeps the file of its first position, like plan_sync
+        tracks = {}
+        for entry in downloaded:
+            if entry.get("Spotify Track ID"):
+                tracks.setdefault(entry["Spotify Track ID"], {"file": entry["File"], "position": entry["Track Number"]})
+        manifest = load_manifest(dst_dir)
+        manifest["tracks"].update(tracks)
+        manifest["synced_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        save_manifest(dst_dir, manifest)
+        print(f"{name}: {len(downloaded)} tracks downloaded, {len(not_found)} not found. Merged into {dst_dir}")
+    return {names[key]: (d, nf) for key, (d, nf, _) in merged.items()}
@@ -0,0 +1,134 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+
+from .sync import MANIFEST_NAME, REMOVED_DIR, load_manifest
+from .transcode import FORMATS
+
+AUDIO_EXTS = tuple(f["ext"] for f in FORMATS.values())
+
+def find_library_files(root: str) -> list:
+    # every audio file below root, skipping _removed/ and hidden folders (.staging)
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d != REMOVED_DIR and not d.startswith("."))
+        paths += [os.path.join(dirpath, f) for f in sorted(filenames)
+                  if f.lower().endswith(AUDIO_EXTS) and not f.startswith(".")]
+    return paths
+
+def map_library(paths: list, pool=None) -> tuple:
+    """
+    Maps audio files back to spotify track ids. A folder's sync manifest is used where there is one,
+    the SPOTIFY_TRACK_ID tag of the file otherwise (read in pool when given, e.g. a process pool).
+    Returns ({spotify_id: [paths]}, unmapped paths). A file hardlinked into several folders is
+    listed once, since tagging one name changes them all.
+    """
+    from .tagging import read_spotify_id
+
+    manifests = {}
+    by_id = {}
+    unread = []
+    seen = set()
+    for path in paths:
+        st = os.stat(path)
+        if st.st_nlink > 1:
+            if (st.st_dev, st.st_ino) in seen:
+                continue
+            seen.add((st.st_dev, st.st_ino))
+        folder, name = os.path.split(path)
+        if folder not in manifests:
+            manifest = load_manifest(folder) if os.path.exists(os.path.join(folder, MANIFEST_NAME)) else {"tracks": {}}
+            manifests[folder] = {entry["file"]: sid for sid, entry in manifest["tracks"].items() if entry.get("file")}
+        spotify_id = manifests[folder].get(name)
+        if spotify_id:
+            by_id.setdefault(spotify_id, []).append(path)
+        else:
+            unread.append(path)
+
+    ids = pool.map(read_spotify_id, unread, chunksize=32) if pool else map(read_spotify_id, unread)
+    unmapped = []
+    for path, spotify_id in zip(unread, ids):
+        if spotify_id:
+            by_id.setdefault(spotify_id, []).append(path)
+        else:
+            unmapped.append(path)
+    return by_id, unmapped
+
+def retag_library(client_id, client_secret, root: str, cache=None, cover_cache=None, api_settings=None,
+                  jobs=None, covers: bool = True, on_request=None) -> dict:
+    """
+    Rewrites the tags (and cover) of every file below root from current Spotify metadata, without
+    downloading any audio. Files are mapped to tracks with map_library, the metadata comes from
+    Spotify in batches of 50 tracks and the tag writes run in a process pool of `jobs` processes.
+
+    Album, track and disc number are left as they are in each file: they depend on the tracklist
+    the file was downloaded for (e.g. a playlist kept in order) rather than on the track.
+    Returns counts: files, retagged, failed, unmapped (no spotify id), unknown (id spotify doesn't know).
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    from .covers import CoverCache
+    from .spotify_api import SpotifyAPI
+    from .spotify_client import iter_tracks_by_id
+    from .tagging import write_tags
+
+    started = time.time()
+    paths = find_library_files(root)
+    print(f"Retag: {len(paths)} audio files in {root}")
+    counts = {"files": len(paths), "retagged": 0, "failed": 0, "unmapped": 0, "unknown": 0}
+    if not paths:
+        return counts
+
+    if covers:
+        cover_cache = cover_cache or CoverCache(max_size=(500, 500), quality=85)
+    else:
+        cover_cache = None
+    with ProcessPoolExecutor(max_workers=jobs) as pool, ThreadPoolExecutor(max_workers=8) as cover_pool:
+        by_id, unmapped = map_library(paths, pool)
+        counts["unmapped"] = len(unmapped)
+        for path in unmapped:
+            print(f"    No Spotify track ID: {os.path.relpath(path, root)}")
+
+        spotify = SpotifyAPI(client_id, client_secret, **(vars(api_settings) if api_settings else {}),
+                             on_request=on_request)
+
+        def cover_for(track):
+            # covers come from spotify's image CDN; a failed fetch keeps the file's current cover
+            if not (cover_cache and track.cover_url):
+                return None
+            try:
+                return cover_cache.get(track.cover_url)
+            except Exception as e:
+                print(f"    Warning: failed to fetch cover for {track.title}: {e}")
+                return None
+
+        pending = []
+        found = set()
+        # tags are written while the next batch of metadata is fetched
+        for tracks in iter_tracks_by_id(spotify, by_id, cache):
+            for track, cover in zip(tracks, cover_pool.map(cover_for, tracks)):
+                found.add(track.spotify_id)
+                # empty fields leave the file's own value in place (see tagging.write_tags)
+                meta = replace(track, album="", track_number=None, disc_number=None)
+                for path in by_id[track.spotify_id]:
+                    pending.append((path, pool.submit(write_tags, path, meta, cover)))
+            print(f"Retag: metadata for {len(found)}/{len(by_id)} tracks")
+
+        for spotify_id in by_id:
+            if spotify_id not in found:
+                counts["unknown"] += len(by_id[spotify_id])
+                print(f"    Unknown to Spotify ({spotify_id}): "
+                      + ", ".join(os.path.relpath(p, root) for p in by_id[spotify_id]))
+        for path, future in pending:
+            try:
+                future.result()
+                counts["retagged"] += 1
+            except Exception as e:
+                counts["failed"] += 1
+                print(f"    Warning: could not re-tag {os.path.relpath(path, root)}: {e}")
+
+    print(f"Retag completed in {time.time() - started:.0f}s. {counts['retagged']} files retagged, "
+          f"{counts['failed']} failed, {counts['unmapped']} without a Spotify track ID, "
+          f"{counts['unknown']} unknown to Spotify.")
+    return counts
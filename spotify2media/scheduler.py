@@ -0,0 +1,163 @@
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# yt-dlp reports HTTP failures as "HTTP Error 429: Too Many Requests" inside its DownloadError text
+_THROTTLE_RE = re.compile(r"HTTP Error (403|429)\b|Too Many Requests", re.IGNORECASE)
+
+def is_throttled(error) -> bool:
+    # a 403 / 429 from YouTube: back off rather than treat the video as broken
+    return bool(_THROTTLE_RE.search(str(error)))
+
+def parse_rate(text: str) -> float:
+    # "500K", "2.5M", "1G" or plain bytes per second; 0 means no cap
+    m = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([kmg]?)(?:i?b)?(?:/s)?\s*", str(text), re.IGNORECASE)
+    if not m:
+        raise ValueError(f"Invalid rate: {text!r} (use e.g. 800K or 2.5M bytes per second)")
+    return float(m.group(1)) * {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}[m.group(2).lower()]
+
+def format_rate(rate: float) -> str:
+    if rate >= 1024 ** 2:
+        return f"{rate / 1024 ** 2:.1f} MB/s"
+    return f"{rate / 1024:.0f} KB/s"
+
+class DownloadScheduler:
+    """
+    Admission control for the download stage, shared by every download worker.
+
+    slot() lets at most `limit` downloads run at once. With adaptive=True the limit moves
+    between min_jobs and max_jobs AIMD-style: after each round of `limit` finished downloads
+    it grows by one if throughput went up since the last change and drops back by one if it went
+    down; a 403 / 429 halves it and holds back new downloads for an exponential backoff.
+    Without adaptive the limit stays at max_jobs.
+
+    throttle(nbytes) is fed from yt-dlp progress hooks and sleeps as needed to keep all
+    downloads together under max_rate bytes/sec (0 = no cap).
+    """
+
+    def __init__(self, max_jobs: int, adaptive: bool = False, max_rate: float = 0, min_jobs: int = 1,
+                 max_backoff: float = 60):
+        self.max_jobs = max(1, max_jobs)
+        self.min_jobs = max(1, min(min_jobs, self.max_jobs))
+        self.adaptive = adaptive
+        # start at half the allowed parallelism and let throughput earn the rest
+        self.limit = max(self.min_jobs, self.max_jobs // 2) if adaptive else self.max_jobs
+        self.max_rate = max_rate or 0
+        self.max_backoff = max_backoff
+        self.active = 0
+        self.throttled = 0
+        self._cond = threading.Condition()
+        self._paused_until = 0.0
+        self._consecutive_throttles = 0
+        # current round: finished downloads, their bytes and when it started
+        self._round = (0, 0, time.monotonic())
+        self._last_throughput = None
+        # byte budget for the rate cap, same scheme as spotify_api.TokenBucket
+        self._rate_lock = threading.Lock()
+        self._allowance = self.max_rate
+        self._rate_updated = time.monotonic()
+        # bytes seen per file by the progress hook, and a short history for the current rate
+        self._seen = {}
+        self._recent = deque()
+
+    @contextmanager
+    def slot(self):
+        with self._cond:
+            while True:
+                wait = self._paused_until - time.monotonic()
+                if wait <= 0 and self.active < self.limit:
+                    break
+                self._cond.wait(wait if wait > 0 else None)
+            self.active += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.active -= 1
+                self._cond.notify_all()
+
+    def on_success(self, nbytes: int):
+        with self._cond:
+            self._consecutive_throttles = 0
+            done, total_bytes, started = self._round
+            done, total_bytes = done + 1, total_bytes + nbytes
+            if done < self.limit:
+                self._round = (done, total_bytes, started)
+                return
+            throughput = total_bytes / max(1e-6, time.monotonic() - started)
+            if self.adaptive:
+                last = self._last_throughput
+                if last is None or throughput > last * 1.05:
+                    self.limit = min(self.max_jobs, self.limit + 1)
+                elif throughput < last * 0.9:
+                    self.limit = max(self.min_jobs, self.limit - 1)
+            self._last_throughput = throughput
+            self._round = (0, 0, time.monotonic())
+            self._cond.notify_all()
+
+    def on_throttled(self):
+        with self._cond:
+            self.throttled += 1
+            now = time.monotonic()
+            # downloads that were already running when the first 429 came are the same event
+            if now < self._paused_until:
+                return
+            self._consecutive_throttles += 1
+            if self.adaptive:
+                self.limit = max(self.min_jobs, self.limit // 2)
+            backoff = min(self.max_backoff, 2 ** (self._consecutive_throttles - 1))
+            self._paused_until = now + backoff
+            # throughput of the old level says nothing about the new one
+            self._last_throughput = None
+            self._round = (0, 0, time.monotonic())
+
+    def progress_hook(self, d: dict):
+        # yt-dlp progress hook: turns cumulative downloaded_bytes per file into deltas for throttle();
+        # keyed by filename, which (unlike tmpfilename) the "finished" call carries too
+        key = d.get("filename") or d.get("tmpfilename")
+        downloaded = d.get("downloaded_bytes") or 0
+        with self._rate_lock:
+            if d.get("status") != "downloading":
+                self._seen.pop(key, None)
+                return
+            delta = max(0, downloaded - self._seen.get(key, 0))
+            self._seen[key] = downloaded
+        if delta:
+            self.throttle(delta)
+
+    def throttle(self, nbytes: int):
+        now = time.monotonic()
+        with self._rate_lock:
+            self._recent.append((now, nbytes))
+            while self._recent and self._recent[0][0] < now - 5:
+                self._recent.popleft()
+            if not self.max_rate:
+                return
+            # one second worth of bytes may be spent in a burst, anything beyond that waits
+            self._allowance = min(self.max_rate, self._allowance + (now - self._rate_updated) * self.max_rate)
+            self._rate_updated = now
+            self._allowance -= nbytes
+            wait = -self._allowance / self.max_rate if self._allowance < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+    def current_rate(self) -> float:
+        with self._rate_lock:
+            now = time.monotonic()
+            recent = [(t, n) for t, n in self._recent if t >= now - 5]
+        if not recent:
+            return 0.0
+        return sum(n for _, n in recent) / max(1.0, now - recent[0][0])
+
+    def state(self) -> str:
+        # one line for the progress output
+        with self._cond:
+            parts = [f"downloads {self.active}/{self.limit}" + (f" (max {self.max_jobs})" if self.adaptive else "")]
+            paused = self._paused_until - time.monotonic()
+        rate = format_rate(self.current_rate())
+        parts.append(f"{rate} of {format_rate(self.max_rate)}" if self.max_rate else rate)
+        if self.throttled:
+            parts.append(f"{self.throttled} throttled" + (f", paused {paused:.0f}s" if paused > 0 else ""))
+        return ", ".join(parts)
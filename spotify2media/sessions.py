@@ -0,0 +1,58 @@
+import threading
+
+# requests and yt_dlp are imported on first use: together they are most of the package's import time
+
+_http_session = None
+_http_lock = threading.Lock()
+
+def get_http_session(pool_size: int = 32):
+    # process-wide session so cover downloads reuse keep-alive connections instead of a new TLS handshake each
+    global _http_session
+    with _http_lock:
+        if _http_session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _http_session = session
+        return _http_session
+
+
+class YdlPool:
+    """
+    Long-lived YoutubeDL instances, one per (worker thread, strategy).
+    A strategy is a fixed set of options (e.g. "search", "download"); YoutubeDL objects are
+    not safe to share between threads, so every worker builds its own on first use and keeps it.
+    factory builds an instance from an options dict (YoutubeDL unless given, e.g. a stand-in for benchmarks).
+    """
+
+    def __init__(self, strategies: dict, factory=None):
+        self.strategies = strategies
+        if factory is None:
+            from yt_dlp import YoutubeDL as factory
+        self.factory = factory
+        self._local = threading.local()
+        self._all = []
+        self._lock = threading.Lock()
+
+    def get(self, strategy: str):
+        instances = getattr(self._local, "instances", None)
+        if instances is None:
+            instances = self._local.instances = {}
+        ydl = instances.get(strategy)
+        if ydl is None:
+            ydl = instances[strategy] = self.factory(dict(self.strategies[strategy]))
+            with self._lock:
+                self._all.append(ydl)
+        return ydl
+
+    def close(self):
+        with self._lock:
+            for ydl in self._all:
+                close = getattr(ydl, "close", None)
+                if close:
+                    close()
+            self._all.clear()
@@ -0,0 +1,185 @@
+import threading
+import time
+from typing import Optional
+
+import requests
+
+from .sessions import get_http_session
+
+API_URL = "https://api.spotify.com/v1"
+TOKEN_URL = "https://accounts.spotify.com/api/token"
+
+class SpotifyAPIError(Exception):
+    def __init__(self, status: int, message: str, url: str):
+        super().__init__(f"Spotify API {status} for {url}: {message}")
+        self.status = status
+        self.url = url
+
+class TokenBucket:
+    """
+    Allows `rate` requests per second on average, in bursts of up to `burst`.
+    pause() holds back every caller until a Retry-After has passed. rate <= 0 disables the limit.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self.updated:
+                    # paused until self.updated
+                    wait = self.updated - now
+                elif self.rate <= 0:
+                    return
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        # empty the bucket and start refilling only once the pause is over
+        with self._lock:
+            self.tokens = 0
+            self.updated = max(self.updated, time.monotonic() + seconds)
+
+def _retry_after(resp) -> float:
+    try:
+        return max(0.0, float(resp.headers.get("Retry-After", 1)))
+    except ValueError:
+        return 1.0
+
+class SpotifyAPI:
+    """
+    Client-credentials Spotify Web API client for the handful of calls spotify_client makes,
+    with the same method names and return values as spotipy.
+
+    Every request takes a token from a shared TokenBucket. A 429 pauses the bucket for its
+    Retry-After, so all threads back off together; a request that is still rate limited after
+    max_rate_limit_wait seconds raises. 5xx responses and connection errors are
+    retried with exponential backoff, and an expired access token is refreshed once.
+    page_workers tells tracklist paging how many page offsets it may fetch at the same time.
+    api_url / token_url can point at a local fake server.
+    on_request(url, status, seconds) is called after every HTTP attempt (status 0 when the
+    connection failed), e.g. RunReport.on_spotify_request.
+    """
+
+    def __init__(self, client_id: str, client_secret: str, api_url: str = API_URL, token_url: str = TOKEN_URL,
+                 requests_per_second: float = 10.0, page_workers: int = 4, max_retries: int = 5,
+                 max_rate_limit_wait: float = 600, timeout: float = 30, session: Optional[requests.Session] = None,
+                 on_request=None):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.api_url = api_url.rstrip("/")
+        self.token_url = token_url
+        self.limiter = TokenBucket(requests_per_second)
+        self.page_workers = max(1, int(page_workers))
+        self.max_retries = max_retries
+        self.max_rate_limit_wait = max_rate_limit_wait
+        self.timeout = timeout
+        self.session = session or get_http_session()
+        self.on_request = on_request
+        self._token = None
+        self._token_expires = 0.0
+        self._token_lock = threading.Lock()
+
+    def _access_token(self, refresh: bool = False) -> str:
+        with self._token_lock:
+            if refresh or not self._token or time.time() > self._token_expires - 60:
+                resp = self.session.post(
+                    self.token_url,
+                    data={"grant_type": "client_credentials"},
+                    auth=(self.client_id, self.client_secret),
+                    timeout=self.timeout,
+                )
+                if resp.status_code != 200:
+                    raise SpotifyAPIError(resp.status_code, resp.text[:200], self.token_url)
+                data = resp.json()
+                self._token = data["access_token"]
+                self._token_expires = time.time() + float(data.get("expires_in", 3600))
+            return self._token
+
+    def _get(self, url: str, params: Optional[dict] = None) -> dict:
+        if not url.startswith(("http://", "https://")):
+            url = f"{self.api_url}/{url}"
+        params = {k: v for k, v in (params or {}).items() if v is not None}
+        refreshed = False
+        attempt = 0
+        deadline = time.monotonic() + self.max_rate_limit_wait
+        while True:
+            self.limiter.acquire()
+            started = time.perf_counter()
+            try:
+                resp = self.session.get(
+                    url, params=params, timeout=self.timeout,
+                    headers={"Authorization": f"Bearer {self._access_token()}"},
+                )
+            except requests.RequestException:
+                if self.on_request:
+                    self.on_request(url, 0, time.perf_counter() - started)
+                if attempt >= self.max_retries:
+                    raise
+                time.sleep(min(30, 0.5 * 2 ** attempt))
+                attempt += 1
+                continue
+            if self.on_request:
+                self.on_request(url, resp.status_code, time.perf_counter() - started)
+
+            if resp.status_code == 429:
+                # doesn't count as a failed attempt: spotify told us exactly how long to wait
+                wait = _retry_after(resp)
+                if time.monotonic() + wait > deadline:
+                    raise SpotifyAPIError(429, f"still rate limited after {self.max_rate_limit_wait:g}s "
+                                               f"(Retry-After {wait:.0f}s)", url)
+                if wait > 5:
+                    print(f"Spotify rate limit hit, waiting {wait:.0f}s")
+                self.limiter.pause(wait)
+                continue
+            if resp.status_code == 401 and not refreshed:
+                refreshed = True
+                self._access_token(refresh=True)
+                continue
+            if resp.status_code >= 500 and attempt < self.max_retries:
+                time.sleep(min(30, 0.5 * 2 ** attempt))
+                attempt += 1
+                continue
+            if resp.status_code >= 400:
+                raise SpotifyAPIError(resp.status_code, resp.text[:200], url)
+            return resp.json()
+
+    def track(self, track_id: str) -> dict:
+        return self._get(f"tracks/{track_id}")
+
+    def tracks(self, track_ids: list) -> dict:
+        return self._get("tracks", {"ids": ",".join(track_ids)})
+
+    def album(self, album_id: str) -> dict:
+        return self._get(f"albums/{album_id}")
+
+    def album_tracks(self, album_id: str, limit: int = 50, offset: int = 0) -> dict:
+        return self._get(f"albums/{album_id}/tracks", {"limit": limit, "offset": offset})
+
+    def playlist(self, playlist_id: str, fields: Optional[str] = None) -> dict:
+        return self._get(f"playlists/{playlist_id}", {"fields": fields})
+
+    def playlist_items(self, playlist_id: str, fields: Optional[str] = None, limit: int = 100, offset: int = 0) -> dict:
+        return self._get(f"playlists/{playlist_id}/tracks",
+                         {"fields": fields, "limit": limit, "offset": offset, "additional_types": "track"})
+
+    def artist(self, artist_id: str) -> dict:
+        return self._get(f"artists/{artist_id}")
+
+    def artists(self, artist_ids: list) -> dict:
+        return self._get("artists", {"ids": ",".join(artist_ids)})
+
+    def next(self, result: dict) -> Optional[dict]:
+        return self._get(result["next"]) if result.get("next") else None
@@ -1,31 +1,80 @@
-import spotipy
-import spotipy.oauth2 as oauth2
+import itertools
 import re
-import os
-import tempfile
-import csv
-from .youtube_handler import convert_csv_to_media
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from .spotify_api import SpotifyAPI
+from .tracks import Track, Tracklist, finalize_tracks, iter_finalized
 
 # cache for artist genres to minimize API calls
 artist_genre_cache = {}
-def get_primary_genre(spotify, artist_id: str) -> str:
-    cached = artist_genre_cache.get(artist_id)
-    if cached is not None:
-        return cached[0] if cached else ""
-    try:
-        artist = spotify.artist(artist_id)
-        genres = artist.get("genres", [])
-        if not isinstance(genres, list):
-            genres = []
-        genres = [genre.capitalize() for genre in genres]
-            
-        artist_genre_cache[artist_id] = genres
-
-        #print(f"Fetched genres for artist {artist_id}: {genres}")
-        return genres[0] if genres else ""
-    except Exception:
-        artist_genre_cache[artist_id] = []
-        return ""
+
+# spotify's several-artists / several-tracks endpoints accept at most 50 ids per call
+ARTISTS_BATCH_SIZE = 50
+TRACKS_BATCH_SIZE = 50
+
+# largest page sizes the tracklist endpoints allow
+ALBUM_PAGE_SIZE = 50
+PLAYLIST_PAGE_SIZE = 100
+
+# only what _playlist_track reads, keeps each page a fraction of the full item json
+PLAYLIST_ITEM_FIELDS = (
+    "items(added_at,track(id,name,duration_ms,track_number,disc_number,external_urls(spotify),"
+    "artists(id,name),album(name,release_date,artists(name),images))),next,total"
+)
+
+def _artist_genres(artist) -> list:
+    genres = (artist or {}).get("genres", [])
+    if not isinstance(genres, list):
+        genres = []
+    return [genre.capitalize() for genre in genres]
+
+def fetch_artist_genres(spotify, artist_ids, cache=None):
+    # resolves every uncached artist with batched spotify.artists calls
+    missing = []
+    for artist_id in artist_ids:
+        if artist_id and artist_id not in artist_genre_cache and artist_id not in missing:
+            missing.append(artist_id)
+
+    if cache and missing:
+        artist_genre_cache.update(cache.get_many("artist_genres", missing))
+        missing = [a for a in missing if a not in artist_genre_cache]
+
+    for start in range(0, len(missing), ARTISTS_BATCH_SIZE):
+        batch = missing[start:start + ARTISTS_BATCH_SIZE]
+        try:
+            artists = spotify.artists(batch).get("artists") or []
+        except Exception:
+            # fall back to single lookups so one bad id (or a blip) doesn't cost the whole batch;
+            # artists that still fail stay uncached and are retried next time
+            for artist_id in batch:
+                try:
+                    artist_genre_cache[artist_id] = _artist_genres(spotify.artist(artist_id))
+                except Exception:
+                    pass
+            continue
+
+        for artist_id, artist in zip(batch, artists):
+            # spotify returns null for unknown ids
+            artist_genre_cache[artist_id] = _artist_genres(artist)
+
+        #print(f"Fetched genres for {len(batch)} artists")
+
+    if cache:
+        cache.set_many("artist_genres", {a: artist_genre_cache[a] for a in missing if a in artist_genre_cache})
+
+def get_primary_genre(spotify, artist_id: str, cache=None) -> str:
+    if artist_id not in artist_genre_cache:
+        fetch_artist_genres(spotify, [artist_id], cache)
+    genres = artist_genre_cache.get(artist_id)
+    return genres[0] if genres else ""
+
+def fill_genres(spotify, tracks, cache=None):
+    # sets each track's genre from its primary artist, looking all artists up in batches first
+    primary_ids = [t.artist_ids[0] if t.artist_ids else None for t in tracks]
+    fetch_artist_genres(spotify, primary_ids, cache)
+    for t, artist_id in zip(tracks, primary_ids):
+        genres = artist_genre_cache.get(artist_id) if artist_id else None
+        t.genre = genres[0] if genres else ""
 
 def parse_spotify_url(url: str):
     m = re.compile(r"open\.spotify\.com/(track|playlist|album)/([a-zA-Z0-9]+)", re.IGNORECASE).search(url)
@@ -35,214 +84,249 @@ def parse_spotify_url(url: str):
     spotify_id = m.group(2)
     return content_type, spotify_id
 
-def handle_spotify_track(spotify, track_id):
-    track = spotify.track(track_id)
-    track_number = track['track_number']
-    disc_number = track['disc_number']
-    track_name = track['name']
+def _cached(cache, kind, key, fetch):
+    # returns the cached response for (kind, key), calling fetch() and storing the result on a miss
+    if cache:
+        value = cache.get(kind, key)
+        if value is not None:
+            return value
+    value = fetch()
+    if cache:
+        cache.set(kind, key, value)
+    return value
+
+def _full_track(track, spotify_id=None) -> Track:
+    # a full track object (tracks endpoints), genre still unset
     artists = track['artists']
-    artists_names = [a['name'] for a in artists]
-    duration_ms = track['duration_ms']
-    track_url = track['external_urls']['spotify']
-
     album = track['album']
+    images = album['images'] or []
+
+    return Track(
+        title=track['name'],
+        artists=[a['name'] for a in artists],
+        album=album['name'],
+        album_artists=[a['name'] for a in album['artists']],
+        release_date=album['release_date'],
+        duration_ms=track['duration_ms'],
+        disc_number=track['disc_number'],
+        track_number=track['track_number'],
+        spotify_id=spotify_id or track['id'],
+        spotify_url=track['external_urls']['spotify'],
+        cover_url=images[0]['url'] if images else "",
+        artist_ids=[a["id"] for a in artists if a.get("id")],
+    )
+
+def handle_spotify_track(spotify, track_id, cache=None) -> Tracklist:
+    track = _cached(cache, "track", track_id, lambda: spotify.track(track_id))
+    t = _full_track(track, track_id)
+    fill_genres(spotify, [t], cache)
+
+    tracks = finalize_tracks([t], t.title, t.artists, t.release_date)
+    return Tracklist(name=t.title, artists=t.artists, release_date=t.release_date, tracks=tracks, total=1,
+                     kind="track", spotify_id=track_id)
+
+def iter_tracks_by_id(spotify, track_ids, cache=None):
+    """
+    Yields the Tracks of track_ids one batch (one several-tracks request) at a time, with genres.
+    Always asks spotify, so corrected metadata shows up; the cache only serves artist genres.
+    Ids spotify doesn't know are left out.
+    """
+    track_ids = list(track_ids)
+    for start in range(0, len(track_ids), TRACKS_BATCH_SIZE):
+        batch = track_ids[start:start + TRACKS_BATCH_SIZE]
+        found = spotify.tracks(batch).get("tracks") or []
+        # spotify returns null for unknown ids, in request order
+        tracks = [_full_track(t, track_id) for track_id, t in zip(batch, found) if t]
+        fill_genres(spotify, tracks, cache)
+        yield tracks
+
+def _iter_pages(fetch_page, page_size, offset=0, total=None, workers=1, cache=None, kind="", key=""):
+    """
+    Yields the items of one page at a time, in order. Each page is fetched (or read from the cache)
+    on demand; once the total is known (given, or from the first page) up to `workers` of the
+    following offsets are fetched concurrently, never more than that ahead of the consumer.
+    """
+    def fetch(page_offset):
+        return _cached(cache, kind, f"{key}:{page_offset}", lambda: fetch_page(page_offset))
+
+    if total is None:
+        page = fetch(offset)
+        items = page.get('items') or []
+        yield items
+        if not page.get('next') or not items:
+            return
+        offset += page_size
+        total = page.get('total')
+
+    if total is None or workers <= 1:
+        while True:
+            page = fetch(offset)
+            items = page.get('items') or []
+            yield items
+            offset += page_size
+            if not page.get('next') or not items:
+                return
+
+    offsets = iter(range(offset, total, page_size))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        window = deque(pool.submit(fetch, o) for o in itertools.islice(offsets, workers))
+        while window:
+            page = window.popleft().result()
+            for o in itertools.islice(offsets, 1):
+                window.append(pool.submit(fetch, o))
+            yield page.get('items') or []
+
+def _album_track(t, album_title, album_artists, release_date, cover_url) -> Track:
+    artist_objs = t.get("artists") or []
+    return Track(
+        title=t['name'],
+        artists=[a.get("name", "") for a in artist_objs if a.get("name")],
+        album=album_title,
+        album_artists=album_artists,
+        release_date=release_date,
+        duration_ms=t['duration_ms'],
+        disc_number=t['disc_number'],
+        track_number=t['track_number'],
+        spotify_id=t['id'],
+        spotify_url=t['external_urls']['spotify'],
+        cover_url=cover_url,
+        artist_ids=[a.get("id") for a in artist_objs if a.get("id")],
+    )
+
+def _iter_album_tracks(spotify, album_id, album, cache=None):
     album_title = album['name']
     album_artists = [a['name'] for a in album['artists']]
     release_date = album['release_date']
     images = album['images'] or []
-
-    artist_ids = [a["id"] for a in artists if a.get("id")]
-    primary_artist_id = artist_ids[0] if artist_ids else None
-    genre = get_primary_genre(spotify, primary_artist_id) if primary_artist_id else ""
-
     cover_url = images[0]['url'] if images else ""
 
-    track_list = []
-    track_list.append({
-        'track_number': track_number,
-        'disc_number': disc_number,
-        'title': track_name,
-        'artists': artists_names,
-        'artists_ids': artist_ids,
-        'genre': genre,
-        'duration_ms': duration_ms,
-        'spotify_id': track_id,
-        'spotify_url': track_url,
-        'album': {
-            'name': album_title,
-            'artists': album_artists,
-            'release_date': release_date,
-        },
-        'cover_url': cover_url,
-    })
-
-    return track_name, artists_names, release_date, track_list
-    
-    # fd, csv_path = tempfile.mkstemp(suffix=".csv")
-    # os.close(fd)
-
-    # try:
-    #     write_tracklist_csv(spotify, csv_path, track_name, track_list, artists_names, release_date)
-    #     convert_csv_to_media(csv_path, output_path, track_name, numbered_tracks=False)
-    # finally:
-    #     # delete temp csv file
-    #     try:
-    #         if os.path.exists(csv_path):
-    #             os.remove(csv_path)
-    #     except Exception as e:
-    #         print(f"Warning: could not delete temporary file {csv_path}: {e}")
-
-
-def handle_spotify_album(spotify, album_id):
-    album = spotify.album(album_id)
+    # the album response already carries the first page of tracks
+    first = album.get('tracks') or {}
+    pages = [first.get('items') or []]
+    if first.get('next'):
+        pages = itertools.chain(pages, _iter_pages(
+            lambda offset: spotify.album_tracks(album_id, limit=ALBUM_PAGE_SIZE, offset=offset),
+            ALBUM_PAGE_SIZE, offset=len(pages[0]), total=first.get('total'),
+            workers=getattr(spotify, "page_workers", 1), cache=cache, kind="album_page", key=album_id,
+        ))
+
+    for items in pages:
+        page_tracks = [_album_track(t, album_title, album_artists, release_date, cover_url) for t in items]
+        # one batched genre lookup per page
+        fill_genres(spotify, page_tracks, cache)
+        yield from page_tracks
+
+def handle_spotify_album(spotify, album_id, cache=None) -> Tracklist:
+    album = _cached(cache, "album_info", album_id, lambda: spotify.album(album_id))
     album_title = album['name']
     album_artists = [a['name'] for a in album['artists']]
     release_date = album['release_date']
-    images = album['images'] or []
-    cover_url = images[0]['url'] if images else ""
 
-    # pagination, spotify returns max 50 trackers per request
-    tracks = []
-    results = spotify.album_tracks(album_id, limit=50)
-    while results:
-        tracks.extend(results['items'])
-        results = spotify.next(results) if results['next'] else None
-
-    album_tracks = []
-    for t in tracks:
-        artist_objs = t.get("artists") or []
-        artist_names = [a.get("name", "") for a in artist_objs if a.get("name")]
-        artist_ids = [a.get("id") for a in artist_objs if a.get("id")]
-
-        primary_artist_id = artist_ids[0] if artist_ids else None
-        genre = get_primary_genre(spotify, primary_artist_id) if primary_artist_id else ""
-
-        
-        album_tracks.append({
-            'track_number': t['track_number'],
-            'disc_number': t['disc_number'],
-            'title': t['name'],
-            'artists': artist_names,
-            'artists_ids': artist_ids,
-            'genre': genre,
-            'duration_ms': t['duration_ms'],
-            'spotify_id': t['id'],
-            'spotify_url': t['external_urls']['spotify'],
-            'album': {
-                'name': album_title,
-                'artists': album_artists,
-                'release_date': release_date,
-            },
-            'cover_url': cover_url,
-        })
-    
-    return album_title, album_artists, release_date, album_tracks
-
-    # fd, csv_path = tempfile.mkstemp(suffix=".csv")
-    # os.close(fd)
-
-    # try:
-    #     write_tracklist_csv(spotify, csv_path, album_title, album_tracks, album_artists, release_date, sort_mode="album")
-    #     convert_csv_to_media(csv_path, output_path, album_title, numbered_tracks=True)
-    # finally:
-    #     # delete temp csv file
-    #     try:
-    #         if os.path.exists(csv_path):
-    #             os.remove(csv_path)
-    #     except Exception as e:
-    #         print(f"Warning: could not delete temporary file {csv_path}: {e}")
-
-def handle_spotify_playlist(spotify, playlist_id, keep_sort, use_album_name=False):
-    playlist = spotify.playlist(playlist_id)
-    playlist_title = playlist['name']
-    playlist_owner = playlist['owner']['display_name'] or playlist['owner']['id']
+    # spotify already lists album tracks by disc and track number, so they can be streamed as-is
+    tracks = iter_finalized(_iter_album_tracks(spotify, album_id, album, cache), album_title, album_artists, release_date)
+    return Tracklist(name=album_title, artists=album_artists, release_date=release_date,
+                     tracks=tracks, total=album.get('total_tracks'), kind="album", spotify_id=album_id)
 
-    # pagination, spotify returns max 50 trackers per request
-    items = []
-    results = spotify.playlist_items(playlist_id, limit=50)
-    while results:
-        items.extend(results['items'])
-        results = spotify.next(results) if results['next'] else None
-
-    playlist_tracks = []
-    added_dates = []
+def _playlist_track(item, track_number, playlist_title, keep_sort) -> Track:
+    track = item['track']
+    album = track.get('album') or {}
+    images = album.get('images') or []
+    cover_url = images[0]['url'] if images else ""
+    use_album_name = not keep_sort
+
+    return Track(
+        title=track['name'],
+        artists=[a['name'] for a in track['artists']],
+        album=(use_album_name and album.get('name')) or playlist_title,
+        album_artists=[a['name'] for a in album.get('artists', [])],
+        # tracks without an album date fall back to the day they were added
+        release_date=album.get('release_date') or (item.get('added_at') or "")[:10],
+        duration_ms=track['duration_ms'],
+        disc_number=keep_sort and 1 or track['disc_number'],
+        track_number=keep_sort and track_number or track['track_number'],
+        spotify_id=track['id'],
+        spotify_url=track['external_urls']['spotify'],
+        cover_url=cover_url,
+        artist_ids=[a.get("id") for a in (track.get("artists") or []) if a.get("id")],
+    )
+
+def _iter_playlist_tracks(spotify, playlist_id, playlist_title, snapshot_id, keep_sort, total=None, cache=None):
+    # snapshot_id changes whenever the playlist does, so pages of an unchanged playlist come from the cache
+    pages = _iter_pages(
+        lambda offset: spotify.playlist_items(playlist_id, fields=PLAYLIST_ITEM_FIELDS, limit=PLAYLIST_PAGE_SIZE, offset=offset),
+        PLAYLIST_PAGE_SIZE, total=total, workers=getattr(spotify, "page_workers", 1),
+        cache=cache if snapshot_id else None, kind="playlist_page", key=f"{playlist_id}:{snapshot_id}",
+    )
 
     trackNum = 0
+    for items in pages:
+        page_tracks = []
+        for item in items:
+            if not item.get('track'):
+                continue # skip local or unavailable tracks
+            trackNum += 1
+            page_tracks.append(_playlist_track(item, trackNum, playlist_title, keep_sort))
+        # one batched genre lookup per page
+        fill_genres(spotify, page_tracks, cache)
+        yield from page_tracks
+
+def handle_spotify_playlist(spotify, playlist_id, keep_sort, cache=None) -> Tracklist:
+    # only the header is fetched here, items are paged in as the tracklist is consumed
+    playlist = spotify.playlist(playlist_id, fields="name,owner(display_name,id),snapshot_id,tracks(total)")
+    playlist_title = playlist['name']
+    playlist_owner = playlist['owner']['display_name'] or playlist['owner']['id']
+    snapshot_id = playlist.get('snapshot_id') or ""
+    total = (playlist.get('tracks') or {}).get('total')
 
-    for item in items:
-        track = item.get('track')
-        if not track:
-            continue # skip local or unavailable tracks
-
-        added_at = item.get('added_at')
-        if added_at:
-            added_dates.append(added_at)
-        
-        album = track.get('album', {})
-
-        images = album['images'] or []
-        cover_url = images[0]['url'] if images else ""
-
-        artists = [a['name'] for a in track['artists']]
-        artist_ids = [a.get("id") for a in (track.get("artists") or []) if a.get("id")]
-        primary_artist_id = artist_ids[0] if artist_ids else None
-        genre = get_primary_genre(spotify, primary_artist_id) if primary_artist_id else ""
-
-        trackNum += 1
-        use_album_name = not keep_sort
-
-        playlist_tracks.append({
-            'track_number': keep_sort and trackNum or track['track_number'],
-            'disc_number': keep_sort and 1 or track['disc_number'] ,
-            'title': track['name'],
-            'artists': artists,
-            'artists_ids': artist_ids,
-            'genre': genre,
-            'duration_ms': track['duration_ms'],
-            'spotify_id': track['id'],
-            'spotify_url': track['external_urls']['spotify'],
-            'album': {
-                'name': (use_album_name and album.get('name')) or playlist_title,
-                'artists': [a['name'] for a in album.get('artists', [])],
-                'release_date': album.get('release_date'),
-            },
-            'cover_url': cover_url,
-        })
-    
-    # determine playlist release date as the latest added_at date
-    playlist_date = ""
-    if added_dates:
-        playlist_date = max(added_dates)[:10]
-        
-    return playlist_title, playlist_owner, playlist_date, playlist_tracks
-
-    # fd, csv_path = tempfile.mkstemp(suffix=".csv")
-    # os.close(fd)
-
-    # try:
-    #     write_tracklist_csv(spotify, csv_path, playlist_title, playlist_tracks, [playlist_owner], playlist_date, sort_mode="keep")
-    #     convert_csv_to_media(csv_path, output_path, playlist_title, numbered_tracks=True)
-    # finally:
-    #     # delete temp csv file
-    #     try:
-    #         if os.path.exists(csv_path):
-    #             os.remove(csv_path)
-    #     except Exception as e:
-    #         print(f"Warning: could not delete temporary file {csv_path}: {e}")
-
-
-def convert_from_spotify_url(client_id, client_secret, url: str, sort_mode: str):
-    # authenticate with Spotify
-    auth_manager = oauth2.SpotifyClientCredentials(client_id=client_id, client_secret=client_secret)
-    spotify = spotipy.Spotify(auth_manager=auth_manager)
+    tracks = _iter_playlist_tracks(spotify, playlist_id, playlist_title, snapshot_id, keep_sort, total, cache)
+    if keep_sort:
+        tracks = iter_finalized(tracks, playlist_title, [playlist_owner], "")
+    else:
+        # album order sorts across the whole playlist, which needs every page first
+        tracks = finalize_tracks(tracks, playlist_title, [playlist_owner], "", sort_mode="album")
+    return Tracklist(name=playlist_title, artists=[playlist_owner], release_date="",
+                     tracks=tracks, total=total, kind="playlist", spotify_id=playlist_id)
 
+def tracklist_from_url(spotify, url: str, sort_mode: str, cache=None) -> Tracklist:
     content_type, spotify_id = parse_spotify_url(url)
     if content_type == "track":
-        return handle_spotify_track(spotify, spotify_id)
+        return handle_spotify_track(spotify, spotify_id, cache=cache)
     elif content_type == "album":
-        return handle_spotify_album(spotify, spotify_id)
+        return handle_spotify_album(spotify, spotify_id, cache=cache)
     elif content_type == "playlist":
         keep_sort = sort_mode == "keep"
-        return handle_spotify_playlist(spotify, spotify_id, keep_sort=keep_sort)
+        return handle_spotify_playlist(spotify, spotify_id, keep_sort=keep_sort, cache=cache)
     else:
         raise ValueError("Unsupported Spotify content type")
+
+def convert_from_spotify_url(client_id, client_secret, url: str, sort_mode: str, cache=None, api_settings=None,
+                             on_request=None) -> Tracklist:
+    # api_settings: optional SpotifyApiSettings (endpoint, rate limit, page concurrency)
+    spotify = SpotifyAPI(client_id, client_secret, **(vars(api_settings) if api_settings else {}), on_request=on_request)
+    return tracklist_from_url(spotify, url, sort_mode, cache)
+
+def fetch_tracklists(client_id, client_secret, urls, sort_mode: str = "album", cache=None, stream: bool = False,
+                     api_settings=None, on_request=None, spotify=None) -> list:
+    """
+    The tracklists behind several Spotify URLs as Track records, fetched with one client
+    (one access token, one rate limiter, one genre cache).
+    With stream=True, each tracklist's tracks is an iterator that pages through Spotify as it is
+    consumed, so downloads can start on the first page while memory stays flat for any playlist size.
+    Otherwise (and always for playlists in album order) tracks is a complete list.
+    on_request: per-request timing callback, see SpotifyAPI.
+    spotify: an existing SpotifyAPI to reuse (with its access token and rate limiter) instead of a new one.
+    """
+    spotify = spotify or SpotifyAPI(client_id, client_secret, **(vars(api_settings) if api_settings else {}),
+                                    on_request=on_request)
+    tracklists = []
+    for url in urls:
+        tracklist = tracklist_from_url(spotify, url, sort_mode, cache)
+        if not stream and not isinstance(tracklist.tracks, list):
+            tracklist.tracks = list(tracklist.tracks)
+        tracklists.append(tracklist)
+    return tracklists
+
+def fetch_tracklist(client_id, client_secret, url: str, sort_mode: str = "album", cache=None, stream: bool = False,
+                    api_settings=None, on_request=None) -> Tracklist:
+    # single-url fetch_tracklists
+    return fetch_tracklists(client_id, client_secret, [url], sort_mode, cache, stream, api_settings, on_request)[0]
@@ -0,0 +1,173 @@
+import dataclasses
+import json
+import os
+import shutil
+import time
+
+from .csv_io import read_tracks_csv
+from .tracks import Tracklist
+from .youtube_handler import convert_tracklists_to_media, safe_filename, track_basename
+
+# per output directory record of which file belongs to which spotify track
+MANIFEST_NAME = ".playlist-maker.json"
+REMOVED_DIR = "_removed"
+PRUNE_MODES = ("keep", "delete", "move")
+
+def load_manifest(output_dir: str) -> dict:
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    try:
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {"tracks": {}}
+    manifest.setdefault("tracks", {})
+    return manifest
+
+def save_manifest(output_dir: str, manifest: dict):
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, path)
+
+def plan_sync(manifest: dict, tracks: list, output_dir: str, numbered_tracks: bool = True):
+    """
+    Diffs the manifest against the current tracklist.
+    Returns (added, renames, removed):
+      added   - spotify ids with no file yet
+      renames - [(spotify_id, old_file, new_file, track)] for tracks whose position changed
+      removed - [(spotify_id, file)] for tracks no longer in the tracklist
+    A track listed twice is only synced at its first position.
+    """
+    known = manifest["tracks"]
+    wanted = {}
+    added = []
+    renames = []
+
+    for i, track in enumerate(tracks, start=1):
+        spotify_id = track.spotify_id
+        if not spotify_id or spotify_id in wanted:
+            continue
+        wanted[spotify_id] = i
+        entry = known.get(spotify_id)
+        if not entry or not os.path.exists(os.path.join(output_dir, entry["file"])):
+            added.append(spotify_id)
+            continue
+        ext = os.path.splitext(entry["file"])[1]
+        new_file = track_basename(i, track.title or 'Unknown', numbered_tracks) + ext
+        if new_file != entry["file"]:
+            renames.append((spotify_id, entry["file"], new_file, track))
+
+    removed = [(sid, entry["file"]) for sid, entry in known.items() if sid not in wanted]
+    return added, renames, removed
+
+def unshare(path: str):
+    # files hardlinked into several playlist folders get a private copy before their tags change
+    if os.stat(path).st_nlink > 1:
+        tmp = path + ".unshare"
+        shutil.copyfile(path, tmp)
+        os.replace(tmp, path)
+
+def apply_renames(output_dir: str, renames: list):
+    # two passes through temporary names so swapping "001 - A" and "002 - B" can't clobber either file
+    from .tagging import tag_audio_file
+
+    staged = []
+    for n, (spotify_id, old_file, new_file, track) in enumerate(renames):
+        tmp = os.path.join(output_dir, f".sync-{n}{os.path.splitext(old_file)[1]}")
+        os.replace(os.path.join(output_dir, old_file), tmp)
+        staged.append((tmp, new_file, track))
+    for tmp, new_file, track in staged:
+        os.replace(tmp, os.path.join(output_dir, new_file))
+    for tmp, new_file, track in staged:
+        # keep the track number tag in line with the new position, no re-download needed
+        try:
+            unshare(os.path.join(output_dir, new_file))
+            tag_audio_file(os.path.join(output_dir, new_file), track)
+        except Exception as e:
+            print(f"Warning: could not re-tag {new_file}: {e}")
+
+def prune_files(output_dir: str, removed: list, mode: str):
+    for _, file in removed:
+        path = os.path.join(output_dir, file)
+        if not os.path.exists(path):
+            continue
+        if mode == "delete":
+            os.remove(path)
+        elif mode == "move":
+            dest_dir = os.path.join(output_dir, REMOVED_DIR)
+            os.makedirs(dest_dir, exist_ok=True)
+            shutil.move(path, os.path.join(dest_dir, file))
+
+def sync_csv_to_media(csv_path, output_path, tracklist_name, numbered_tracks: bool = True, prune: str = "keep", **download_kwargs):
+    return sync_tracks_to_media(read_tracks_csv(csv_path), output_path, tracklist_name, numbered_tracks, prune, **download_kwargs)
+
+def sync_tracks_to_media(tracks, output_path, tracklist_name, numbered_tracks: bool = True, prune: str = "keep", **download_kwargs):
+    tracklist = Tracklist(name=tracklist_name, artists=[], release_date="", tracks=tracks)
+    return sync_tracklists_to_media([tracklist], output_path, numbered_tracks, prune, **download_kwargs)[0]
+
+def sync_tracklists_to_media(tracklists, output_path, numbered_tracks: bool = True, prune: str = "keep", **download_kwargs):
+    """
+    Brings each tracklist's output directory in line with it: downloads only tracks that are new,
+    renames files whose position changed and keeps / deletes / moves ones that were dropped.
+    New tracks of all tracklists are downloaded in one shared run (see convert_tracklists_to_media).
+    download_kwargs are passed through to convert_tracklists_to_media. Returns the manifests.
+    """
+    if prune not in PRUNE_MODES:
+        raise ValueError(f"prune must be one of {', '.join(PRUNE_MODES)}")
+
+    plans = []
+    for tracklist in tracklists:
+        output_dir = os.path.join(output_path, safe_filename(tracklist.name))
+        os.makedirs(output_dir, exist_ok=True)
+        manifest = load_manifest(output_dir)
+        tracks = list(tracklist.tracks)
+
+        added, renames, removed = plan_sync(manifest, tracks, output_dir, numbered_tracks)
+        # what plan_sync keeps: one entry per spotify id, at its first position
+        synced = len({track.spotify_id for track in tracks if track.spotify_id})
+        label = f"Sync {tracklist.name}" if len(tracklists) > 1 else "Sync"
+        print(f"{label}: {len(added)} new, {len(renames)} moved, {len(removed)} removed, "
+              f"{synced - len(added) - len(renames)} unchanged")
+
+        # make room first: removed files may hold names that moved / new tracks need
+        if removed:
+            prune_files(output_dir, removed, prune)
+            for spotify_id, _ in removed:
+                manifest["tracks"].pop(spotify_id, None)
+        if renames:
+            apply_renames(output_dir, renames)
+            for spotify_id, _, new_file, _ in renames:
+                manifest["tracks"][spotify_id]["file"] = new_file
+        save_manifest(output_dir, manifest)
+        # later positions of a track listed twice lose their id, so the download skips them (their
+        # files would be missing from the manifest) while they still count for numbering
+        seen = set()
+        for i, track in enumerate(tracks):
+            if track.spotify_id in seen:
+                tracks[i] = dataclasses.replace(track, spotify_id="")
+            elif track.spotify_id:
+                seen.add(track.spotify_id)
+        plans.append((Tracklist(name=tracklist.name, artists=[], release_date="", tracks=tracks, kind=tracklist.kind),
+                      output_dir, manifest, added))
+
+    pending = [(tracklist, set(added)) for tracklist, _, _, added in plans if added]
+    results = iter(convert_tracklists_to_media(
+        [tracklist for tracklist, _ in pending], output_path, numbered_tracks,
+        only_ids=[ids for _, ids in pending], **download_kwargs
+    ) if pending else [])
+
+    for tracklist, output_dir, manifest, added in plans:
+        if added:
+            downloaded, _ = next(results)
+            for entry in downloaded:
+                spotify_id = entry.get("Spotify Track ID")
+                if spotify_id:
+                    manifest["tracks"][spotify_id] = {"file": entry["File"]}
+
+        positions = {track.spotify_id: i for i, track in enumerate(tracklist.tracks, start=1) if track.spotify_id}
+        for spotify_id, entry in manifest["tracks"].items():
+            entry["position"] = positions.get(spotify_id)
+        manifest["synced_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        save_manifest(output_dir, manifest)
+    return [manifest for _, _, manifest, _ in plans]
@@ -0,0 +1,143 @@
+import os
+from typing import Optional
+
+from mutagen.flac import FLAC, Picture
+from mutagen.id3 import APIC, COMM, ID3, TCON, TALB, TDRC, TIT2, TPE1, TPE2, TPOS, TRCK, TXXX
+from mutagen.mp3 import MP3
+from mutagen.mp4 import MP4, MP4Cover, MP4FreeForm
+from mutagen.wave import WAVE
+
+from .tracks import Track
+
+# custom tag holding the spotify track id, lets retag / sync map files back to tracks
+SPOTIFY_ID_TAG = "SPOTIFY_TRACK_ID"
+MP4_SPOTIFY_ID_KEY = f"----:com.apple.iTunes:{SPOTIFY_ID_TAG}"
+
+def tag_fields(meta) -> dict:
+    # normalized tag values from a Track (or a tracklist csv row)
+    if isinstance(meta, dict):
+        track = Track.from_row(meta)
+        track.youtube_url = (meta.get("YouTube URL") or "").strip()
+    else:
+        track = meta
+    return {
+        "title": (track.title or "").strip(),
+        "artists": list(track.artists),
+        "album": (track.album or "").strip(),
+        "album_artists": list(track.album_artists),
+        "release_date": (track.release_date or "").strip(),
+        "track_number": str(track.track_number or ""),
+        "disc_number": str(track.disc_number or ""),
+        "genre": (track.genre or "").strip(),
+        "yt_url": (track.youtube_url or "").strip(),
+        "spotify_id": (track.spotify_id or "").strip(),
+    }
+
+def _apply_id3(tags: ID3, f: dict, cover_jpeg: Optional[bytes]):
+    if f["title"]: tags.add(TIT2(encoding=3, text=f["title"]))
+    if f["artists"]: tags.add(TPE1(encoding=3, text=f["artists"]))
+    if f["album_artists"]: tags.add(TPE2(encoding=3, text=f["album_artists"]))
+    if f["album"]: tags.add(TALB(encoding=3, text=f["album"]))
+    if f["track_number"]: tags.add(TRCK(encoding=3, text=f["track_number"]))
+    if f["disc_number"]: tags.add(TPOS(encoding=3, text=f["disc_number"]))
+    if f["release_date"]: tags.add(TDRC(encoding=3, text=f["release_date"][:4]))
+    if f["genre"]: tags.add(TCON(encoding=3, text=f["genre"]))
+    if f["yt_url"]: tags.add(COMM(encoding=3, lang="eng", desc="Comment", text=f["yt_url"]))
+    if f["spotify_id"]: tags.add(TXXX(encoding=3, desc=SPOTIFY_ID_TAG, text=f["spotify_id"]))
+    if cover_jpeg:
+        tags.delall("APIC")
+        tags.add(APIC(encoding=3, mime="image/jpeg", type=3, desc="Cover", data=cover_jpeg))
+
+def _apply_mp4(audio: MP4, f: dict, cover_jpeg: Optional[bytes]):
+    if f["title"]: audio["\xa9nam"] = [f["title"]]
+    if f["artists"]: audio["\xa9ART"] = f["artists"]
+    if f["album"]: audio["\xa9alb"] = [f["album"]]
+    if f["album_artists"]: audio["aART"] = f["album_artists"]
+    if f["release_date"]: audio["\xa9day"] = [f["release_date"]]
+    if f["track_number"]:
+        try: audio["trkn"] = [(int(f["track_number"]), 0)]
+        except ValueError: pass
+    if f["disc_number"]:
+        try: audio["disk"] = [(int(f["disc_number"]), 0)]
+        except ValueError: pass
+    if f["genre"]: audio["\xa9gen"] = [f["genre"]]
+    if f["yt_url"]: audio["\xa9cmt"] = [f["yt_url"]]
+    if f["spotify_id"]: audio[MP4_SPOTIFY_ID_KEY] = [MP4FreeForm(f["spotify_id"].encode("utf-8"))]
+    if cover_jpeg:
+        audio["covr"] = [MP4Cover(cover_jpeg, imageformat=MP4Cover.FORMAT_JPEG)]
+
+def _apply_vorbis(audio: FLAC, f: dict, cover_jpeg: Optional[bytes]):
+    if f["title"]: audio["title"] = [f["title"]]
+    if f["artists"]: audio["artist"] = f["artists"]
+    if f["album"]: audio["album"] = [f["album"]]
+    if f["album_artists"]: audio["albumartist"] = f["album_artists"]
+    if f["release_date"]: audio["date"] = [f["release_date"]]
+    if f["track_number"]: audio["tracknumber"] = [f["track_number"]]
+    if f["disc_number"]: audio["discnumber"] = [f["disc_number"]]
+    if f["genre"]: audio["genre"] = [f["genre"]]
+    if f["yt_url"]: audio["comment"] = [f["yt_url"]]
+    if f["spotify_id"]: audio[SPOTIFY_ID_TAG.lower()] = [f["spotify_id"]]
+    if cover_jpeg:
+        pic = Picture()
+        pic.type = 3
+        pic.mime = "image/jpeg"
+        pic.desc = "Cover"
+        pic.data = cover_jpeg
+        audio.clear_pictures()
+        audio.add_picture(pic)
+
+def write_tags(file_path: str, meta, cover_jpeg: Optional[bytes] = None):
+    """
+    Builds the whole tag set (cover included) in memory and saves the file once.
+    meta is a Track or a tracklist csv row; without cover_jpeg any existing cover is kept.
+    """
+    f = tag_fields(meta)
+    ext = os.path.splitext(file_path)[1].lower()
+
+    if ext == ".mp3":
+        audio = MP3(file_path, ID3=ID3)
+        if audio.tags is None:
+            audio.add_tags()
+        _apply_id3(audio.tags, f, cover_jpeg)
+        audio.save(v2_version=3)
+    elif ext == ".wav":
+        audio = WAVE(file_path)
+        if audio.tags is None:
+            audio.add_tags()
+        _apply_id3(audio.tags, f, cover_jpeg)
+        audio.save(v2_version=3)
+    elif ext in (".m4a", ".mp4"):
+        audio = MP4(file_path)
+        if audio.tags is None:
+            audio.add_tags()
+        _apply_mp4(audio, f, cover_jpeg)
+        audio.save()
+    elif ext == ".flac":
+        audio = FLAC(file_path)
+        if audio.tags is None:
+            audio.add_tags()
+        _apply_vorbis(audio, f, cover_jpeg)
+        audio.save()
+    else:
+        raise ValueError(f"Unsupported audio format for tagging: {ext}")
+
+def tag_audio_file(file_path: str, meta):
+    write_tags(file_path, meta)
+
+def read_spotify_id(file_path: str) -> str:
+    # the spotify id write_tags stored in the file, "" when there is none (or the file can't be read)
+    ext = os.path.splitext(file_path)[1].lower()
+    try:
+        if ext in (".mp3", ".wav"):
+            tags = ID3(file_path) if ext == ".mp3" else WAVE(file_path).tags
+            frame = tags.get(f"TXXX:{SPOTIFY_ID_TAG}") if tags else None
+            values = frame.text if frame else []
+        elif ext in (".m4a", ".mp4"):
+            values = [bytes(v).decode("utf-8") for v in (MP4(file_path).tags or {}).get(MP4_SPOTIFY_ID_KEY, [])]
+        elif ext == ".flac":
+            values = FLAC(file_path).get(SPOTIFY_ID_TAG.lower()) or []
+        else:
+            return ""
+    except Exception:
+        return ""
+    return str(values[0]).strip() if values else ""
@@ -0,0 +1,176 @@
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+from urllib.parse import urlparse
+
+# per-track phases, in pipeline order; each is a number of seconds in a track's metrics
+PHASES = ("search", "download", "transcode", "tag", "cover", "place")
+
+@contextmanager
+def timed(metrics: dict, phase: str):
+    # adds the time spent in the block to metrics[phase] (phases can run more than once per track)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics[phase] = metrics.get(phase, 0.0) + time.perf_counter() - started
+
+def percentile(samples: list, q: float) -> float:
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(round(q / 100 * (len(samples) - 1))))]
+
+def _distribution(samples: list) -> dict:
+    return {
+        "count": len(samples),
+        "total_s": round(sum(samples), 4),
+        "p50_s": round(percentile(samples, 50), 4),
+        "p90_s": round(percentile(samples, 90), 4),
+        "p99_s": round(percentile(samples, 99), 4),
+        "max_s": round(max(samples), 4) if samples else 0.0,
+    }
+
+def spotify_endpoint(url: str) -> str:
+    # "/v1/playlists/37i9dQZF1DXcBWIGoYBM5M/tracks" -> "playlists/{id}/tracks"
+    path = urlparse(url).path
+    path = re.sub(r"^/v\d+/", "", path)
+    return re.sub(r"(?<=/)[A-Za-z0-9]{16,}(?=/|$)", "{id}", path) or "/"
+
+def _label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+class RunReport:
+    """
+    Collects timings for one run: every track's phases (search attempts, download time and
+    bytes, transcode, tag write, cover fetch), the time each spent in the pipeline stages,
+    its errors by class, and every Spotify API request.
+
+    path: where to write the report. A .jsonl path gets one line per track as tracks finish
+    and a summary line at the end, anything else one JSON document written by close().
+    prometheus_path: optional text file of Prometheus counters (node_exporter textfile format),
+    written by close(); prometheus_text() gives the same text at any time.
+    """
+
+    def __init__(self, path: Optional[str] = None, prometheus_path: Optional[str] = None):
+        self.path = path
+        self.prometheus_path = prometheus_path
+        self.jsonl = bool(path) and path.lower().endswith(".jsonl")
+        self.started = time.time()
+        self._clock = time.perf_counter()
+        self._lock = threading.Lock()
+        self.tracks = []
+        self.status = {}
+        self.phases = {p: [] for p in PHASES}
+        self.stages = {}
+        self.search_attempts = 0
+        self.download_bytes = 0
+        self.errors = {}
+        self.spotify = {}
+        self._file = open(path, "w", encoding="utf-8") if self.jsonl else None
+
+    def on_stage(self, stage: str, job, seconds: float):
+        # run_pipeline callback; the seconds also go on the job so its record has them
+        stages = job.metrics.setdefault("stages", {})
+        stages[stage] = stages.get(stage, 0.0) + seconds
+        with self._lock:
+            self.stages.setdefault(stage, []).append(seconds)
+
+    def on_spotify_request(self, url: str, status: int, seconds: float):
+        # SpotifyAPI on_request callback, called for every HTTP attempt (429s and retries included)
+        endpoint = spotify_endpoint(url)
+        with self._lock:
+            entry = self.spotify.setdefault(endpoint, {"samples": [], "status": {}})
+            entry["samples"].append(seconds)
+            entry["status"][str(status)] = entry["status"].get(str(status), 0) + 1
+
+    def add_track(self, record: dict):
+        metrics = record.get("metrics") or {}
+        with self._lock:
+            self.status[record["status"]] = self.status.get(record["status"], 0) + 1
+            for phase in PHASES:
+                if phase in metrics:
+                    self.phases[phase].append(metrics[phase])
+            self.search_attempts += len(metrics.get("searches", []))
+            self.download_bytes += metrics.get("download_bytes", 0)
+            for kind, n in metrics.get("errors", {}).items():
+                self.errors[kind] = self.errors.get(kind, 0) + n
+            if self._file:
+                self._file.write(json.dumps(record) + "\n")
+                self._file.flush()
+            else:
+                self.tracks.append(record)
+
+    def summary(self) -> dict:
+        with self._lock:
+            elapsed = time.perf_counter() - self._clock
+            finished = sum(self.status.values())
+            download_s = sum(self.phases["download"])
+            return {
+                "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+                "elapsed_s": round(elapsed, 3),
+                "tracks": dict(self.status),
+                "tracks_per_s": round(finished / elapsed, 3) if elapsed else 0.0,
+                "search_attempts": self.search_attempts,
+                "download_bytes": self.download_bytes,
+                "download_bytes_per_s": round(self.download_bytes / download_s) if download_s else 0,
+                "errors": dict(self.errors),
+                "phases": {p: _distribution(s) for p, s in self.phases.items() if s},
+                "stages": {name: _distribution(s) for name, s in self.stages.items()},
+                "spotify": {
+                    endpoint: {**_distribution(e["samples"]), "status": dict(e["status"])}
+                    for endpoint, e in self.spotify.items()
+                },
+            }
+
+    def prometheus_text(self) -> str:
+        summary = self.summary()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP spotify2media_{name} {help_text}")
+            lines.append(f"# TYPE spotify2media_{name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{_label(v)}"' for k, v in labels.items())
+                lines.append(f"spotify2media_{name}{{{label_text}}} {value}" if label_text
+                             else f"spotify2media_{name} {value}")
+
+        metric("tracks_total", "counter", "Tracks finished, by outcome.",
+               [({"status": s}, n) for s, n in summary["tracks"].items()])
+        metric("phase_seconds_total", "counter", "Time spent per track phase.",
+               [({"phase": p}, d["total_s"]) for p, d in summary["phases"].items()])
+        metric("phase_count_total", "counter", "Number of timed track phases.",
+               [({"phase": p}, d["count"]) for p, d in summary["phases"].items()])
+        metric("stage_seconds_total", "counter", "Time spent in each pipeline stage.",
+               [({"stage": s}, d["total_s"]) for s, d in summary["stages"].items()])
+        metric("search_attempts_total", "counter", "YouTube searches made.", [({}, summary["search_attempts"])])
+        metric("download_bytes_total", "counter", "Bytes downloaded from YouTube.", [({}, summary["download_bytes"])])
+        metric("errors_total", "counter", "Track errors, by class (retried ones included).",
+               [({"class": k}, n) for k, n in summary["errors"].items()])
+        metric("spotify_requests_total", "counter", "Spotify API requests, by endpoint and HTTP status.",
+               [({"endpoint": e, "status": s}, n) for e, d in summary["spotify"].items() for s, n in d["status"].items()])
+        metric("spotify_request_seconds_total", "counter", "Time spent in Spotify API requests.",
+               [({"endpoint": e}, d["total_s"]) for e, d in summary["spotify"].items()])
+        metric("run_seconds", "gauge", "Wall-clock time of the run so far.", [({}, summary["elapsed_s"])])
+        return "\n".join(lines) + "\n"
+
+    def close(self):
+        summary = self.summary()
+        if self._file:
+            self._file.write(json.dumps({"summary": summary}) + "\n")
+            self._file.close()
+            self._file = None
+        elif self.path:
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump({"summary": summary, "tracks": self.tracks}, f, indent=2)
+        if self.prometheus_path:
+            # replaced in one go, so a collector never reads half a file
+            tmp = self.prometheus_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(self.prometheus_text())
+            os.replace(tmp, self.prometheus_path)
+        return summary
@@ -0,0 +1,137 @@
+from dataclasses import dataclass, field
+from typing import Optional
+
+# column order of the tracklist csv export
+CSV_FIELDS = [
+    "Track Name",
+    "Artist Name(s)",
+    "Genre",
+    "Album Name",
+    "Album Artist(s)",
+    "Tracklist Name",
+    "Tracklist Artist(s)",
+    "Release Date",
+    "Duration (ms)",
+    "Disc Number",
+    "Track Number",
+    "Spotify Track ID",
+    "Spotify Track URL",
+    "Cover URL",
+]
+
+def _split_names(value) -> list:
+    return [a.strip() for a in (value or "").split(";") if a.strip()]
+
+def _int_or_none(value) -> Optional[int]:
+    value = str(value or "").strip()
+    return int(value) if value.isdigit() else None
+
+@dataclass
+class Track:
+    title: str
+    artists: list = field(default_factory=list)
+    album: str = ""
+    album_artists: list = field(default_factory=list)
+    genre: str = ""
+    release_date: str = ""
+    duration_ms: int = 0
+    disc_number: Optional[int] = None
+    track_number: Optional[int] = None
+    spotify_id: str = ""
+    spotify_url: str = ""
+    cover_url: str = ""
+    # only needed for the genre lookup
+    artist_ids: list = field(default_factory=list)
+    tracklist_name: str = ""
+    tracklist_artists: list = field(default_factory=list)
+    # filled in once a video has been matched, ends up in the comment tag
+    youtube_url: str = ""
+
+    @property
+    def primary_artist(self) -> str:
+        return self.artists[0] if self.artists else ""
+
+    @property
+    def duration_s(self) -> Optional[float]:
+        return self.duration_ms / 1000 if self.duration_ms else None
+
+    def to_row(self) -> dict:
+        return {
+            "Track Name": self.title or "",
+            "Artist Name(s)": "; ".join(self.artists),
+            "Genre": self.genre or "",
+            "Album Name": self.album or "Unknown",
+            "Album Artist(s)": "; ".join(self.album_artists),
+            "Tracklist Name": self.tracklist_name or "",
+            "Tracklist Artist(s)": "; ".join(self.tracklist_artists),
+            "Release Date": self.release_date or "",
+            "Duration (ms)": self.duration_ms or 0,
+            "Disc Number": self.disc_number or "",
+            "Track Number": self.track_number or "",
+            "Spotify Track ID": self.spotify_id or "",
+            "Spotify Track URL": self.spotify_url or "",
+            "Cover URL": self.cover_url or "",
+        }
+
+    @classmethod
+    def from_row(cls, row: dict) -> "Track":
+        return cls(
+            title=(row.get("Track Name") or "").strip(),
+            artists=_split_names(row.get("Artist Name(s)")),
+            album=(row.get("Album Name") or "").strip(),
+            album_artists=_split_names(row.get("Album Artist(s)")),
+            genre=(row.get("Genre") or "").strip(),
+            release_date=(row.get("Release Date") or "").strip(),
+            duration_ms=_int_or_none(row.get("Duration (ms)")) or 0,
+            disc_number=_int_or_none(row.get("Disc Number")),
+            track_number=_int_or_none(row.get("Track Number")),
+            spotify_id=(row.get("Spotify Track ID") or "").strip(),
+            spotify_url=(row.get("Spotify Track URL") or "").strip(),
+            cover_url=(row.get("Cover URL") or "").strip(),
+            tracklist_name=(row.get("Tracklist Name") or "").strip(),
+            tracklist_artists=_split_names(row.get("Tracklist Artist(s)")),
+        )
+
+@dataclass
+class Tracklist:
+    name: str
+    artists: list
+    release_date: str
+    # a list, or an iterator that fetches further pages as it is consumed
+    tracks: object
+    # number of tracks when known up front (spotify reports it with the first page)
+    total: Optional[int] = None
+    # "album", "playlist" or "track" for tracklists fetched from spotify, "" when unknown
+    kind: str = ""
+    # id of the spotify album / playlist / track, "" when unknown
+    spotify_id: str = ""
+
+    @property
+    def spotify_uri(self) -> str:
+        return f"spotify:{self.kind}:{self.spotify_id}" if self.kind and self.spotify_id else ""
+
+def sort_tracks(tracks, sort_mode: str = "keep") -> list:
+    # sort_mode: "keep" for playlist order, "album" for album order (ie by disc and track number)
+    if sort_mode == "album":
+        #  safe sort even if None
+        return sorted(tracks, key=lambda t: (t.disc_number or 0, t.track_number or 0))
+    # keep incoming order (playlist order)
+    return list(tracks)
+
+def finalize_track(t: Track, list_title: str, tracklist_artists, release_date) -> Track:
+    # fills in the tracklist-level fields every track carries into its tags
+    t.tracklist_name = list_title
+    t.tracklist_artists = list(tracklist_artists or [])
+    t.album = t.album or "Unknown"
+    t.album_artists = t.album_artists or list(tracklist_artists or [])
+    t.release_date = t.release_date or release_date or ""
+    t.genre = (t.genre or "").strip()
+    return t
+
+def finalize_tracks(tracks, list_title: str, tracklist_artists, release_date, sort_mode: str = "keep") -> list:
+    return [finalize_track(t, list_title, tracklist_artists, release_date) for t in sort_tracks(tracks, sort_mode)]
+
+def iter_finalized(tracks, list_title: str, tracklist_artists, release_date):
+    # finalize_tracks for a stream, keeps incoming order
+    for t in tracks:
+        yield finalize_track(t, list_title, tracklist_artists, release_date)
@@ -0,0 +1,67 @@
+import os
+import shutil
+import subprocess
+from typing import Optional
+
+# per output format: file extension, source codecs that only need a stream copy, encoder args
+FORMATS = {
+    "mp3": {"ext": ".mp3", "copy_codecs": ("mp3",), "args": ["-codec:a", "libmp3lame", "-q:a", "0"]},
+    "m4a": {"ext": ".m4a", "copy_codecs": ("aac", "alac"), "args": ["-codec:a", "aac", "-b:a", "256k"]},
+    "flac": {"ext": ".flac", "copy_codecs": ("flac",), "args": ["-codec:a", "flac"]},
+    "wav": {"ext": ".wav", "copy_codecs": ("pcm_s16le",), "args": ["-codec:a", "pcm_s16le"]},
+}
+
+# yt-dlp format selection per output format: prefer a source that can be stream-copied
+DOWNLOAD_FORMATS = {
+    "mp3": "bestaudio[ext=m4a]/bestaudio/best",
+    "m4a": "bestaudio[ext=m4a]/bestaudio/best",
+    "flac": "bestaudio/best",
+    "wav": "bestaudio/best",
+}
+
+def format_ext(audio_format: str) -> str:
+    if audio_format not in FORMATS:
+        raise ValueError(f"Unsupported audio format: {audio_format}")
+    return FORMATS[audio_format]["ext"]
+
+def probe_codec(path: str, ffprobe_exe: Optional[str] = None) -> str:
+    # codec name of the first audio stream, "" if ffprobe is missing or fails
+    ffprobe_exe = ffprobe_exe or shutil.which("ffprobe")
+    if not ffprobe_exe:
+        return ""
+    proc = subprocess.run(
+        [ffprobe_exe, "-v", "error", "-select_streams", "a:0", "-show_entries", "stream=codec_name",
+         "-of", "default=noprint_wrappers=1:nokey=1", path],
+        capture_output=True, text=True,
+    )
+    return proc.stdout.strip().splitlines()[0] if proc.returncode == 0 and proc.stdout.strip() else ""
+
+def needs_encode(src_path: str, audio_format: str, ffprobe_exe: Optional[str] = None) -> bool:
+    # False when the source already has the target container or a codec the target can hold as-is
+    if os.path.splitext(src_path)[1].lower() == format_ext(audio_format):
+        return False
+    return probe_codec(src_path, ffprobe_exe) not in FORMATS[audio_format]["copy_codecs"]
+
+def convert_audio(src_path: str, dst_path: str, audio_format: str, ffmpeg_exe: str = "ffmpeg",
+                  ffprobe_exe: Optional[str] = None) -> str:
+    """
+    Converts a downloaded source file to dst_path in audio_format and removes the source.
+    Same container: plain move. Matching codec (e.g. AAC in webm -> m4a): stream copy remux.
+    Anything else is re-encoded. Top level so it can run in a process pool.
+    """
+    if os.path.splitext(src_path)[1].lower() == format_ext(audio_format):
+        if os.path.abspath(src_path) != os.path.abspath(dst_path):
+            os.replace(src_path, dst_path)
+        return dst_path
+
+    cmd = [ffmpeg_exe, "-y", "-loglevel", "error", "-i", src_path, "-vn"]
+    if needs_encode(src_path, audio_format, ffprobe_exe):
+        cmd += FORMATS[audio_format]["args"]
+    else:
+        cmd += ["-codec:a", "copy"]
+    cmd.append(dst_path)
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {proc.stderr.strip()[-300:]}")
+    os.remove(src_path)
+    return dst_path
@@ -1,20 +1,28 @@
 import re
 import os
-import configparser
 import csv
+import itertools
 import time
 import shutil
-from yt_dlp import YoutubeDL
-import tempfile
-from mutagen.id3 import ID3, TIT2, TPE1, TPE2, TALB, TRCK, TPOS, TDRC, COMM, TCON
-from mutagen.mp3 import MP3
-from mutagen.mp4 import MP4
-from datetime import datetime
+import threading
+from collections import deque
+from dataclasses import dataclass, field, replace
+from typing import Optional
 import io
-import requests
-from PIL import Image
-from mutagen.id3 import APIC
-from mutagen.id3 import ID3, ID3NoHeaderError
+
+# yt_dlp, PIL and mutagen load when the stage needing them runs (see sessions / covers / tagging imports below)
+from .albums import MIN_ALBUM_TRACKS, album_duration_s, album_query, align_tracks, rank_album_videos, split_audio
+from .csv_io import read_tracks_csv
+from .covers import CoverCache
+from .errors import (ERROR_CLASSES, ERROR_COLUMNS, ERROR_MESSAGES, LOCAL_IO, POSTPROCESS, TRANSIENT, UNAVAILABLE,
+                     ClassifiedError, call_with_retries)
+from .matching import rank_candidates
+from .pipeline import Stage, run_pipeline
+from .scheduler import DownloadScheduler, is_throttled
+from .sessions import YdlPool
+from .telemetry import timed
+from .tracks import Track, Tracklist
+from .transcode import DOWNLOAD_FORMATS, convert_audio, format_ext
 
 
 # windows filename safety
@@ -24,6 +32,9 @@ def safe_filename(name: str, max_len: int = 120) -> str:
     return name[:max_len].rstrip(' .')
 
 def get_mp3_cover_dimensions(file_path: str):
+    from mutagen.id3 import ID3
+    from PIL import Image
+
     tags = ID3(file_path)
     apics = tags.getall("APIC")
     if not apics:
@@ -32,229 +43,814 @@ def get_mp3_cover_dimensions(file_path: str):
     im = Image.open(io.BytesIO(img_bytes))
     return im.size, im.format  # (width,height), "JPEG"/"PNG"
 
-def download_image_bytes(url: str, timeout=20) -> bytes:
-    r = requests.get(url, timeout=timeout)
-    r.raise_for_status()
-    return r.content
+AUDIO_EXTS = (".mp3", ".m4a", ".flac", ".wav", ".webm", ".opus", ".ogg")
 
-def normalize_cover_to_jpeg(img_bytes: bytes, max_size=(600, 600), quality=85) -> bytes:
+class OutputIndex:
     """
-    Converts any image to a reasonably-sized JPEG for iPod friendliness.
+    Audio files of one output directory keyed by exact filename stem ("001 - Song").
+    The directory is listed once; the pipeline records every file it writes, so lookups
+    are O(1) and "001 - Song" can't be confused with "001 - Song - audio".
     """
-    im = Image.open(io.BytesIO(img_bytes)).convert("RGB")
-    im.thumbnail(max_size)  # keeps aspect ratio
-    out = io.BytesIO()
-    im.save(out, format="JPEG", quality=quality, optimize=False)
-    return out.getvalue()
 
-def embed_cover_mp3(file_path: str, jpeg_bytes: bytes):
-    try:
-        tags = ID3(file_path)
-    except ID3NoHeaderError:
-        tags = ID3()
-
-    tags.delall("APIC")
-    tags.add(APIC(
-        encoding=3,
-        mime="image/jpeg",
-        type=3,
-        desc="Cover",
-        data=jpeg_bytes
-    ))
-    tags.save(file_path, v2_version=3)
-
-def tag_audio_file(file_path: str, meta: dict):
-    title = (meta.get("Track Name") or "").strip()
-    artists = [a.strip() for a in (meta.get("Artist Name(s)") or "").split(";") if a.strip()]
-    album = (meta.get("Album Name") or "").strip()
-    album_artists = [a.strip() for a in (meta.get("Album Artist(s)") or "").split(";") if a.strip()]
-    release_date = (meta.get("Release Date") or "").strip()
-    track_number = (meta.get("Track Number") or "").strip()
-    disc_number = (meta.get("Disc Number") or "").strip()
-    genre = (meta.get("Genre") or "").strip()
-    yt_url = (meta.get("YouTube URL") or "").strip()
-
-    ext = os.path.splitext(file_path)[1].lower()
-
-    if ext == ".mp3":
-        audio = MP3(file_path, ID3=ID3)
-        if audio.tags is None:
-            audio.add_tags()
-
-        if title: audio.tags.add(TIT2(encoding=3, text=title))
-        if artists: audio.tags.add(TPE1(encoding=3, text=artists))
-        if album_artists: audio.tags.add(TPE2(encoding=3, text=album_artists))
-        if album: audio.tags.add(TALB(encoding=3, text=album))
-        if track_number: audio.tags.add(TRCK(encoding=3, text=track_number))
-        if disc_number: audio.tags.add(TPOS(encoding=3, text=disc_number))
-        if release_date: audio.tags.add(TDRC(encoding=3, text=release_date[:4]))  
-        if genre: audio.tags.add(TCON(encoding=3, text=genre))
-        if yt_url: audio.tags.add(COMM(encoding=3, lang="eng", desc="Comment", text=yt_url))
-
-        audio.save(v2_version=3)
-    elif ext in (".m4a", ".mp4"):
-        audio = MP4(file_path)
-        if title: audio["\xa9nam"] = [title]
-        if artists: audio["\xa9ART"] = artists
-        if album: audio["\xa9alb"] = [album]
-        if album_artists: audio["aART"] = album_artists
-        if release_date: audio["\xa9day"] = [release_date]
-        if track_number:
-            try: audio["trkn"] = [(int(track_number), 0)]
-            except ValueError: pass
-        if disc_number:
-            try: audio["disk"] = [(int(disc_number), 0)]
-            except ValueError: pass
-        if genre: audio["\xa9gen"] = [genre]
-
-        audio.save()
-
-def find_downloaded_audio(output_dir: str, base_prefix: str):
-    candidates = []
-    for fn in os.listdir(output_dir):
-        if fn.startswith(base_prefix) and fn.lower().endswith((".mp3", ".m4a")):
-            candidates.append(os.path.join(output_dir, fn))
-    return max(candidates, key=os.path.getmtime) if candidates else None
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        self._lock = threading.Lock()
+        self._files = {}
+        with os.scandir(output_dir) as it:
+            for e in it:
+                if e.is_file() and e.name.lower().endswith(AUDIO_EXTS):
+                    self._files.setdefault(os.path.splitext(e.name)[0], []).append(e.path)
+
+    def find(self, base: str, prefer_ext: Optional[str] = None) -> Optional[str]:
+        with self._lock:
+            paths = [p for p in self._files.get(base, []) if os.path.exists(p)]
+            self._files[base] = paths
+        if not paths:
+            return None
+        for p in paths:
+            if prefer_ext and p.lower().endswith(prefer_ext):
+                return p
+        return paths[0]
+
+    def add(self, path: str):
+        base = os.path.splitext(os.path.basename(path))[0]
+        with self._lock:
+            paths = self._files.setdefault(base, [])
+            if path not in paths:
+                paths.append(path)
+
+def downloaded_filepath(info: dict) -> Optional[str]:
+    # exact path of the file yt-dlp wrote, as reported back in the info dict
+    for d in reversed(info.get("requested_downloads") or []):
+        if d.get("filepath"):
+            return d["filepath"]
+    return info.get("filepath") or info.get("_filename")
+
+def track_basename(index: int, track_name: str, numbered_tracks: bool = True) -> str:
+    # output filename (without extension) for the track at 1-based position index
+    file_title = re.sub(r"[^\w\s]", '', track_name or '') or f"Track_{index}"
+    if (numbered_tracks):
+        return f"{index:03d} - {file_title}"
+    return f"{file_title}"
+
+def format_breakdown(breakdown: dict) -> str:
+    return ", ".join(f"{k} {v}" for k, v in breakdown.items() if k != "total") + f" = {breakdown.get('total')}"
+
+def youtube_video_id(url: str) -> Optional[str]:
+    m = re.search(r"(?:[?&]v=|youtu\.be/|/shorts/)([\w-]{11})", url or "")
+    return m.group(1) if m else None
+
+# yt-dlp options for searches: flat extraction gives title / duration / channel straight from
+# the results page, without resolving formats for every candidate
+SEARCH_OPTIONS = {
+    "quiet": True,
+    "no_warnings": True,
+    "extract_flat": "in_playlist",
+}
+
+def search_query(track: Track) -> str:
+    # one search per track, "<title> <primary artist>" without punctuation
+    parts = [re.sub(r"[^\w\s]", '', track.title or 'Unknown')]
+    safe_artist = re.sub(r"[^\w\s]", '', track.primary_artist or 'Unknown')
+    if safe_artist and safe_artist.lower() != 'unknown':
+        parts.append(safe_artist)
+    return ' '.join(parts)
+
+class OutputTarget:
+    """
+    One tracklist's output folder within a download run: its file index, its download
+    archive (downloaded.txt, same "<extractor> <id>" lines yt-dlp writes) and its results.
+    """
+
+    def __init__(self, name: str, output_path: str, numbered_tracks: bool = True, total: Optional[int] = None,
+                 estimated: bool = False):
+        self.name = name
+        self.output_dir = os.path.join(output_path, safe_filename(name))
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.numbered_tracks = numbered_tracks
+        self.total = total
+        # total is the tracklist's header count (which includes playlist items that get skipped, like
+        # local files) until its stream ends and the real count replaces it
+        self.estimated = estimated
+        self.index = OutputIndex(self.output_dir)
+        self.archive_file = os.path.join(self.output_dir, 'downloaded.txt')
+        self._lock = threading.Lock()
+        try:
+            with open(self.archive_file, encoding="utf-8") as f:
+                self._archive = {line.strip() for line in f if line.strip()}
+        except FileNotFoundError:
+            self._archive = set()
+        self.downloaded = []
+        self.not_found = []
+
+    def archived(self, key: str) -> bool:
+        with self._lock:
+            return key in self._archive
+
+    def add_to_archive(self, key: str):
+        with self._lock:
+            if key in self._archive:
+                return
+            self._archive.add(key)
+            with open(self.archive_file, "a", encoding="utf-8") as f:
+                f.write(key + "\n")
+
+    def total_label(self) -> str:
+        if not self.total:
+            return "?"
+        return f"~{self.total}" if self.estimated else str(self.total)
+
+@dataclass
+class FirstCopy:
+    """
+    What the other copies of a spotify track in a run need from the first job that got it: its
+    file, the tags it was written with and the video it came from. Kept for the whole run in place
+    of the job itself, so the run's memory doesn't grow with every track's search results.
+    """
+    track: Track
+    target_name: str
+    final_path: Optional[str] = None
+    video_url: str = ""
+    video_id: Optional[str] = None
+    # set once the first job is done, successfully or not
+    finished: bool = False
+    # jobs that turned up while the first one was still running, placed by it when it's done
+    followers: list = field(default_factory=list)
+
+@dataclass
+class TrackJob:
+    index: int
+    track: Track
+    target: OutputTarget
+    # ranked (entry, score breakdown) search results, None until searched
+    candidates: Optional[list] = None
+    candidate_pos: int = 0
+    match_checked: bool = False
+    # set when info came from the match index rather than a fresh search
+    from_match: bool = False
+    # "chapters" / "durations" when source_path was cut from a full-album video (see albums.align_tracks),
+    # "reused" for a file cut on an earlier run
+    album_split: str = ""
+    base: str = ""
+    info: Optional[dict] = None
+    source_path: Optional[str] = None
+    final_path: Optional[str] = None
+    error: str = ""
+    lines: list = field(default_factory=list)
+    # same spotify track elsewhere in the run: first is set on the job that gets the track,
+    # copy_of on a job that gets a copy of its file
+    first: Optional[FirstCopy] = None
+    copy_of: Optional[FirstCopy] = None
+    # seconds per phase (see telemetry.PHASES), search attempts, download bytes, stage times,
+    # and under "errors" the count of every error class (see errors.ERROR_CLASSES) the track ran into
+    metrics: dict = field(default_factory=dict)
+    created: float = field(default_factory=time.perf_counter)
+
+    def log(self, msg: str):
+        self.lines.append(msg)
+
+    def attempt(self, fn, default: str):
+        # fn() with the retry policy of whatever error class it fails with, see errors.call_with_retries
+        def retrying(kind, error, delay):
+            self.log(f"    {kind} error, retrying in {delay:.1f}s: {error}")
+        return call_with_retries(fn, default, self.metrics.setdefault("errors", {}), on_retry=retrying)
+
+    def fail(self, error: ClassifiedError):
+        self.error = ERROR_MESSAGES[error.kind]
+        return None
+
+    def label(self, batch: bool) -> str:
+        total = self.target.total_label()
+        return f"[{self.target.name} {self.index}/{total}]" if batch else f"[{self.index}/{total}]"
+
+def _rounded(value):
+    if isinstance(value, float):
+        return round(value, 4)
+    if isinstance(value, dict):
+        return {k: _rounded(v) for k, v in value.items()}
+    return value
+
+def job_record(job: TrackJob) -> dict:
+    # one track's line in the run report
+    info = job.info or {}
+    return {
+        "tracklist": job.target.name,
+        "index": job.index,
+        "spotify_id": job.track.spotify_id,
+        "title": job.track.title,
+        "artist": job.track.primary_artist,
+        "status": "downloaded" if job.final_path else "failed",
+        "error": "" if job.final_path else (job.error or "No valid download"),
+        "video_id": info.get("id") or youtube_video_id(info.get("webpage_url")),
+        "copied_from": job.copy_of.target_name if job.copy_of else None,
+        "file": os.path.basename(job.final_path) if job.final_path else None,
+        "elapsed_s": round(time.perf_counter() - job.created, 4),
+        "metrics": {k: _rounded(v) for k, v in job.metrics.items()},
+    }
+
+NOT_FOUND_FIELDS = ['Track Name', 'Artist Name(s)', 'Album Name', 'Track Number', 'Error', *ERROR_COLUMNS.values()]
+
+def not_found_csv_path(output_dir: str, tracklist_name: str) -> str:
+    return os.path.join(output_dir, f"{safe_filename(tracklist_name)}_not_found.csv")
+
+def write_not_found_csv(path: str, rows: list):
+    with open(path, 'w', newline='', encoding='utf-8') as cf:
+        writer = csv.DictWriter(cf, fieldnames=NOT_FOUND_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+
+def place_copy(first: FirstCopy, job: TrackJob):
+    """
+    Puts the file of a track's finished first job at job's place in its own output folder.
+    Hardlinked when both files would carry the same tags, otherwise copied and re-tagged.
+    """
+    from .tagging import tag_fields, write_tags
+
+    src = first.final_path
+    target = job.target
+    url = first.video_url
+    job.info = {'webpage_url': url, 'id': first.video_id}
+    job.base = track_basename(job.index, job.track.title or 'Unknown', target.numbered_tracks)
+    ext = os.path.splitext(src)[1]
+    dst = os.path.join(target.output_dir, job.base + ext)
+    same_tags = tag_fields(replace(first.track, youtube_url=url)) == tag_fields(replace(job.track, youtube_url=url))
+    # the same file already (e.g. hardlinked on an earlier run): os.replace of a link onto it would do nothing
+    same_file = os.path.exists(dst) and os.path.samefile(src, dst)
+    if not same_file or (not same_tags and os.path.abspath(src) != os.path.abspath(dst)):
+        tmp = os.path.join(target.output_dir, f".partial-{job.base}{ext}")
+        linked = False
+        if same_tags:
+            try:
+                os.link(src, tmp)
+                linked = True
+            except OSError:
+                pass  # other filesystem, or no hardlink support
+        if not linked:
+            shutil.copyfile(src, tmp)
+            # the cover is the same for the same spotify track, so only the text tags change
+            write_tags(tmp, replace(job.track, youtube_url=url))
+        os.replace(tmp, dst)
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        job.log(f"    {'Linked' if linked else 'Copied'} from {first.target_name}: {os.path.basename(dst)}")
+    job.final_path = dst
+    target.index.add(dst)
 
 # converts a CSV playlist export to mp3 files using youtube-dl / yt-dlp
-def convert_csv_to_media(csv_path, output_path, tracklist_name, numbered_tracks: bool = True, transcode_mp3: bool = True):    
-    start_time = time.time()
-    output_dir = os.path.join(output_path, safe_filename(tracklist_name))
-    os.makedirs(output_dir, exist_ok=True)
+def convert_csv_to_media(csv_path, output_path, tracklist_name, numbered_tracks: bool = True, **kwargs):
+    return convert_tracks_to_media(read_tracks_csv(csv_path), output_path, tracklist_name, numbered_tracks, **kwargs)
+
+# downloads a list of Track records to audio files using yt-dlp
+def convert_tracks_to_media(tracks, output_path, tracklist_name, numbered_tracks: bool = True, only_ids=None,
+                            total: Optional[int] = None, **kwargs):
+    # tracks: a list or a lazy iterator (e.g. a streamed Tracklist), consumed as the pipeline has room;
+    # total is only used for progress output when tracks has no length.
+    # only_ids: optional set of Spotify track ids to download, the rest of the tracks are skipped
+    # but still count for numbering. Returns (downloaded, not_found) lists of dicts.
+    tracklist = Tracklist(name=tracklist_name, artists=[], release_date="", tracks=tracks, total=total)
+    return convert_tracklists_to_media([tracklist], output_path, numbered_tracks, only_ids=[only_ids], **kwargs)[0]
+
+def convert_tracklists_to_media(tracklists, output_path, numbered_tracks: bool = True, transcode_mp3: bool = True,
+                                jobs: int = 1, search_jobs: Optional[int] = None, transcode_jobs: Optional[int] = None,
+                                match_index=None, refresh_matches: bool = False, search_results: int = 8,
+                                cover_cache: Optional[CoverCache] = None, only_ids=None, audio_format: Optional[str] = None,
+                                ydl_factory=None, on_stage=None, run_report=None, transcode_pool=None,
+                                max_rate: float = 0, adaptive: bool = False, split_albums: bool = False):
+    """
+    Downloads several tracklists in one run, each into its own folder under output_path, with all
+    their tracks sharing one set of workers. A Spotify track that appears more than once (in any of
+    the tracklists) is downloaded once and hardlinked / copied everywhere else it is needed.
+    only_ids: None, or one set (or None) per tracklist, see convert_tracks_to_media.
+    audio_format: mp3 / m4a / flac / wav, defaults to mp3 (or m4a when transcode_mp3 is False)
+    ydl_factory: builds the YoutubeDL-like object used for searches and downloads (see YdlPool);
+    on_stage: timing callback, see run_pipeline.
+    run_report: optional telemetry.RunReport that gets every track's timings as it finishes.
+    max_rate: cap in bytes/sec for all downloads together (0 = none); adaptive: let the number of
+    parallel downloads move between 1 and jobs with throughput and 403 / 429s (see DownloadScheduler).
+    transcode_pool: an existing ProcessPoolExecutor to transcode in (left running afterwards), so a
+    long-running caller doesn't start new worker processes for every run.
+    split_albums: for album tracklists, first look for one full-album video, download it once and
+    cut it into the tracks (see split_album below); tracks are searched one by one when that fails.
+    Returns one (downloaded, not_found) pair per tracklist.
+    """
+    # tracks flow through three stages, each with its own worker count:
+    #   resolve (youtube search + match) -> download (bestaudio) -> post (transcode + tag + cover)
+    from concurrent.futures import ProcessPoolExecutor
 
-    downloaded = []
-    not_found_tracks = []
+    from .tagging import write_tags
+
+    start_time = time.time()
+    tracklists = list(tracklists)
+    only_ids = only_ids or [None] * len(tracklists)
+    batch = len(tracklists) > 1
+    targets = []
+    # released in the finally below, also when the run stops on an error
+    ydl_pool = None
+    own_transcode_pool = False
+    staging_dir = None
 
     try:
         base_dir = os.path.dirname(os.path.abspath(__file__))
         ffmpeg_exe = shutil.which("ffmpeg")
         yt_dlp_exe = shutil.which("yt-dlp")
         missing = []
-        if not ffmpeg_exe:
+        # a custom downloader may deliver files already in the target format, so without ffmpeg
+        # it only fails on tracks that actually need converting
+        if not ffmpeg_exe and ydl_factory is None:
             missing.append("ffmpeg")
         #if not yt_dlp_exe:
         #    missing.append("yt-dlp")
         if missing:
             raise EnvironmentError(f"Missing required executables: {', '.join(missing)}. Please install them and ensure they are in your system PATH.")
 
-        rows = list(csv.DictReader(open(csv_path, newline="", encoding="utf-8")))
-        total = len(rows)
-        archive_file = os.path.join(output_dir, 'downloaded.txt')
-        variants = ['', 'audio', 'official audio']
+        sources = []
+        for tracklist, ids in zip(tracklists, only_ids):
+            tracks = tracklist.tracks
+            total = tracklist.total
+            streamed = not isinstance(tracks, (list, tuple))
+            if not streamed:
+                total = sum(1 for t in tracks if ids is None or t.spotify_id in ids)
+            targets.append(OutputTarget(tracklist.name, output_path, numbered_tracks, total,
+                                        estimated=streamed and total is not None))
+            sources.append((tracks, ids, tracklist.kind))
+
+        def grand_total():
+            # None while a streamed tracklist without a header count is still coming in
+            return sum(t.total for t in targets) if all(t.total is not None for t in targets) else None
+
+        # downloads land here under a key of their own and their video id, and are moved to their final
+        # name by the post stage; two tracks matched to the same video never share a file
+        staging_dir = os.path.join(output_path, '.staging')
+        staging_keys = itertools.count(1)
+        os.makedirs(staging_dir, exist_ok=True)
+        audio_format = audio_format or ("mp3" if transcode_mp3 else "m4a")
+        target_ext = format_ext(audio_format)
+        ffprobe_exe = shutil.which("ffprobe")
+
+        jobs = max(1, int(jobs or 1))
+        search_jobs = max(1, int(search_jobs or jobs))
+        # ffmpeg work runs in its own process pool, one process per core by default,
+        # so encoding never holds up the download threads
+        transcode_jobs = max(1, int(transcode_jobs or os.cpu_count() or 1))
+        own_transcode_pool = transcode_pool is None
+        if own_transcode_pool:
+            transcode_pool = ProcessPoolExecutor(max_workers=transcode_jobs)
+        scheduler = DownloadScheduler(jobs, adaptive=adaptive, max_rate=max_rate)
+        # every track of an album shares one cover, fetch and resize it once
+        cover_cache = cover_cache or CoverCache(max_size=(500, 500), quality=85)
 
-        def make_ydl(outtmpl: str, mp3: bool = False):
-            opts = {
+        # one fixed output template per strategy lets every worker keep its YoutubeDL for the whole run;
+        # the download archive is checked per output folder by the download stage
+        ydl_pool = YdlPool({
+            "download": {
                 "quiet": True,
                 "noplaylist": True,
-                "download_archive": archive_file,
-                "format": "bestaudio[ext=m4a]/bestaudio/best",
-                "outtmpl": outtmpl,
-                
+                "format": DOWNLOAD_FORMATS[audio_format],
+                # staging_key comes with each download's extra_info, see staging_info
+                "outtmpl": os.path.join(staging_dir, "%(staging_key)s-%(id)s.%(ext)s"),
                 "no_warnings": True,
-            }
-            if mp3:
-                opts["postprocessors"] = [
-                    {"key": "FFmpegExtractAudio", "preferredcodec": "mp3", "preferredquality": "0"},
-                    #{"key": "FFmpegMetadata"},
-                ]
-            else:
-                # keep as m4a where possible (remux)
-                opts["postprocessors"] = [{"key": "FFmpegVideoRemuxer", "preferedformat": "m4a"}]
-            return YoutubeDL(opts)
-
-        for i, row in enumerate(rows, start=1):
-            track_name = row.get("Track Name") or 'Unknown'
-            artist_names = row.get("Artist Name(s)") or 'Unknown'
-            album = row.get("Album Name") or 'Unknown'
-
-            duration_ms_str = (row.get("Duration (ms)") or "").strip()
-            duration_ms = int(duration_ms_str) if duration_ms_str.isdigit() else 0
-            duration_s = duration_ms / 1000 if duration_ms else None
-
-            safe_track_name = re.sub(r"[^\w\s]", '', track_name)
-            artist_primary = artist_names.split(";")[0]
-            safe_artist = re.sub(r"[^\w\s]", '', artist_primary)
-
-            run_variants = variants.copy()
-            if "instrumental" in safe_track_name.lower():
-                run_variants.insert(0, "instrumental")
-
-            success = False
-            
-            for variant in run_variants:
-                parts = [safe_track_name]
-                if safe_artist and safe_artist.lower() != 'unknown': 
-                    parts.append(safe_artist)
-                if variant: 
-                    parts.append(variant)
-                q = ' '.join(parts)
-                print(f"[{i}/{total}] Searching: {q}")
-
-
-                # fast mode
-                search_spec = f"ytsearch1:{q}"
-                
-                file_title = safe_track_name or f"Track_{i}"
-                if (numbered_tracks):
-                    base = f"{i:03d} - {file_title}" + (f" - {variant}" if variant else "")                
-                else:
-                    base = f"{file_title}" + (f" - {variant}" if variant else "")
-                outtmpl = os.path.join(output_dir, base + ".%(ext)s")
+                # feeds the global bytes/sec cap
+                "progress_hooks": [scheduler.progress_hook],
+                # no postprocessors: transcoding happens in the post stage so it doesn't hold up downloads
+            },
+            "search": SEARCH_OPTIONS,
+        }, factory=ydl_factory)
+
+        def staging_info() -> dict:
+            return {"staging_key": next(staging_keys)}
+
+        # spotify id -> FirstCopy of the first job seen for it
+        primaries = {}
+        dedupe_lock = threading.Lock()
+
+        def split_album(target: OutputTarget, tracks: list, ids) -> dict:
+            """
+            Album fast path: one search for a video of the whole album, one download, and ffmpeg stream
+            copies that cut it into the tracks by its chapters or by the spotify durations.
+            Returns {position: (segment path, info, method)}, empty when the tracks should be searched
+            one by one instead (no such video, it doesn't line up, or the album is partly there already).
+            On a rerun, files already cut from the same video are reused as they are (method "reused").
+            """
+            total_s = album_duration_s(tracks)
+            if len(tracks) < MIN_ALBUM_TRACKS or not total_s or not ffmpeg_exe:
+                return {}
+            if ids is not None and any(t.spotify_id not in ids for t in tracks):
+                return {}
+            existing = [target.index.find(track_basename(i, t.title or 'Unknown', target.numbered_tracks),
+                                          prefer_ext=target_ext) for i, t in enumerate(tracks, start=1)]
+            if any(existing) and not all(existing):
+                return {}
+
+            album = tracks[0].album or target.name
+            artist = (tracks[0].album_artists or tracks[0].artists or ['Unknown'])[0]
+            q = album_query(album, artist)
+            print(f"[{target.name}] Searching full album: {q}")
+            counts = {}
 
+            def fetch_album(url):
                 try:
-                    ydl = make_ydl(outtmpl, mp3=transcode_mp3)
-                    info = ydl.extract_info(search_spec, download=False)
-                    if 'entries' in info and info['entries']:
-                        info = info['entries'][0]
-                    
-                    video_duration = info.get('duration')
-                    if duration_s and video_duration:
-                        if abs(video_duration - duration_s) > 30:
-                            print(f"    Skipping due to duration mismatch (expected {duration_s}s, got {video_duration}s)")
+                    with scheduler.slot():
+                        info = ydl_pool.get("download").extract_info(url, download=True, extra_info=staging_info())
+                except Exception as e:
+                    if is_throttled(e):
+                        scheduler.on_throttled()
+                    raise
+                source_path = downloaded_filepath(info) if info else None
+                if not source_path or not os.path.exists(source_path):
+                    raise RuntimeError("Downloaded file not found after download.")
+                return info, source_path
+
+            try:
+                results = call_with_retries(
+                    lambda: ydl_pool.get("search").extract_info(f"ytsearch{search_results}:{q}", download=False),
+                    UNAVAILABLE, counts,
+                )
+                candidates = rank_album_videos(results.get('entries') or [], album, artist, total_s)
+                if not candidates:
+                    print("    No full-album video, searching per track")
+                    return {}
+                entry = candidates[0]
+                print(f"    Full album: {entry.get('title')} ({entry.get('duration')}s, album {total_s:.0f}s)")
+                page = entry.get('webpage_url') or entry.get('url')
+                if all(existing):
+                    video_id = entry.get('id') or youtube_video_id(page)
+                    if not (video_id and target.archived(f"youtube {video_id}")):
+                        return {}
+                    print("    Already split on an earlier run")
+                    return {i: (path, {'webpage_url': page, 'id': video_id, 'title': entry.get('title'),
+                                       'duration': entry.get('duration')}, "reused")
+                            for i, path in enumerate(existing, start=1)}
+                info, source_path = call_with_retries(lambda: fetch_album(page), UNAVAILABLE, counts)
+            except ClassifiedError as e:
+                print(f"    Full album failed, searching per track: {e}")
+                return {}
+            scheduler.on_success(os.path.getsize(source_path))
+
+            segments, method = align_tracks(info, [t.duration_ms / 1000 for t in tracks])
+            video_id = info.get('id') or entry.get('id')
+            ext = os.path.splitext(source_path)[1]
+            paths = [os.path.join(staging_dir, f"{video_id}-{i:03d}{ext}") for i in range(1, len(tracks) + 1)]
+            try:
+                if not segments:
+                    print(f"    Not split, searching per track: {method}")
+                    return {}
+                transcode_pool.submit(split_audio, source_path, segments, paths, ffmpeg_exe).result()
+            except Exception as e:
+                print(f"    Splitting failed, searching per track: {e}")
+                for path in paths:
+                    if os.path.exists(path):
+                        os.remove(path)
+                return {}
+            finally:
+                os.remove(source_path)
+            target.add_to_archive(f"{(info.get('extractor_key') or 'youtube').lower()} {video_id}")
+            print(f"    Split into {len(tracks)} tracks by {method}")
+
+            page = info.get('webpage_url') or page
+            chapters = info.get('chapters') if method == "chapters" else None
+            splits = {}
+            for i, ((start, end), path) in enumerate(zip(segments, paths), start=1):
+                part = (chapters[i - 1].get('title') if chapters else None) or f"{int(start) // 60}:{int(start) % 60:02d}"
+                splits[i] = (path, {
+                    # the comment tag points at the track's place in the video
+                    'webpage_url': f"{page}{'&' if '?' in page else '?'}t={int(start)}s",
+                    'id': video_id,
+                    'title': f"{info.get('title')} [{part}]",
+                    'duration': round(end - start, 1),
+                }, method)
+            return splits
+
+        def feed():
+            for target, (tracks, ids, kind) in zip(targets, sources):
+                splits = {}
+                if split_albums and kind == "album":
+                    # the album's length is needed up front, albums are at most a few pages
+                    tracks = list(tracks)
+                    splits = split_album(target, tracks, ids)
+                fed = 0
+                for i, track in enumerate(tracks, start=1):
+                    if ids is not None and track.spotify_id not in ids:
+                        continue
+                    fed += 1
+                    job = TrackJob(index=i, track=track, target=target)
+                    if i in splits:
+                        job.source_path, job.info, job.album_split = splits[i]
+                        job.metrics["album_split"] = job.album_split
+                    if track.spotify_id:
+                        with dedupe_lock:
+                            first = primaries.get(track.spotify_id)
+                            follower = first is not None and not first.finished
+                            if first is None:
+                                job.first = primaries[track.spotify_id] = FirstCopy(track, target.name)
+                            elif follower:
+                                # placed by the first job's post stage, never enters the pipeline
+                                first.followers.append(job)
+                            else:
+                                job.copy_of = first
+                        placed = follower or (job.copy_of is not None and job.copy_of.final_path)
+                        if placed and job.album_split and job.album_split != "reused":
+                            # the file comes from the track's first copy, its cut isn't needed; when
+                            # that copy already failed, the cut is used as it is
+                            os.remove(job.source_path)
+                            job.source_path = None
+                        if follower:
                             continue
-                    
-                    # download
-                    ydl.download([info['webpage_url']])
-                    final_path = find_downloaded_audio(output_dir, base)
-                    if not final_path:
-                        raise RuntimeError("Downloaded file not found after download.")
-                    tag_audio_file(final_path, row)
-                    cover_url = (row.get("Cover URL") or "").strip()
-                    if cover_url:
-                        try:
-                            raw = download_image_bytes(cover_url)
-                            jpg = normalize_cover_to_jpeg(
-                                raw,
-                                max_size=(500, 500),
-                                quality=85
-                            )
-                            embed_cover_mp3(final_path, jpg)
-                        except Exception as e:
-                            print(f"    Warning: failed to embed cover art: {e}")
-                    print(f"    Downloaded: {info.get('title')}")
-                    downloaded.append({'Track Name': track_name, 'Artist Name(s)': artist_primary, 'Album Name': album, 'Track Number': i})
-                    success = True
-                    break
+                    yield job
+                # the whole tracklist is in, the count is exact from here on
+                target.total, target.estimated = fed, False
+
+        def resolve(job: TrackJob):
+            track = job.track
+            track_name = track.title or 'Unknown'
+            duration_s = track.duration_s
+
+            if job.copy_of is not None and job.copy_of.final_path:
+                return "place"
+
+            artist_primary = track.primary_artist or 'Unknown'
+            job.base = track_basename(job.index, track_name, job.target.numbered_tracks)
+
+            if job.album_split:
+                # already cut from the album's video, see split_album
+                job.log(f"{job.label(batch)} From full album ({job.album_split}): {job.info['title']}")
+                return "post"
+
+            # a track matched on an earlier run (in any tracklist) goes straight to download
+            if not job.match_checked:
+                job.match_checked = True
+                match = match_index.get(track.spotify_id) if match_index and not refresh_matches else None
+                if match:
+                    job.log(f"{job.label(batch)} Using remembered match: {match['video_url']}")
+                    job.from_match = True
+                    job.info = {'webpage_url': match['video_url'], 'title': match['title'], 'duration': match['duration']}
+                    return "download"
+
+            if job.candidates is None:
+                # one search returning several results, ranked locally instead of one search per variant
+                q = search_query(track)
+                job.log(f"{job.label(batch)} Searching: {q}")
+
+                def search():
+                    started = time.perf_counter()
+                    try:
+                        with timed(job.metrics, "search"):
+                            return ydl_pool.get("search").extract_info(f"ytsearch{search_results}:{q}", download=False)
+                    finally:
+                        # seconds of every search attempt
+                        job.metrics.setdefault("searches", []).append(round(time.perf_counter() - started, 4))
+
+                try:
+                    # a network blip repeats the same search, anything else fails the track
+                    results = job.attempt(search, UNAVAILABLE)
+                except ClassifiedError as e:
+                    job.log(f"    Error during search: {e}")
+                    job.error = 'Search failed' if e.kind == UNAVAILABLE else ERROR_MESSAGES[e.kind]
+                    return None
+                entries = results.get('entries') or []
+                job.candidates = rank_candidates(entries, track_name, artist_primary, duration_s)
+                if not job.candidates:
+                    job.log(f"    No suitable match among {len(entries)} results (expected {duration_s}s)")
+
+            if job.candidate_pos < len(job.candidates):
+                entry, breakdown = job.candidates[job.candidate_pos]
+                job.info = {
+                    'webpage_url': entry.get('webpage_url') or entry.get('url'),
+                    'id': entry.get('id'),
+                    'title': entry.get('title'),
+                    'duration': entry.get('duration'),
+                    'score': breakdown,
+                }
+                job.log(f"    Match #{job.candidate_pos + 1}: {entry.get('title')} ({format_breakdown(breakdown)})")
+                return "download"
+
+            job.error = 'No valid download'
+            return None
+
+        def download(job: TrackJob):
+            target = job.target
+            video_id = job.info.get('id') or youtube_video_id(job.info['webpage_url'])
+            try:
+                source_path = None
+                if video_id and target.archived(f"youtube {video_id}"):
+                    # downloaded on an earlier run: reuse the file if it is still there
+                    source_path = target.index.find(job.base, prefer_ext=target_ext)
+                if not source_path:
+                    info, source_path = job.attempt(lambda: fetch(job), UNAVAILABLE)
+                    size = os.path.getsize(source_path)
+                    job.metrics["download_bytes"] = job.metrics.get("download_bytes", 0) + size
+                    scheduler.on_success(size)
+                    if info.get('id'):
+                        video_id = info['id']
+                        target.add_to_archive(f"{(info.get('extractor_key') or 'youtube').lower()} {video_id}")
+            except Exception as e:
+                job.log(f"    Error during download: {e}")
+                if isinstance(e, ClassifiedError) and e.kind in (TRANSIENT, LOCAL_IO):
+                    # retried in place already; another video would fail the same way
+                    return job.fail(e)
+                if job.from_match:
+                    # the remembered video has disappeared (or moved behind a login), search again
+                    job.log("    Forgetting remembered match")
+                    match_index.forget(job.track.spotify_id)
+                    job.from_match = False
+                    job.info = None
+                    return "resolve"
+                job.candidate_pos += 1
+                return "resolve"
+            job.info['id'] = video_id
+            job.source_path = source_path
+            return "post"
+
+        def fetch(job: TrackJob):
+            # one download attempt of the current match
+            job.metrics["download_attempts"] = job.metrics.get("download_attempts", 0) + 1
+            try:
+                with scheduler.slot(), timed(job.metrics, "download"):
+                    info = ydl_pool.get("download").extract_info(job.info['webpage_url'], download=True,
+                                                                 extra_info=staging_info())
+            except Exception as e:
+                if is_throttled(e):
+                    # youtube is pushing back, not a broken video: slow everyone down before the retry
+                    scheduler.on_throttled()
+                    job.metrics["throttled"] = job.metrics.get("throttled", 0) + 1
+                raise
+            source_path = downloaded_filepath(info) if info else None
+            if not source_path or not os.path.exists(source_path):
+                raise RuntimeError("Downloaded file not found after download.")
+            return info, source_path
+
+        def transcode(job: TrackJob, dst_path: str) -> str:
+            with timed(job.metrics, "transcode"):
+                if job.source_path.lower().endswith(target_ext):
+                    # already in the target container, just move it into place
+                    return convert_audio(job.source_path, dst_path, audio_format)
+                # remux when the codec already fits (e.g. aac -> m4a), encode otherwise
+                if not ffmpeg_exe:
+                    raise EnvironmentError("ffmpeg is required to convert this track")
+                return transcode_pool.submit(
+                    convert_audio, job.source_path, dst_path, audio_format, ffmpeg_exe, ffprobe_exe
+                ).result()
+
+        def tag(job: TrackJob, final_path: str, cover):
+            # all tags and the cover in a single write
+            with timed(job.metrics, "tag"):
+                write_tags(final_path, replace(job.track, youtube_url=job.info.get('webpage_url') or ""), cover)
+
+        def post(job: TrackJob):
+            track = job.track
+            target = job.target
+            cover = None
+            if track.cover_url:
+                try:
+                    with timed(job.metrics, "cover"):
+                        cover = cover_cache.get(track.cover_url)
                 except Exception as e:
-                    print(f"    Error during download: {e}")
-                    continue
-                
-            if not success:
-                not_found_tracks.append({'Track Name':track_name,'Artist Name(s)':artist_primary,'Album Name':album,'Track Number':i,'Error':'No valid download'})
-                
-            elapsed = time.time() - start_time
-            avg_time = elapsed / i
-            eta = avg_time * (total - i)
-            print(f"Progress: {i}/{total} | ETA ~ {int(eta)}s")
-        
-        if not_found_tracks:
-            nf_path = os.path.join(output_dir, f"{safe_filename(tracklist_name)}_not_found.csv")
-            with open(nf_path, 'w', newline='', encoding='utf-8') as cf:
-                writer = csv.DictWriter(cf, fieldnames=['Track Name','Artist Name(s)','Album Name','Track Number','Error'])
-                writer.writeheader()
-                writer.writerows(not_found_tracks)
-
-        print(f"Download completed. {len(downloaded)} tracks downloaded, {len(not_found_tracks)} not found.")
-        print(f"Tracks donwloaded to {output_dir}")
-    except Exception as e:
-        print(f"An error occurred: {e}")
\ No newline at end of file
+                    job.log(f"    Warning: failed to embed cover art: {e}")
+            try:
+                dst_path = os.path.join(target.output_dir, job.base + target_ext)
+                # the download itself is fine: a failure here is retried here, never with another video
+                final_path = job.attempt(lambda: transcode(job, dst_path), POSTPROCESS)
+                target.index.add(final_path)
+                job.attempt(lambda: tag(job, final_path, cover), POSTPROCESS)
+            except ClassifiedError as e:
+                job.log(f"    Error after download: {e}")
+                return job.fail(e)
+            job.log(f"    Downloaded: {job.info.get('title')}")
+            job.final_path = final_path
+            # a spot in a full-album video is no match for the track on its own
+            if match_index and not job.from_match and not job.album_split:
+                match_index.set(
+                    track.spotify_id,
+                    job.info.get('webpage_url'),
+                    title=job.info.get('title') or "",
+                    duration=job.info.get('duration'),
+                    score=job.info.get('score'),
+                )
+
+            first = job.first
+            if first is None:
+                return None
+            with dedupe_lock:
+                first.final_path = final_path
+                first.video_url = job.info.get('webpage_url') or ""
+                first.video_id = job.info.get('id')
+                first.finished = True
+                followers = list(first.followers)
+            for follower in followers:
+                copy_into_place(first, follower)
+            return None
+
+        def copy_into_place(first: FirstCopy, job: TrackJob):
+            job.copy_of = first
+            try:
+                with timed(job.metrics, "place"):
+                    place_copy(first, job)
+                if first.video_id:
+                    job.target.add_to_archive(f"youtube {first.video_id}")
+            except Exception as e:
+                job.log(f"    Error placing copy: {e}")
+                job.error = 'Copy failed'
+
+        def place(job: TrackJob):
+            copy_into_place(job.copy_of, job)
+            return None
+
+        def report(job: TrackJob):
+            target = job.target
+            track = job.track
+            entry = {
+                'Track Name': track.title or 'Unknown',
+                'Artist Name(s)': track.primary_artist or 'Unknown',
+                'Album Name': track.album or 'Unknown',
+                'Track Number': job.index,
+            }
+            if job.final_path:
+                entry['Spotify Track ID'] = track.spotify_id
+                entry['File'] = os.path.basename(job.final_path)
+                target.downloaded.append(entry)
+            else:
+                entry['Error'] = job.error or 'No valid download'
+                errors = job.metrics.get("errors", {})
+                entry.update({ERROR_COLUMNS[kind]: errors.get(kind, 0) for kind in ERROR_CLASSES})
+                target.not_found.append(entry)
+            # each track's lines are printed together once it leaves the pipeline
+            for line in job.lines:
+                print(line)
+            if run_report:
+                run_report.add_track(job_record(job))
+            # the job is done with: don't keep search results and output around until the run ends
+            job.candidates = None
+            job.info = None
+            job.lines = []
+
+        done = [0]
+        # completion times of the last tracks, the ETA follows the current rate rather than the run average
+        recent = deque(maxlen=50)
+
+        def on_done(job: TrackJob):
+            followers = []
+            if job.first:
+                with dedupe_lock:
+                    # a first job that failed takes its followers down with it
+                    job.first.finished = True
+                    followers, job.first.followers = job.first.followers, []
+            for follower in followers:
+                if not follower.final_path:
+                    follower.error = job.error or 'No valid download'
+                    follower.log(f"{follower.label(batch)} {follower.track.title}: {follower.error}")
+            for j in [job] + followers:
+                report(j)
+            done[0] += 1 + len(followers)
+            now = time.time()
+            recent.extend([now] * (1 + len(followers)))
+
+            if len(recent) > 1 and recent[-1] > recent[0]:
+                avg_time = (recent[-1] - recent[0]) / (len(recent) - 1)
+            else:
+                avg_time = (now - start_time) / done[0]
+            total = grand_total()
+            if total:
+                eta = avg_time * max(0, total - done[0])
+                approx = "~" if any(t.estimated for t in targets) else ""
+                print(f"Progress: {done[0]}/{approx}{total} | ETA ~ {int(eta)}s | {scheduler.state()}")
+            else:
+                print(f"Progress: {done[0]} | {scheduler.state()}")
+
+        if run_report:
+            stage_callbacks = [cb for cb in (on_stage, run_report.on_stage) if cb]
+
+            def on_stage(stage, job, seconds):
+                for cb in stage_callbacks:
+                    cb(stage, job, seconds)
+
+        # numbering comes from the tracklist position, so it does not depend on completion order
+        run_pipeline(feed(), [
+            Stage("resolve", resolve, workers=search_jobs),
+            Stage("download", download, workers=jobs, maxsize=2 * jobs),
+            Stage("post", post, workers=transcode_jobs, maxsize=2 * transcode_jobs),
+            Stage("place", place, workers=1, maxsize=2),
+        ], on_done=on_done, max_pending=4 * (search_jobs + jobs + transcode_jobs), on_stage=on_stage)
+    finally:
+        # a feed that failed half way (e.g. a spotify error) still reports the tracks that got done,
+        # then the error goes on to the caller
+        if ydl_pool:
+            ydl_pool.close()
+        if own_transcode_pool and transcode_pool:
+            transcode_pool.shutdown()
+        if staging_dir:
+            try:
+                os.rmdir(staging_dir)
+            except OSError:
+                pass  # leftovers from failed tracks
+
+        for target in targets:
+            target.downloaded.sort(key=lambda r: r['Track Number'])
+            target.not_found.sort(key=lambda r: r['Track Number'])
+
+            if target.not_found:
+                write_not_found_csv(not_found_csv_path(target.output_dir, target.name), target.not_found)
+
+            print(f"Download completed. {len(target.downloaded)} tracks downloaded, {len(target.not_found)} not found.")
+            print(f"Tracks donwloaded to {target.output_dir}")
+
+    results = [(t.downloaded, t.not_found) for t in targets]
+    return results + [([], [])] * (len(tracklists) - len(results))
@@ -0,0 +1,55 @@
+import pytest
+
+from spotify2media.albums import align_tracks, album_duration_s, rank_album_videos
+from spotify2media.tracks import Track
+
+
+def chapters(*lengths, offset=0.0):
+    result, start = [], offset
+    for length in lengths:
+        result.append({"start_time": start, "end_time": start + length, "title": f"Chapter at {start}"})
+        start += length
+    return result
+
+
+def test_align_tracks_uses_chapters_that_line_up():
+    info = {"duration": 601, "chapters": chapters(181, 240, 180)}
+    segments, how = align_tracks(info, [180, 242, 179])
+    assert how == "chapters"
+    assert segments == [(0.0, 181.0), (181.0, 421.0), (421.0, 601.0)]
+
+def test_align_tracks_falls_back_to_durations():
+    # chapters that don't match the tracks (e.g. an intro) are ignored when the lengths agree
+    info = {"duration": 602.0, "chapters": chapters(30, 572)}
+    segments, how = align_tracks(info, [200, 200, 200])
+    assert how == "durations"
+    assert len(segments) == 3
+    assert segments[0][0] == 0.0
+    assert segments[-1][1] == pytest.approx(602.0)
+    # stretched evenly over the video
+    assert [end - start for start, end in segments] == pytest.approx([200.0 * 602 / 600] * 3)
+
+@pytest.mark.parametrize("info, reason", [
+    ({"duration": 780, "chapters": chapters(100, 100)}, "2 chapters for 3 tracks don't line up"),
+    ({"duration": 780}, "video is 780s, the album 600s"),
+    ({}, "video length unknown"),
+])
+def test_align_tracks_gives_up(info, reason):
+    assert align_tracks(info, [200, 200, 200]) == (None, reason)
+
+def test_album_duration_needs_every_track():
+    tracks = [Track(title="a", duration_ms=200000), Track(title="b", duration_ms=100500)]
+    assert album_duration_s(tracks) == 300.5
+    assert album_duration_s(tracks + [Track(title="c")]) is None
+    assert album_duration_s([]) is None
+
+def test_rank_album_videos():
+    entries = [
+        {"title": "Some Album (Full Album)", "channel": "Band", "duration": 1805},
+        {"title": "Some Album", "channel": "Uploader", "duration": 1800},
+        {"title": "Some Album (Full Album)", "channel": "Band", "duration": 2400},  # too long
+        {"title": "Another record", "channel": "Band", "duration": 1800},  # names too little of the album
+        {"title": "Some Album", "duration": None},
+    ]
+    ranked = rank_album_videos(entries, "Some Album", "Band", 1800)
+    assert [(e["channel"], e["duration"]) for e in ranked] == [("Band", 1805), ("Uploader", 1800)]
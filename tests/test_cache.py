@@ -0,0 +1,126 @@
+import pytest
+
+from spotify2media.cache import CacheStore, MatchIndex, MetadataCache
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def store(tmp_path):
+    store = CacheStore(str(tmp_path / "cache.sqlite"))
+    yield store
+    store.close()
+
+def value(n):
+    # a 100 byte entry once encoded
+    return f"{n:0>98}"
+
+def stored_keys(store):
+    return sorted(key for (key,) in store.execute("SELECT key FROM spotify_cache"))
+
+
+def test_round_trip(store):
+    cache = MetadataCache(store, ttl_seconds=0, max_bytes=0)
+    cache.set("album", "a1", {"name": "Album", "tracks": [1, 2]})
+    assert cache.get("album", "a1") == {"name": "Album", "tracks": [1, 2]}
+    assert cache.get("album", "missing") is None
+    assert cache.get("track", "a1") is None
+    assert cache.get_many("album", ["a1", "missing"]) == {"a1": {"name": "Album", "tracks": [1, 2]}}
+
+def test_entries_expire_after_ttl(store):
+    clock = Clock()
+    cache = MetadataCache(store, ttl_seconds=60, max_bytes=0, clock=clock)
+    cache.set("album", "a1", value(1))
+
+    clock.now += 59
+    assert cache.get("album", "a1") == value(1)
+    # reading doesn't extend the lifetime
+    clock.now += 2
+    assert cache.get("album", "a1") is None
+    # the expired row is gone, with its bytes
+    assert stored_keys(store) == []
+    assert cache._size == 0
+
+def test_no_ttl_keeps_entries(store):
+    clock = Clock()
+    cache = MetadataCache(store, ttl_seconds=0, max_bytes=0, clock=clock)
+    cache.set("album", "a1", value(1))
+    clock.now += 10 ** 9
+    assert cache.get("album", "a1") == value(1)
+
+def test_least_recently_used_entries_are_evicted(store):
+    clock = Clock()
+    cache = MetadataCache(store, ttl_seconds=0, max_bytes=350, clock=clock)
+    for n in (1, 2, 3):
+        clock.now += 1
+        cache.set("album", f"a{n}", value(n))
+    # a1 is read again, so a2 is now the oldest
+    clock.now += 1
+    cache.get("album", "a1")
+
+    clock.now += 1
+    cache.set("album", "a4", value(4))
+
+    # 400 bytes > 350: the oldest go until the cache is under 90% of the limit (315)
+    assert stored_keys(store) == ["a1", "a3", "a4"]
+    assert cache._size == 300
+
+def test_replacing_an_entry_keeps_the_size_right(store):
+    cache = MetadataCache(store, ttl_seconds=0, max_bytes=250)
+    cache.set("album", "a1", value(1))
+    cache.set("album", "a1", value(2))
+    cache.set("album", "a2", value(3))
+    assert cache._size == 200
+    assert stored_keys(store) == ["a1", "a2"]
+
+def test_size_is_read_back_on_open(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    store = CacheStore(path)
+    MetadataCache(store, ttl_seconds=0, max_bytes=0).set_many("album", {"a1": value(1), "a2": value(2)})
+    store.close()
+
+    store = CacheStore(path)
+    try:
+        assert MetadataCache(store, ttl_seconds=0, max_bytes=0)._size == 200
+    finally:
+        store.close()
+
+
+def test_match_index(store):
+    index = MatchIndex(store)
+    assert index.get("s1") is None
+    index.set("s1", "https://youtu.be/a", title="A", duration=200.0, score={"total": 0.9, "title": 1.0})
+    assert index.get("s1") == {"video_url": "https://youtu.be/a", "title": "A", "duration": 200.0,
+                               "score": {"total": 0.9, "title": 1.0}}
+    # a new match replaces the old one
+    index.set("s1", "https://youtu.be/b")
+    assert index.get("s1") == {"video_url": "https://youtu.be/b", "title": "", "duration": None, "score": None}
+
+    index.forget("s1")
+    assert index.get("s1") is None
+    index.forget("s1")
+
+def test_match_index_ignores_missing_ids(store):
+    index = MatchIndex(store)
+    index.set("", "https://youtu.be/a")
+    index.set("s1", "")
+    assert index.get("") is None
+    assert index.get("s1") is None
+    assert store.execute("SELECT COUNT(*) FROM youtube_matches") == [(0,)]
+
+def test_matches_outlive_the_store(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    store = CacheStore(path)
+    MatchIndex(store).set("s1", "https://youtu.be/a", title="A")
+    store.close()
+
+    store = CacheStore(path)
+    try:
+        assert MatchIndex(store).get("s1")["video_url"] == "https://youtu.be/a"
+    finally:
+        store.close()
@@ -0,0 +1,43 @@
+import os
+
+import pytest
+
+from spotify2media.daemon import validate_job
+
+URL = "https://open.spotify.com/playlist/37i9dQZF1DXcBWIGoYBM5M"
+
+
+def test_validate_job(tmp_path):
+    body = {"mode": "sync", "urls": [URL],
+            "options": {"output": "mixes", "format": "flac", "sort": "keep", "numbered": False, "prune": "move"}}
+    mode, urls, options = validate_job(body, str(tmp_path))
+    assert (mode, urls) == ("sync", [URL])
+    assert options == {"output": os.path.join(os.path.realpath(tmp_path), "mixes"), "format": "flac",
+                       "sort": "keep", "numbered": False, "prune": "move"}
+
+def test_validate_job_defaults(tmp_path):
+    assert validate_job({"urls": URL}, str(tmp_path)) == ("download", [URL], {})
+    assert validate_job({"urls": [URL], "options": None}, str(tmp_path)) == ("download", [URL], {})
+
+@pytest.mark.parametrize("body, error", [
+    ([URL], "expected a JSON object"),
+    ({"urls": [URL], "mode": "mirror"}, "mode must be one of"),
+    ({"urls": []}, "urls must be"),
+    ({"urls": {URL: 1}}, "urls must be"),
+    ({"urls": [URL, 3]}, "urls must be"),
+    ({"urls": ["https://example.com/playlist/1"]}, "Invalid Spotify URL"),
+    ({"urls": [URL], "options": ["numbered"]}, "options must be a JSON object"),
+    ({"urls": [URL], "options": "mp3"}, "options must be a JSON object"),
+    ({"urls": [URL], "options": {"jobs": 64}}, "unknown options: jobs"),
+    ({"urls": [URL], "options": {"format": "ogg"}}, "format must be one of"),
+    ({"urls": [URL], "options": {"sort": ["album"]}}, "sort must be"),
+    ({"urls": [URL], "options": {"numbered": "false"}}, "numbered must be true or false"),
+    ({"urls": [URL], "options": {"numbered": 0}}, "numbered must be true or false"),
+    ({"urls": [URL], "options": {"prune": True}}, "prune must be one of"),
+    ({"urls": [URL], "options": {"prune": "all"}}, "prune must be one of"),
+    ({"urls": [URL], "options": {"output": ""}}, "output must be a folder name"),
+    ({"urls": [URL], "options": {"output": "../elsewhere"}}, "output must be inside"),
+])
+def test_validate_job_rejects(tmp_path, body, error):
+    with pytest.raises(ValueError, match=error):
+        validate_job(body, str(tmp_path))
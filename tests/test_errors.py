@@ -0,0 +1,75 @@
+import errno
+import socket
+
+import pytest
+
+from spotify2media.errors import (LOCAL_IO, POSTPROCESS, TRANSIENT, UNAVAILABLE, ClassifiedError, RetryPolicy,
+                                  call_with_retries, classify)
+
+
+class DownloadError(Exception):
+    # stands in for yt_dlp.utils.DownloadError, which carries its cause in the message
+    pass
+
+
+@pytest.mark.parametrize("error, kind", [
+    (ConnectionResetError(), TRANSIENT),
+    (socket.timeout(), TRANSIENT),
+    (DownloadError("ERROR: Unable to download webpage: The read operation timed out"), TRANSIENT),
+    (DownloadError("ERROR: unable to download video data: HTTP Error 503: Service Unavailable"), TRANSIENT),
+    (DownloadError("ERROR: unable to download video data: HTTP Error 429: Too Many Requests"), TRANSIENT),
+    (DownloadError("ERROR: [youtube] abc: Video unavailable"), UNAVAILABLE),
+    (DownloadError("ERROR: [youtube] abc: Private video. Sign in if you've been granted access"), UNAVAILABLE),
+    (DownloadError("ERROR: unable to download video data: HTTP Error 404: Not Found"), UNAVAILABLE),
+    (OSError(errno.ENOSPC, "No space left on device"), LOCAL_IO),
+    (PermissionError(errno.EACCES, "Permission denied"), LOCAL_IO),
+    (DownloadError("ERROR: unable to write data: [Errno 28] No space left on device"), LOCAL_IO),
+    (ClassifiedError(POSTPROCESS, RuntimeError("ffmpeg failed")), POSTPROCESS),
+])
+def test_classify(error, kind):
+    assert classify(error) == kind
+
+def test_classify_unrecognised_uses_default():
+    assert classify(RuntimeError("ffmpeg exited with code 1")) == UNAVAILABLE
+    assert classify(RuntimeError("ffmpeg exited with code 1"), default=POSTPROCESS) == POSTPROCESS
+
+
+NO_WAIT = {
+    TRANSIENT: RetryPolicy(retries=2, base_delay=0.0, max_delay=0.0),
+    UNAVAILABLE: RetryPolicy(retries=0, base_delay=0.0, max_delay=0.0),
+    POSTPROCESS: RetryPolicy(retries=1, base_delay=0.0, max_delay=0.0),
+    LOCAL_IO: RetryPolicy(retries=0, base_delay=0.0, max_delay=0.0),
+}
+
+def failing(*errors, result="ok"):
+    errors = list(errors)
+
+    def fn():
+        if errors:
+            raise errors.pop(0)
+        return result
+    return fn
+
+def test_call_with_retries_recovers_from_transient_errors():
+    counts, retried = {}, []
+    fn = failing(TimeoutError(), ConnectionResetError())
+    assert call_with_retries(fn, UNAVAILABLE, counts, on_retry=lambda kind, e, delay: retried.append(kind),
+                             policies=NO_WAIT) == "ok"
+    assert counts == {TRANSIENT: 2}
+    assert retried == [TRANSIENT, TRANSIENT]
+
+def test_call_with_retries_gives_up_when_retries_run_out():
+    counts = {}
+    fn = failing(TimeoutError(), TimeoutError(), TimeoutError())
+    with pytest.raises(ClassifiedError) as info:
+        call_with_retries(fn, UNAVAILABLE, counts, policies=NO_WAIT)
+    assert info.value.kind == TRANSIENT
+    assert counts == {TRANSIENT: 3}
+
+def test_call_with_retries_does_not_retry_unavailable():
+    counts = {}
+    fn = failing(DownloadError("Video unavailable"))
+    with pytest.raises(ClassifiedError) as info:
+        call_with_retries(fn, POSTPROCESS, counts, policies=NO_WAIT)
+    assert info.value.kind == UNAVAILABLE
+    assert counts == {UNAVAILABLE: 1}
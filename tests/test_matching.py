@@ -0,0 +1,51 @@
+import pytest
+
+from spotify2media.matching import MAX_DURATION_DELTA, WEIGHTS, normalize_text, rank_candidates, score_candidate
+
+
+def entry(title, channel="Someone", duration=200, **extra):
+    return {"title": title, "channel": channel, "duration": duration, **extra}
+
+
+def test_normalize_text():
+    assert normalize_text("Beyoncé - Halo (Official Video)!") == "beyonce halo official video"
+    assert normalize_text(None) == ""
+
+def test_exact_match_from_topic_channel():
+    total, breakdown = score_candidate(entry("Halo", "Beyonce - Topic"), "Halo", "Beyoncé", 200)
+    assert breakdown["duration"] == WEIGHTS["duration"]
+    assert breakdown["title"] == WEIGHTS["title"]
+    assert breakdown["artist"] == WEIGHTS["artist"]
+    assert breakdown["channel"] == WEIGHTS["topic_channel"]
+    assert total == breakdown["total"] == 95.0
+
+def test_duration_too_far_off_is_rejected():
+    total, breakdown = score_candidate(entry("Halo", duration=200 + MAX_DURATION_DELTA + 1), "Halo", "Beyonce", 200)
+    assert total is None
+    assert breakdown["total"] is None
+
+def test_unknown_duration_is_neutral():
+    _, breakdown = score_candidate(entry("Halo", duration=None), "Halo", "Beyonce", 200)
+    assert breakdown["duration"] == WEIGHTS["duration"] / 2
+
+@pytest.mark.parametrize("title, track_name, penalized", [
+    ("Halo (Live at Wembley)", "Halo", True),
+    ("Halo - Live", "Halo - Live", False),
+    ("Halo (Sped Up)", "Halo", True),
+    ("Halo Delivery", "Halo", False),  # "live" only counts as a whole word
+])
+def test_version_penalty(title, track_name, penalized):
+    _, breakdown = score_candidate(entry(title), track_name, "Beyonce", 200)
+    assert (breakdown["penalty"] < 0) == penalized
+
+def test_rank_candidates_best_first_and_drops_rejects():
+    entries = [
+        entry("Halo (Karaoke Version)"),
+        entry("Halo", "Beyonce - Topic", 201),
+        None,
+        entry("Halo", duration=400),
+        entry("Something else entirely", duration=225),  # below MIN_SCORE
+        entry("Beyonce - Halo (Official Video)", "BeyonceVEVO", 215),
+    ]
+    ranked = rank_candidates(entries, "Halo", "Beyonce", 200)
+    assert [e["title"] for e, _ in ranked] == ["Halo", "Beyonce - Halo (Official Video)", "Halo (Karaoke Version)"]
@@ -0,0 +1,133 @@
+import threading
+import time
+
+import pytest
+
+from spotify2media.pipeline import Stage, run_pipeline
+
+
+class Job:
+    def __init__(self, n):
+        self.n = n
+        self.error = None
+        self.visits = 0
+
+def jobs(count, fed=None):
+    # with fed set once the pipeline has taken the last job
+    for n in range(count):
+        yield Job(n)
+    if fed:
+        fed.set()
+
+
+def test_jobs_run_through_every_stage():
+    seen = []
+    done = []
+
+    def double(job):
+        job.n *= 2
+        return "record"
+
+    def record(job):
+        seen.append(job.n)
+
+    run_pipeline(jobs(20), [Stage("double", double, workers=3), Stage("record", record, workers=2, maxsize=1)],
+                 on_done=done.append)
+    assert sorted(seen) == [n * 2 for n in range(20)]
+    assert len(done) == 20
+
+def test_first_stage_serves_jobs_in_feed_order():
+    fed = threading.Event()
+    served = []
+
+    def resolve(job):
+        # the first job holds the single worker until everything is queued
+        fed.wait()
+        served.append(job.n)
+        job.visits += 1
+        # job 0 goes round again, ahead of the jobs fed after it
+        return "resolve" if job.n == 0 and job.visits == 1 else None
+
+    run_pipeline(jobs(5, fed), [Stage("resolve", resolve)])
+    assert served == [0, 0, 1, 2, 3, 4]
+
+def test_max_pending_bounds_jobs_in_flight():
+    lock = threading.Lock()
+    in_flight, peak = [0], [0]
+
+    def start(job):
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        return "work"
+
+    def work(job):
+        time.sleep(0.005)
+
+    def done(job):
+        with lock:
+            in_flight[0] -= 1
+
+    run_pipeline(jobs(40), [Stage("start", start, workers=4), Stage("work", work, workers=8)],
+                 on_done=done, max_pending=3)
+    assert 1 <= peak[0] <= 3
+
+def test_feed_error_is_raised_after_the_fed_jobs_finish():
+    done = []
+
+    def feed():
+        yield from jobs(3)
+        raise RuntimeError("page failed")
+
+    with pytest.raises(RuntimeError, match="page failed"):
+        run_pipeline(feed(), [Stage("work", lambda job: time.sleep(0.01), workers=2)], on_done=done.append)
+    assert sorted(job.n for job in done) == [0, 1, 2]
+
+def test_stage_error_finishes_the_job_with_it():
+    done = []
+
+    def work(job):
+        if job.n == 1:
+            raise KeyError("boom")
+
+    run_pipeline(jobs(3), [Stage("work", work)], on_done=done.append)
+    assert {job.n: job.error for job in done} == {0: None, 1: "KeyError: 'boom'", 2: None}
+
+def test_on_done_error_doesnt_hang_the_pipeline():
+    done = []
+
+    def on_done(job):
+        done.append(job.n)
+        if job.n == 2:
+            raise ValueError("bad report")
+
+    raised = []
+
+    def run():
+        try:
+            run_pipeline(jobs(6), [Stage("work", lambda job: None, workers=2)], on_done=on_done)
+        except ValueError as e:
+            raised.append(e)
+
+    # in a thread, so a pipeline waiting forever fails the test instead of hanging it
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert sorted(done) == list(range(6))
+    assert [str(e) for e in raised] == ["bad report"]
+
+def test_on_stage_error_doesnt_hang_the_pipeline():
+    done = []
+
+    def on_stage(name, job, seconds):
+        raise ValueError("bad metrics")
+
+    with pytest.raises(ValueError, match="bad metrics"):
+        run_pipeline(jobs(4), [Stage("a", lambda job: "b", workers=2), Stage("b", lambda job: None)],
+                     on_done=done.append, on_stage=on_stage)
+    assert len(done) == 4
+
+def test_needs_a_stage():
+    with pytest.raises(ValueError):
+        run_pipeline(jobs(1), [])
@@ -0,0 +1,77 @@
+import json
+import os
+import zlib
+
+import pytest
+
+from spotify2media.plan import SHARD_RESULT_GLOB, _plan_tracklists, merge_shards, parse_shard, shard_of
+from spotify2media.sync import load_manifest
+from spotify2media.tracks import Tracklist
+
+
+@pytest.mark.parametrize("text, shard", [("1/1", (1, 1)), ("2/4", (2, 4)), (" 3 / 3 ", (3, 3))])
+def test_parse_shard(text, shard):
+    assert parse_shard(text) == shard
+
+@pytest.mark.parametrize("text", ["", "2", "2/", "a/b", "1/2/3", "0/4", "5/4", "-1/4"])
+def test_parse_shard_rejects(text):
+    with pytest.raises(ValueError):
+        parse_shard(text)
+
+def test_shard_of_is_stable_and_in_range():
+    ids = [f"spotify{i}" for i in range(200)]
+    shards = [shard_of(spotify_id, 4) for spotify_id in ids]
+    assert set(shards) == {1, 2, 3, 4}
+    # the same on every machine and interpreter run
+    assert shards == [zlib.crc32(spotify_id.encode("utf-8")) % 4 + 1 for spotify_id in ids]
+    assert all(shard_of(spotify_id, 1) == 1 for spotify_id in ids)
+
+def test_plan_tracklists_keys_and_folders_are_unique():
+    tracklists = [
+        Tracklist("Mix", [], "", [], kind="playlist", spotify_id="p1"),
+        Tracklist("Mix", [], "", [], kind="playlist", spotify_id="p2"),
+        Tracklist("Mix", [], "", [], kind="playlist", spotify_id="p1"),
+        Tracklist("From csv", [], "", []),
+    ]
+    assert _plan_tracklists(tracklists) == [
+        {"id": "spotify:playlist:p1", "name": "Mix"},
+        {"id": "spotify:playlist:p2", "name": "Mix (2)"},
+        {"id": "spotify:playlist:p1#3", "name": "Mix (3)"},
+        {"id": "tracklist:4", "name": "From csv"},
+    ]
+
+def entry(position, spotify_id):
+    return {"Track Name": f"Song {spotify_id}", "Track Number": position, "Spotify Track ID": spotify_id,
+            "File": f"{position:03d} - Song {spotify_id}.mp3"}
+
+def write_shard(folder, shard, tracklists):
+    os.makedirs(folder, exist_ok=True)
+    for tl in tracklists:
+        os.makedirs(os.path.join(folder, tl["name"]), exist_ok=True)
+        for e in tl["downloaded"]:
+            with open(os.path.join(folder, tl["name"], e["File"]), "w") as f:
+                f.write(e["File"])
+    with open(os.path.join(folder, SHARD_RESULT_GLOB.replace("*", f"{shard[0]}-of-{shard[1]}")), "w") as f:
+        json.dump({"plan": "t", "shard": list(shard), "tracklists": tracklists}, f)
+
+def test_merge_shards(tmp_path):
+    write_shard(tmp_path / "s1", (1, 2), [
+        {"id": "spotify:playlist:p1", "name": "Mix", "downloaded": [entry(1, "a"), entry(3, "a")], "not_found": []},
+    ])
+    write_shard(tmp_path / "s2", (2, 2), [
+        {"id": "spotify:playlist:p1", "name": "Mix", "downloaded": [entry(2, "b")], "not_found": []},
+        {"id": "spotify:playlist:p2", "name": "Mix (2)", "downloaded": [entry(1, "c")], "not_found": []},
+    ])
+    out = tmp_path / "out"
+
+    merged = merge_shards([str(tmp_path / "s1"), str(tmp_path / "s2")], str(out))
+
+    assert {name: len(d) for name, (d, _) in merged.items()} == {"Mix": 3, "Mix (2)": 1}
+    assert sorted(os.listdir(out / "Mix")) == [".playlist-maker.json", "001 - Song a.mp3", "002 - Song b.mp3",
+                                               "003 - Song a.mp3", "downloaded.txt"]
+    # a track listed twice is recorded at its first position
+    assert load_manifest(str(out / "Mix"))["tracks"] == {
+        "a": {"file": "001 - Song a.mp3", "position": 1},
+        "b": {"file": "002 - Song b.mp3", "position": 2},
+    }
+    assert list(load_manifest(str(out / "Mix (2)"))["tracks"]) == ["c"]
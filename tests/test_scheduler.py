@@ -0,0 +1,165 @@
+import threading
+import time
+
+import pytest
+
+from spotify2media import scheduler
+from spotify2media.scheduler import DownloadScheduler, is_throttled, parse_rate
+
+
+class FakeTime:
+    # stands in for the scheduler's time module: sleeping moves the clock instead of waiting
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(scheduler, "time", fake)
+    return fake
+
+def finish_round(s, clock, seconds, nbytes=1000):
+    # `limit` downloads of nbytes finishing within `seconds`
+    for _ in range(s.limit):
+        clock.now += seconds / s.limit
+        s.on_success(nbytes)
+
+
+def test_fixed_limit_without_adaptive(clock):
+    s = DownloadScheduler(6)
+    assert s.limit == 6
+    finish_round(s, clock, 1.0)
+    finish_round(s, clock, 10.0)
+    s.on_throttled()
+    assert s.limit == 6
+
+def test_aimd_increase_and_decrease(clock):
+    s = DownloadScheduler(8, adaptive=True)
+    # starts at half and earns the rest
+    assert s.limit == 4
+    finish_round(s, clock, 1.0)
+    assert s.limit == 5
+    # faster: one more
+    finish_round(s, clock, 0.5)
+    assert s.limit == 6
+    # about the same throughput: stays
+    finish_round(s, clock, 0.6)
+    assert s.limit == 6
+    # slower: one less
+    finish_round(s, clock, 2.0)
+    assert s.limit == 5
+
+def test_aimd_stays_within_bounds(clock):
+    s = DownloadScheduler(3, adaptive=True, min_jobs=2)
+    for n in range(5):
+        finish_round(s, clock, 1.0 / (n + 1))
+    assert s.limit == 3
+    for n in range(5):
+        finish_round(s, clock, 2.0 ** n)
+    assert s.limit == 2
+
+def test_throttle_halves_the_limit_and_backs_off(clock):
+    s = DownloadScheduler(16, adaptive=True, max_backoff=3)
+    assert s.limit == 8
+    s.on_throttled()
+    assert (s.limit, s._paused_until - clock.now) == (4, 1)
+    # downloads that fail during the pause are the same event
+    s.on_throttled()
+    assert (s.limit, s.throttled) == (4, 2)
+
+    clock.now += 1
+    s.on_throttled()
+    assert (s.limit, s._paused_until - clock.now) == (2, 2)
+    clock.now += 2
+    s.on_throttled()
+    # capped at max_backoff
+    assert (s.limit, s._paused_until - clock.now) == (1, 3)
+
+    # a success resets the backoff
+    clock.now += 3
+    s.on_success(1000)
+    s.on_throttled()
+    assert s._paused_until - clock.now == 1
+
+@pytest.mark.parametrize("message, throttled", [
+    ("ERROR: unable to download video data: HTTP Error 403: Forbidden", True),
+    ("ERROR: unable to download video data: HTTP Error 429: Too Many Requests", True),
+    ("ERROR: unable to download video data: HTTP Error 404: Not Found", False),
+    ("ERROR: [youtube] abc: Video unavailable", False),
+])
+def test_is_throttled(message, throttled):
+    assert is_throttled(RuntimeError(message)) == throttled
+
+def test_bandwidth_cap(clock):
+    s = DownloadScheduler(4, max_rate=1000)
+    for _ in range(10):
+        s.throttle(500)
+    # one second's worth goes through as a burst, the other 4000 bytes take 4s
+    assert sum(clock.sleeps) == pytest.approx(4.0)
+    assert clock.sleeps == pytest.approx([0.5] * 8)
+
+def test_no_cap_never_sleeps(clock):
+    s = DownloadScheduler(4)
+    for _ in range(10):
+        s.throttle(10 ** 9)
+    assert clock.sleeps == []
+
+def test_progress_hook_feeds_deltas_per_file(clock):
+    s = DownloadScheduler(4, max_rate=10 ** 9)
+    fed = []
+    s.throttle = fed.append
+    for downloaded in (100, 300, 300, 600):
+        s.progress_hook({"status": "downloading", "filename": "a.mp3", "tmpfilename": "a.mp3.part",
+                         "downloaded_bytes": downloaded})
+    s.progress_hook({"status": "downloading", "filename": "b.mp3", "downloaded_bytes": 50})
+    s.progress_hook({"status": "finished", "filename": "a.mp3", "downloaded_bytes": 600})
+    assert fed == [100, 200, 300, 50]
+    # finished files are forgotten
+    assert list(s._seen) == ["b.mp3"]
+
+def test_parse_rate():
+    assert parse_rate("800K") == 800 * 1024
+    assert parse_rate("2.5M") == 2.5 * 1024 ** 2
+    assert parse_rate("1gb/s") == 1024 ** 3
+    assert parse_rate("0") == 0
+    with pytest.raises(ValueError):
+        parse_rate("fast")
+
+
+def test_slot_limits_concurrent_downloads():
+    s = DownloadScheduler(2)
+    running, peak = [0], [0]
+    lock = threading.Lock()
+
+    def download():
+        with s.slot():
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+
+    threads = [threading.Thread(target=download) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert peak[0] == 2
+    assert s.active == 0
+
+def test_slot_waits_out_the_backoff():
+    s = DownloadScheduler(2, max_backoff=0.2)
+    s.on_throttled()
+    started = time.monotonic()
+    with s.slot():
+        pass
+    assert time.monotonic() - started >= 0.19
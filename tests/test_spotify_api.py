@@ -0,0 +1,168 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+import requests
+
+from spotify2media.spotify_api import SpotifyAPI, SpotifyAPIError, TokenBucket
+from spotify2media.spotify_client import _iter_pages, tracklist_from_url
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "benchmarks"))
+from fake_services import FakeSpotify  # noqa: E402
+
+
+class Response:
+    def __init__(self, status_code=200, body=None, headers=None):
+        self.status_code = status_code
+        self.body = body if body is not None else {}
+        self.headers = headers or {}
+        self.text = str(self.body)
+
+    def json(self):
+        return self.body
+
+
+class StubSession:
+    """Answers GETs from a list of responses (or exceptions to raise), hands out numbered tokens."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.tokens = 0
+        self.auth_headers = []
+
+    def post(self, url, **kwargs):
+        self.tokens += 1
+        return Response(body={"access_token": f"t{self.tokens}", "expires_in": 3600})
+
+    def get(self, url, params=None, timeout=None, headers=None):
+        self.auth_headers.append(headers["Authorization"])
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def api(session, **kwargs):
+    statuses = []
+    client = SpotifyAPI("id", "secret", session=session, requests_per_second=0,
+                        on_request=lambda url, status, seconds: statuses.append(status), **kwargs)
+    return client, statuses
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    # backoff sleeps are recorded instead of slept
+    slept = []
+    monkeypatch.setattr("spotify2media.spotify_api.time.sleep", slept.append)
+    return slept
+
+
+def test_ok():
+    client, statuses = api(StubSession(Response(body={"id": "x"})))
+    assert client.track("x") == {"id": "x"}
+    assert statuses == [200]
+
+def test_429_waits_for_retry_after():
+    client, statuses = api(StubSession(Response(429, headers={"Retry-After": "0.2"}), Response(body={"id": "x"})))
+    started = time.monotonic()
+    assert client.track("x") == {"id": "x"}
+    assert time.monotonic() - started >= 0.2
+    assert statuses == [429, 200]
+
+def test_429_gives_up_after_max_rate_limit_wait():
+    session = StubSession(*[Response(429, headers={"Retry-After": "0.3"}) for _ in range(10)])
+    client, statuses = api(session, max_rate_limit_wait=0.5)
+    with pytest.raises(SpotifyAPIError) as info:
+        client.track("x")
+    assert info.value.status == 429
+    # a second 0.3s pause would end past the 0.5s deadline
+    assert statuses == [429, 429]
+
+def test_401_refreshes_the_token_once():
+    session = StubSession(Response(401), Response(body={"id": "x"}))
+    client, _ = api(session)
+    assert client.track("x") == {"id": "x"}
+    assert session.auth_headers == ["Bearer t1", "Bearer t2"]
+
+    session.responses = [Response(401), Response(401)]
+    client, _ = api(session)
+    with pytest.raises(SpotifyAPIError) as info:
+        client.track("x")
+    assert info.value.status == 401
+
+def test_5xx_and_connection_errors_back_off(sleeps):
+    session = StubSession(Response(503), requests.ConnectionError("reset"), Response(502), Response(body={"id": "x"}))
+    client, statuses = api(session)
+    assert client.track("x") == {"id": "x"}
+    assert statuses == [503, 0, 502, 200]
+    assert sleeps == [0.5, 1.0, 2.0]
+
+def test_5xx_raises_once_retries_are_used(sleeps):
+    client, _ = api(StubSession(Response(500), Response(500), Response(500)), max_retries=2)
+    with pytest.raises(SpotifyAPIError) as info:
+        client.track("x")
+    assert info.value.status == 500
+    assert sleeps == [0.5, 1.0]
+
+def test_4xx_is_not_retried():
+    client, statuses = api(StubSession(Response(404)))
+    with pytest.raises(SpotifyAPIError):
+        client.track("x")
+    assert statuses == [404]
+
+
+def test_token_bucket_rate():
+    bucket = TokenBucket(20, burst=1)
+    started = time.monotonic()
+    for _ in range(5):
+        bucket.acquire()
+    # the first token is there already, the other four take 1/20s each
+    assert time.monotonic() - started >= 0.19
+
+def test_token_bucket_pause_holds_everyone_back():
+    bucket = TokenBucket(0)
+    bucket.pause(0.2)
+    started = time.monotonic()
+    bucket.acquire()
+    assert time.monotonic() - started >= 0.19
+
+
+def test_iter_pages_keeps_order_and_bounds_concurrency():
+    page_size, total, workers = 10, 95, 3
+    running, peak = [0], [0]
+    lock = threading.Lock()
+
+    def fetch_page(offset):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        # later pages answer first
+        time.sleep(0.02 * (1 - offset / total))
+        with lock:
+            running[0] -= 1
+        end = min(total, offset + page_size)
+        return {"items": list(range(offset, end)), "total": total, "next": "more" if end < total else None}
+
+    items = []
+    for page in _iter_pages(fetch_page, page_size, workers=workers):
+        items.extend(page)
+        time.sleep(0.01)
+
+    assert items == list(range(total))
+    assert peak[0] <= workers
+
+def test_playlist_from_fake_server():
+    server = FakeSpotify().start()
+    try:
+        client = SpotifyAPI("id", "secret", api_url=f"{server.url}/v1", token_url=f"{server.url}/token",
+                            requests_per_second=0, page_workers=4)
+        tracklist = tracklist_from_url(client, "https://open.spotify.com/playlist/bench250", "keep")
+        tracks = list(tracklist.tracks)
+    finally:
+        server.stop()
+
+    assert (tracklist.name, tracklist.total, tracklist.kind) == ("Bench 250", 250, "playlist")
+    assert [t.title for t in tracks] == [f"Track {i:05d}" for i in range(250)]
+    assert [t.track_number for t in tracks[:3]] == [1, 2, 3]
+    assert all(t.genre for t in tracks)
@@ -0,0 +1,140 @@
+import os
+import sys
+
+import pytest
+
+from spotify2media.sync import REMOVED_DIR, apply_renames, load_manifest, plan_sync, prune_files, sync_tracks_to_media
+from spotify2media.tracks import Track
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "benchmarks"))
+from fake_services import fake_ydl_factory, synthetic_track  # noqa: E402
+
+
+def track(spotify_id, title=None):
+    return Track(title=title or f"Song {spotify_id}", artists=["A"], spotify_id=spotify_id)
+
+def write(folder, name, content=None):
+    with open(os.path.join(folder, name), "w", encoding="utf-8") as f:
+        f.write(content if content is not None else name)
+
+def read(folder, name):
+    with open(os.path.join(folder, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def test_plan_sync_new_moved_and_removed(tmp_path):
+    for name in ("001 - Song a.mp3", "002 - Song b.mp3", "003 - Song c.mp3"):
+        write(tmp_path, name)
+    manifest = {"tracks": {
+        "a": {"file": "001 - Song a.mp3"},
+        "b": {"file": "002 - Song b.mp3"},
+        "c": {"file": "003 - Song c.mp3"},
+    }}
+    tracks = [track("b"), track("a"), track("d")]
+
+    added, renames, removed = plan_sync(manifest, tracks, str(tmp_path))
+
+    assert added == ["d"]
+    assert [(sid, old, new) for sid, old, new, _ in renames] == [
+        ("b", "002 - Song b.mp3", "001 - Song b.mp3"),
+        ("a", "001 - Song a.mp3", "002 - Song a.mp3"),
+    ]
+    assert removed == [("c", "003 - Song c.mp3")]
+
+def test_plan_sync_missing_file_is_downloaded_again(tmp_path):
+    manifest = {"tracks": {"a": {"file": "001 - Song a.mp3"}}}
+    added, renames, removed = plan_sync(manifest, [track("a")], str(tmp_path))
+    assert (added, renames, removed) == (["a"], [], [])
+
+def test_plan_sync_duplicate_positions_use_the_first(tmp_path):
+    write(tmp_path, "002 - Song a.mp3")
+    manifest = {"tracks": {"a": {"file": "002 - Song a.mp3"}}}
+    tracks = [track("x"), track("a"), track("a"), track("x")]
+
+    added, renames, removed = plan_sync(manifest, tracks, str(tmp_path))
+
+    assert added == ["x"]
+    assert renames == []
+    assert removed == []
+
+def test_plan_sync_without_numbering(tmp_path):
+    write(tmp_path, "Song a.mp3")
+    manifest = {"tracks": {"a": {"file": "Song a.mp3"}}}
+    added, renames, removed = plan_sync(manifest, [track("b"), track("a")], str(tmp_path), numbered_tracks=False)
+    assert (added, renames, removed) == (["b"], [], [])
+
+def test_apply_renames_swap(tmp_path):
+    write(tmp_path, "001 - A.mp3", "A")
+    write(tmp_path, "002 - B.mp3", "B")
+
+    apply_renames(str(tmp_path), [
+        ("a", "001 - A.mp3", "002 - A.mp3", track("a", "A")),
+        ("b", "002 - B.mp3", "001 - B.mp3", track("b", "B")),
+    ])
+
+    assert sorted(os.listdir(tmp_path)) == ["001 - B.mp3", "002 - A.mp3"]
+    assert read(tmp_path, "001 - B.mp3") == "B"
+    assert read(tmp_path, "002 - A.mp3") == "A"
+
+def test_apply_renames_cycle_onto_taken_names(tmp_path):
+    # without numbering a rename can land exactly on the name another file is leaving
+    for name in ("x.mp3", "y.mp3", "z.mp3"):
+        write(tmp_path, name)
+
+    apply_renames(str(tmp_path), [
+        ("x", "x.mp3", "y.mp3", track("x")),
+        ("y", "y.mp3", "z.mp3", track("y")),
+        ("z", "z.mp3", "x.mp3", track("z")),
+    ])
+
+    assert sorted(os.listdir(tmp_path)) == ["x.mp3", "y.mp3", "z.mp3"]
+    assert [read(tmp_path, n) for n in ("x.mp3", "y.mp3", "z.mp3")] == ["z.mp3", "x.mp3", "y.mp3"]
+
+@pytest.mark.parametrize("mode, left, moved", [
+    ("keep", ["001 - Gone.mp3", "002 - Stays.mp3"], None),
+    ("delete", ["002 - Stays.mp3"], None),
+    ("move", ["002 - Stays.mp3", REMOVED_DIR], ["001 - Gone.mp3"]),
+])
+def test_prune_files(tmp_path, mode, left, moved):
+    write(tmp_path, "001 - Gone.mp3")
+    write(tmp_path, "002 - Stays.mp3")
+
+    # a manifest entry whose file is already gone is skipped
+    prune_files(str(tmp_path), [("g", "001 - Gone.mp3"), ("h", "003 - Missing.mp3")], mode)
+
+    assert sorted(os.listdir(tmp_path)) == left
+    if moved:
+        assert sorted(os.listdir(tmp_path / REMOVED_DIR)) == moved
+
+
+def fake_track(i):
+    # a track the fake YouTube search finds
+    t = synthetic_track(i)
+    return Track(title=t["title"], artists=[t["artist"]], duration_ms=t["duration_s"] * 1000, spotify_id=f"s{i}")
+
+def sync(tracks, output_path):
+    ydl = fake_ydl_factory(search_latency=0, download_latency=0)
+    return sync_tracks_to_media(tracks, str(output_path), "P", ydl_factory=ydl)
+
+def test_sync_places_a_track_listed_twice_once(tmp_path, capsys):
+    tracks = [fake_track(1), fake_track(2), fake_track(1), Track(title="Local file")]
+    manifest = sync(tracks, tmp_path)
+
+    # the second position of s1 gets no file of its own, the manifest couldn't record it
+    assert sorted(n for n in os.listdir(tmp_path / "P") if n.endswith(".mp3")) == \
+        ["001 - Track 00001.mp3", "002 - Track 00002.mp3"]
+    assert manifest["tracks"] == {
+        "s1": {"file": "001 - Track 00001.mp3", "position": 1},
+        "s2": {"file": "002 - Track 00002.mp3", "position": 2},
+    }
+    assert load_manifest(str(tmp_path / "P"))["tracks"] == manifest["tracks"]
+    assert "Sync: 2 new, 0 moved, 0 removed, 0 unchanged" in capsys.readouterr().out
+
+def test_sync_counts_unchanged_tracks_once(tmp_path, capsys):
+    tracks = [fake_track(1), fake_track(2), fake_track(1), Track(title="Local file")]
+    sync(tracks, tmp_path)
+    capsys.readouterr()
+
+    sync(tracks + [fake_track(3)], tmp_path)
+    assert "Sync: 1 new, 0 moved, 0 removed, 2 unchanged" in capsys.readouterr().out
+    assert "005 - Track 00003.mp3" in os.listdir(tmp_path / "P")
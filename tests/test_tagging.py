@@ -0,0 +1,119 @@
+import os
+import struct
+import sys
+
+import pytest
+from mutagen.flac import FLAC
+from mutagen.id3 import ID3
+from mutagen.mp4 import MP4
+from mutagen.wave import WAVE
+
+from spotify2media import tagging
+from spotify2media.tagging import read_spotify_id, write_tags
+from spotify2media.tracks import Track
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "benchmarks"))
+from fake_services import silent_mp3, silent_wav  # noqa: E402
+
+COVER = b"\xff\xd8\xff\xe0 not really a jpeg"
+
+
+def atom(name: bytes, payload: bytes = b"") -> bytes:
+    return struct.pack(">I4s", 8 + len(payload), name) + payload
+
+def empty_m4a() -> bytes:
+    # ftyp, a moov holding only the movie header (1000 units/s, 5s) and an empty mdat
+    mvhd = struct.pack(">5I", 0, 0, 0, 1000, 5000) + struct.pack(">IH", 0x10000, 0x100) + b"\x00" * 70
+    mvhd += struct.pack(">I", 2)
+    return atom(b"ftyp", b"M4A \x00\x00\x00\x00M4A mp42isom") + atom(b"moov", atom(b"mvhd", mvhd)) + atom(b"mdat")
+
+def empty_flac() -> bytes:
+    # just the STREAMINFO block: 4096-sample blocks, 44.1 kHz, 2 channels, 16 bits, no samples
+    info = struct.pack(">HH", 4096, 4096) + b"\x00" * 6
+    info += ((44100 << 44) | (1 << 41) | (15 << 36)).to_bytes(8, "big") + b"\x00" * 16
+    return b"fLaC" + b"\x80" + len(info).to_bytes(3, "big") + info
+
+def read_tags(path: str) -> dict:
+    # the written tags in one shape for every container
+    ext = os.path.splitext(path)[1]
+    if ext in (".mp3", ".wav"):
+        tags = ID3(path) if ext == ".mp3" else WAVE(path).tags
+        # ID3v2.3 keeps several artists in one "/" separated string
+        return {
+            "title": tags["TIT2"].text, "artists": tags["TPE1"].text[0].split("/"), "album": tags["TALB"].text,
+            "album_artists": tags["TPE2"].text[0].split("/"), "track": tags["TRCK"].text[0], "disc": tags["TPOS"].text[0],
+            "year": str(tags["TDRC"].text[0]), "genre": tags["TCON"].text, "comment": tags["COMM:Comment:eng"].text,
+            "cover": tags.getall("APIC")[0].data,
+        }
+    if ext == ".m4a":
+        tags = MP4(path).tags
+        return {
+            "title": tags["\xa9nam"], "artists": tags["\xa9ART"], "album": tags["\xa9alb"],
+            "album_artists": tags["aART"], "track": str(tags["trkn"][0][0]), "disc": str(tags["disk"][0][0]),
+            "year": tags["\xa9day"][0][:4], "genre": tags["\xa9gen"], "comment": tags["\xa9cmt"],
+            "cover": bytes(tags["covr"][0]),
+        }
+    audio = FLAC(path)
+    return {
+        "title": audio["title"], "artists": audio["artist"], "album": audio["album"],
+        "album_artists": audio["albumartist"], "track": audio["tracknumber"][0], "disc": audio["discnumber"][0],
+        "year": audio["date"][0][:4], "genre": audio["genre"], "comment": audio["comment"],
+        "cover": audio.pictures[0].data,
+    }
+
+TRACK = Track(
+    title="Song", artists=["Artist", "Guest"], album="Album", album_artists=["Artist"],
+    release_date="2001-02-03", track_number=3, disc_number=1, genre="rock",
+    youtube_url="https://www.youtube.com/watch?v=abc", spotify_id="4uLU6hMCjMI75M1A2tKUQC",
+)
+EXPECTED = {
+    "title": ["Song"], "artists": ["Artist", "Guest"], "album": ["Album"], "album_artists": ["Artist"],
+    "track": "3", "disc": "1", "year": "2001", "genre": ["rock"],
+    "comment": ["https://www.youtube.com/watch?v=abc"], "cover": COVER,
+}
+
+CONTAINERS = [
+    (".mp3", lambda: silent_mp3(1), tagging.MP3),
+    (".wav", lambda: silent_wav(1), tagging.WAVE),
+    (".m4a", empty_m4a, tagging.MP4),
+    (".flac", empty_flac, tagging.FLAC),
+]
+
+
+@pytest.mark.parametrize("ext, audio, container", CONTAINERS, ids=[c[0] for c in CONTAINERS])
+def test_write_tags_round_trip(tmp_path, monkeypatch, ext, audio, container):
+    path = str(tmp_path / f"song{ext}")
+    with open(path, "wb") as f:
+        f.write(audio())
+    assert read_spotify_id(path) == ""
+
+    saves = []
+    save = container.save
+    monkeypatch.setattr(container, "save", lambda self, *args, **kwargs: saves.append(1) or save(self, *args, **kwargs))
+    write_tags(path, TRACK, cover_jpeg=COVER)
+
+    # the whole tag set, cover included, goes to disk in one save
+    assert len(saves) == 1
+    assert read_spotify_id(path) == "4uLU6hMCjMI75M1A2tKUQC"
+    assert read_tags(path) == EXPECTED
+    if ext == ".m4a":
+        # native atoms, no ID3 header in front of the container
+        with open(path, "rb") as f:
+            assert f.read(3) != b"ID3"
+
+@pytest.mark.parametrize("ext, audio, container", CONTAINERS, ids=[c[0] for c in CONTAINERS])
+def test_retagging_keeps_the_cover(tmp_path, ext, audio, container):
+    path = str(tmp_path / f"song{ext}")
+    with open(path, "wb") as f:
+        f.write(audio())
+    write_tags(path, TRACK, cover_jpeg=COVER)
+    write_tags(path, Track(title="Renamed", spotify_id="other"))
+    assert read_spotify_id(path) == "other"
+    assert read_tags(path)["cover"] == COVER
+
+def test_unsupported_format(tmp_path):
+    path = str(tmp_path / "song.ogg")
+    open(path, "wb").close()
+    with pytest.raises(ValueError):
+        write_tags(path, TRACK)
+    assert read_spotify_id(path) == ""
@@ -0,0 +1,92 @@
+import os
+import sys
+
+import pytest
+
+from spotify2media.cache import CacheStore, MatchIndex
+from spotify2media.tracks import Track, Tracklist
+from spotify2media.youtube_handler import OutputTarget, convert_tracklists_to_media
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "benchmarks"))
+from fake_services import fake_ydl_factory  # noqa: E402
+
+
+def same_song(count):
+    # one song under several spotify ids (a single and an album cut): same search, same video
+    return [Track(title="Track 1", artists=["X"], duration_ms=200000, spotify_id=f"s{i}") for i in range(count)]
+
+def counting_searches(factory):
+    # the fake YoutubeDL, with the queries it was asked to search kept in .searches
+    searches = []
+
+    class Counting(factory):
+        def extract_info(self, url, download=False, extra_info=None):
+            if url.startswith("ytsearch"):
+                searches.append(url)
+            return super().extract_info(url, download=download, extra_info=extra_info)
+
+    Counting.searches = searches
+    return Counting
+
+@pytest.fixture
+def match_index(tmp_path):
+    store = CacheStore(str(tmp_path / "cache.sqlite"))
+    yield MatchIndex(store)
+    store.close()
+
+
+def test_tracks_matched_to_one_video_download_to_separate_staging_files(tmp_path, capsys):
+    downloaded, not_found = convert_tracklists_to_media(
+        [Tracklist("P", [], "", same_song(8))], str(tmp_path), jobs=4,
+        ydl_factory=fake_ydl_factory(search_latency=0, download_latency=0.05, bandwidth=2e6),
+    )[0]
+
+    assert (len(downloaded), not_found) == (8, [])
+    # concurrent downloads of one video never step on each other's .part file
+    assert "local_io" not in capsys.readouterr().out
+    assert not os.path.exists(tmp_path / ".staging")
+
+def test_downloads_remember_their_match(tmp_path, match_index):
+    ydl = counting_searches(fake_ydl_factory(search_latency=0, download_latency=0))
+    convert_tracklists_to_media([Tracklist("P", [], "", same_song(1))], str(tmp_path / "out"),
+                                ydl_factory=ydl, match_index=match_index)
+    assert len(ydl.searches) == 1
+    assert match_index.get("s0")["video_url"].startswith("https://www.youtube.com/watch?v=")
+
+def test_remembered_match_skips_the_search(tmp_path, match_index):
+    match_index.set("s0", "https://www.youtube.com/watch?v=remembered", title="Remembered", duration=200)
+    ydl = counting_searches(fake_ydl_factory(search_latency=0, download_latency=0))
+    downloaded, _ = convert_tracklists_to_media([Tracklist("P", [], "", same_song(1))], str(tmp_path / "out"),
+                                                ydl_factory=ydl, match_index=match_index)[0]
+    assert len(downloaded) == 1
+    assert ydl.searches == []
+    assert match_index.get("s0")["video_url"] == "https://www.youtube.com/watch?v=remembered"
+
+def test_refresh_matches_searches_again(tmp_path, match_index):
+    match_index.set("s0", "https://www.youtube.com/watch?v=remembered", title="Remembered", duration=200)
+    ydl = counting_searches(fake_ydl_factory(search_latency=0, download_latency=0))
+    downloaded, _ = convert_tracklists_to_media([Tracklist("P", [], "", same_song(1))], str(tmp_path / "out"),
+                                                ydl_factory=ydl, match_index=match_index,
+                                                refresh_matches=True)[0]
+    assert len(downloaded) == 1
+    assert len(ydl.searches) == 1
+    # the new match replaces the remembered one
+    assert match_index.get("s0")["video_url"] != "https://www.youtube.com/watch?v=remembered"
+
+def test_streamed_total_is_corrected_when_the_stream_ends(tmp_path, capsys):
+    # the header counts 5 items, two of them local files the stream skips
+    downloaded, _ = convert_tracklists_to_media(
+        [Tracklist("P", [], "", iter(same_song(3)), total=5)], str(tmp_path),
+        ydl_factory=fake_ydl_factory(search_latency=0, download_latency=0),
+    )[0]
+
+    assert len(downloaded) == 3
+    progress = [line for line in capsys.readouterr().out.splitlines() if line.startswith("Progress:")]
+    assert progress[-1].startswith("Progress: 3/3 |")
+
+def test_total_label(tmp_path):
+    target = OutputTarget("P", str(tmp_path), total=5, estimated=True)
+    assert target.total_label() == "~5"
+    target.total, target.estimated = 3, False
+    assert target.total_label() == "3"
+    assert OutputTarget("Q", str(tmp_path)).total_label() == "?"